@@ -1,5 +1,4 @@
 from setuptools import setup
-from setuptools import find_packages
 
 setup(name='VisualNN',
       version='1.0',
@@ -9,7 +8,10 @@ setup(name='VisualNN',
       download_url='https://github.com/VedangW/VisualNN',
       license='MIT',
       install_requires=['numpy',
-                        'keras',
+                        'h5py',
                         'plotly'
                        ],
-      packages=find_packages())
+      extras_require={'keras': ['keras'], 'images': ['matplotlib'],
+                      'torch': ['torch']},
+      packages=['visualnn'],
+      entry_points={'console_scripts': ['visualnn=visualnn.cli:main']})
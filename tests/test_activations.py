@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from visualnn.activations import (ActivationReducer, get_colors,
+                                  reduce_activations)
+
+
+def test_streamed_reduction_matches_full_arrays():
+    rng = np.random.default_rng(0)
+    inputs = rng.normal(size=(100, 4))
+    kernel = rng.normal(size=(4, 3))
+
+    def probe(batch):
+        return [batch, batch.dot(kernel)]
+
+    for reduce in ('mean', 'max'):
+        values = reduce_activations(probe, inputs, 2, reduce=reduce,
+                                    batch_size=7)
+        full = getattr(np, reduce)
+        np.testing.assert_allclose(values[0], full(inputs, axis=0))
+        np.testing.assert_allclose(values[1],
+                                   full(inputs.dot(kernel), axis=0))
+
+
+def test_reducer_per_channel():
+    reducer = ActivationReducer('max')
+    reducer.update(np.arange(24).reshape(2, 2, 2, 3))
+
+    np.testing.assert_array_equal(reducer.result(), [21, 22, 23])
+    assert ActivationReducer().result() is None
+
+
+def test_colors_are_quantized():
+    colors = get_colors(np.linspace(0, 1, 100), 0, 1, levels=4)
+    assert len(set(colors)) == 4
+
+
+def test_keras_activations():
+    keras = pytest.importorskip('keras')
+    from visualnn import keras_loader
+
+    model = keras.Sequential([keras.Input((4,)),
+                              keras.layers.Dense(3, activation='relu'),
+                              keras.layers.Dense(2)])
+    inputs = np.random.default_rng(0).normal(size=(50, 4)).astype('float32')
+
+    values = keras_loader.kerasActivations(model, inputs, batchSize=16)
+    layers, _ = keras_loader.loadFromKerasModel(model)
+
+    assert [len(v) for v in values] == [shape[-1] for _, shape in layers]
+    np.testing.assert_allclose(values[0], inputs.mean(axis=0), rtol=1e-5)
+    np.testing.assert_allclose(values[-1],
+                               model.predict(inputs, verbose=0).mean(axis=0),
+                               rtol=1e-4, atol=1e-6)
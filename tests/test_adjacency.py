@@ -0,0 +1,47 @@
+import base64
+
+import numpy as np
+
+from visualnn.adjacency import get_csr
+from visualnn.fc import MultiLayerPerceptron
+
+
+def test_csr():
+    offsets, neighbours = get_csr([2, 0, 2, 1], [5, 6, 7, 8], 4)
+
+    assert list(offsets) == [0, 1, 2, 4, 4]
+    assert list(neighbours) == [6, 8, 5, 7]
+
+
+def test_full_mlp_fans():
+    adjacency = MultiLayerPerceptron([3, 4, 2]).get_adjacency()
+
+    assert list(adjacency.fan_out(0, 1)) == [0, 1, 2, 3]
+    assert list(adjacency.fan_in(2, 1)) == [0, 1, 2, 3]
+    assert len(adjacency.fan_in(0, 0)) == 0
+    assert len(adjacency.fan_out(2, 0)) == 0
+
+
+def test_top_k_fans():
+    weights = [np.array([[1.0, 0.1], [0.1, -2.0]])]
+    model = MultiLayerPerceptron([2, 2], weights=weights)
+    adjacency = model.get_adjacency(top_k=2)
+
+    assert list(adjacency.fan_out(0, 0)) == [0]
+    assert list(adjacency.fan_out(0, 1)) == [1]
+    assert list(adjacency.fan_in(1, 1)) == [1]
+
+
+def test_index_is_little_endian_int32():
+    index = MultiLayerPerceptron([3, 4]).get_adjacency().to_dict()
+    offsets = np.frombuffer(base64.b64decode(index['out'][0][0]), '<i4')
+
+    assert list(offsets) == [0, 4, 8, 12]
+
+
+def test_highlight_html():
+    html = MultiLayerPerceptron([3, 4, 2]).to_html(include_plotlyjs=False,
+                                                   highlight=True)
+
+    assert 'plotly_hover' in html
+    assert 'INDEX' not in html
@@ -0,0 +1,80 @@
+import io
+import json
+
+import numpy as np
+import pytest
+
+from visualnn.backend import set_backend
+from visualnn.convnet import ConvNet2D
+from visualnn.dag import LayerGraph
+from visualnn.fc import Dense, MultiLayerPerceptron
+from visualnn.kernels import KernelMosaic
+
+
+def _models():
+    return [Dense(5),
+            MultiLayerPerceptron([3, 4, 2]),
+            ConvNet2D([(32, 32, 3), (28, 28, 6)], [10]),
+            LayerGraph([['InputLayer', (8,), 'input'],
+                        ['Dense', (4,), 'dense']], [(0, 1)]),
+            KernelMosaic(np.ones((3, 3, 2, 4)))]
+
+
+@pytest.mark.parametrize('model', _models(), ids=lambda model:
+                         type(model).__name__)
+def test_render_methods(model):
+    figure = model.to_figure()
+
+    assert len(json.loads(model.to_json())['data']) == len(figure['data'])
+    html = model.to_html(include_plotlyjs=False, full_html=False)
+    assert html.startswith('<div') and '<html>' not in html
+
+
+def test_webgl_figure():
+    model = ConvNet2D([(32, 32, 3), (28, 28, 6)], [10], render_mode='traces')
+    types = set(trace['type'] for trace in model.to_figure('webgl')['data'])
+
+    assert types == {'scattergl'}
+
+
+def test_dense_keeps_its_slots():
+    assert not hasattr(Dense(5), '__dict__')
+
+
+def test_set_backend_copies():
+    data = [{'x': [1], 'y': [2], 'hoveron': 'points'}]
+    gl = set_backend(data, 'webgl')
+
+    assert gl == [{'x': [1], 'y': [2], 'type': 'scattergl'}]
+    assert data[0] == {'x': [1], 'y': [2], 'hoveron': 'points'}
+
+
+def _marker_colors(values, **marker):
+    image = pytest.importorskip('matplotlib.image')
+    from visualnn.mpl_backend import figure_to_image
+
+    marker.update(color=values, size=40)
+    figure = {'data': [{'x': [0, 1], 'y': [0, 0], 'mode': 'markers',
+                        'marker': marker}],
+              'layout': {'xaxis': {'range': [-1, 2]},
+                         'yaxis': {'range': [-1, 1]}}}
+    png = figure_to_image(figure, width=300, height=100)
+    pixels = image.imread(io.BytesIO(png))[..., :3]
+    # Centers of the two markers
+    return pixels[50, 102], pixels[50, 198]
+
+
+def test_image_markers_use_the_colorscale():
+    low, high = _marker_colors([0, 1], colorscale='RdBu', cmin=0, cmax=1)
+
+    # plotly.js draws RdBu from blue to red
+    assert low[2] > 2*low[0]
+    assert high[0] > 2*high[2]
+
+
+def test_image_markers_use_cmin_cmax():
+    # Near the middle of [0, 10], so both are pale
+    colors = _marker_colors([5, 6], colorscale='RdBu', cmin=0, cmax=10)
+
+    for color in colors:
+        assert color.min() > 0.7
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from visualnn import cache
+from visualnn.cache import FigureCache, figure_key
+from visualnn.fc import MultiLayerPerceptron
+
+
+def test_key_is_canonical():
+    assert figure_key('MLP', sizes=[3, 4], color='blue') == \
+        figure_key('MLP', color='blue', sizes=(np.int64(3), 4))
+    assert figure_key('MLP', sizes=[3, 4]) != figure_key('MLP', sizes=[4, 3])
+
+
+def test_key_changes_with_version(monkeypatch):
+    key = figure_key('MLP', sizes=[3, 4])
+    monkeypatch.setattr(cache, 'FIGURE_VERSION', cache.FIGURE_VERSION + 1)
+
+    assert figure_key('MLP', sizes=[3, 4]) != key
+
+
+def test_lru_eviction():
+    figures = FigureCache(maxsize=2)
+    for key in 'abc':
+        figures.put(key, {'data': [], 'layout': {'title': key}})
+    figures.get('b')
+
+    assert 'a' not in figures
+    assert figures.stats()['evictions'] == 1
+    figures.put('d', {'data': [], 'layout': {}})
+    assert 'c' not in figures and 'b' in figures
+
+
+def test_disk_tier_is_shared(tmp_path):
+    figure = {'data': [{'x': [1, 2], 'y': [3, 4]}], 'layout': {}}
+    FigureCache(cache_dir=str(tmp_path)).put('key', figure)
+
+    other = FigureCache(cache_dir=str(tmp_path))
+    assert other.get('key') == figure
+    assert other.stats()['disk_hits'] == 1
+
+
+def test_model_figures_are_cached():
+    figures = FigureCache()
+    first = MultiLayerPerceptron([3, 4, 2], cache=figures).to_figure()
+    second = MultiLayerPerceptron([3, 4, 2], cache=figures).to_figure()
+
+    assert second is first
+    assert figures.stats()['hits'] == 1
+
+
+def test_warm_cache_checks_the_filter():
+    figures = FigureCache()
+    model = MultiLayerPerceptron([3, 4, 2], cache=figures)
+    model.to_figure()
+
+    # Edge filters need weights, and top_k must be positive
+    with pytest.raises(ValueError):
+        model.to_figure(top_k=2)
+    with pytest.raises(ValueError):
+        model.to_figure(threshold=0.5)
+    with pytest.raises(ValueError):
+        model.to_figure(top_k=0)
+    assert figures.stats()['hits'] == 0
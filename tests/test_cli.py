@@ -0,0 +1,45 @@
+import os
+
+from visualnn.cli import find_collisions, find_models, input_root, output_path
+
+
+def _touch(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, 'w').close()
+
+
+def test_input_root():
+    assert input_root(os.path.join('models', '**', '*.h5')) == 'models'
+    assert input_root(os.path.join('models', 'm.h5')) == 'models'
+    assert input_root('*.h5') == os.curdir
+
+
+def test_outputs_keep_subdirectories(tmp_path):
+    root = str(tmp_path / 'models')
+    for name in ('a', 'b'):
+        _touch(os.path.join(root, name, 'm.h5'))
+    out = str(tmp_path / 'out')
+
+    paths = find_models([os.path.join(root, '**')])
+    outputs = [(path, output_path(path, 'html', out, path_root))
+               for path, path_root in paths]
+
+    assert sorted(os.path.relpath(o, out) for _, o in outputs) == \
+        [os.path.join('a', 'm.h5.html'), os.path.join('b', 'm.h5.html')]
+    assert find_collisions(outputs) == {}
+
+
+def test_same_output_is_a_collision(tmp_path):
+    paths = [str(tmp_path / name / 'm.h5') for name in ('a', 'b')]
+    for path in paths:
+        _touch(path)
+
+    outputs = [(path, output_path(path, 'html', str(tmp_path), root))
+               for path, root in find_models(paths)]
+
+    assert list(find_collisions(outputs).values()) == [paths]
+
+
+def test_output_next_to_model():
+    path = os.path.join('models', 'm.h5')
+    assert output_path(path, 'json') == path + '.json'
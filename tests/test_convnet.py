@@ -0,0 +1,86 @@
+import io
+
+import numpy as np
+import pytest
+
+from visualnn.convnet import (ConvNet2D, Conv2DLeNetStyle,
+                              channel_depth, shapes_to_traces)
+
+LAYERS_CONV = [(32, 32, 3), (28, 28, 16), (14, 14, 16)]
+LAYERS_DENSE = [120, 10]
+WIDE_CONV = [(32, 32, 64), (28, 28, 2048), (14, 14, 512)]
+
+
+def _render(render_mode):
+    image = pytest.importorskip('matplotlib.image')
+    from visualnn.mpl_backend import figure_to_image
+
+    figure = ConvNet2D(LAYERS_CONV, LAYERS_DENSE,
+                       render_mode=render_mode).to_figure()
+    png = figure_to_image(figure, format='png')
+    return image.imread(io.BytesIO(png))[..., :3]
+
+
+def test_covered_channels_keep_their_visible_part():
+    shapes = [{'type': 'rect', 'x0': 0, 'y0': 0, 'x1': 4, 'y1': 4,
+               'line': {'color': 'red', 'width': 1}, 'fillcolor': 'red'},
+              {'type': 'rect', 'x0': 1, 'y0': -1, 'x1': 5, 'y1': 3,
+               'line': {'color': 'blue', 'width': 1}, 'fillcolor': 'blue'}]
+    back, front = shapes_to_traces(shapes)
+
+    # L shape: six corners, closed, then a gap
+    assert len(back['x']) == 8
+    assert list(back['x'][:6]) == [0, 1, 1, 4, 4, 0]
+    assert list(back['y'][:6]) == [0, 0, 3, 3, 4, 4]
+    assert len(front['x']) == 6
+
+
+def test_traces_render_like_shapes():
+    shapes, traces = _render('shapes'), _render('traces')
+    drawn = (shapes < 0.9).any(axis=2) | (traces < 0.9).any(axis=2)
+    differ = np.abs(shapes - traces).max(axis=2) > 0.25
+
+    # The shapes are drawn with some transparency, the batched
+    # traces hide the covered parts completely
+    assert differ[drawn].mean() < 0.1
+
+
+def test_channel_depth():
+    assert channel_depth(64) == 64
+    assert channel_depth(16, 16) == 16
+    assert channel_depth(64, 16) == pytest.approx(16*(1 + np.log(4)))
+    # Log growth: 32x more channels adds far less than 32x depth
+    assert channel_depth(2048, 16) < 5*channel_depth(64, 16)
+
+
+@pytest.mark.parametrize('n_channels', [3, 16, 64, 2048])
+def test_drawn_channels_are_capped(n_channels):
+    layer = Conv2DLeNetStyle(150, 100, layer_shape=(14, 28),
+                             n_channels=n_channels, max_drawn_channels=16)
+    # One rect per drawn channel plus the highlighted window
+    assert len(layer.layer_shapes()) - 1 == min(n_channels, 16)
+    assert layer.layer_data()[0]['text'] == [
+        str(n_channels) + '@28x28']
+
+
+def test_shapes_fit_the_axis_ranges():
+    figures = [ConvNet2D(LAYERS_CONV, LAYERS_DENSE).to_figure(),
+               ConvNet2D(WIDE_CONV, LAYERS_DENSE,
+                         max_drawn_channels=16).to_figure()]
+    for figure in figures:
+        layout = figure['layout']
+        x_min, x_max = layout['xaxis']['range']
+        y_min, y_max = layout['yaxis']['range']
+        for shape in layout['shapes']:
+            for key in ('x0', 'x1'):
+                assert x_min <= shape[key] <= x_max
+            for key in ('y0', 'y1'):
+                assert y_min <= shape[key] <= y_max
+        for trace in figure['data']:
+            if trace.get('mode') == 'text':
+                assert x_min <= trace['x'][0] <= x_max
+                assert y_min <= trace['y'][0] <= y_max
+
+    labels = [trace['text'][0] for trace in figures[1]['data']
+              if trace.get('mode') == 'text']
+    assert '2048@28x28' in labels
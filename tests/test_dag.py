@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from visualnn import keras_loader
+from visualnn.dag import (LayerGraph, add_dummy_nodes, count_crossings,
+                          layer_ranks, layout_graph, order_nodes,
+                          topological_order)
+
+# Two branches from one input, merged by an Add
+RESIDUAL_NODES = [['InputLayer', (8,), 'input'],
+                  ['Dense', (8,), 'dense_1'],
+                  ['Dense', (8,), 'dense_2'],
+                  ['Add', (8,), 'add'],
+                  ['Dense', (3,), 'output']]
+RESIDUAL_EDGES = [(0, 1), (1, 2), (0, 3), (2, 3), (3, 4)]
+
+
+def test_topological_order():
+    assert topological_order(4, [(2, 0), (0, 1), (3, 1)]) == [2, 0, 3, 1]
+    with pytest.raises(ValueError, match='cycle'):
+        topological_order(2, [(0, 1), (1, 0)])
+
+
+def test_ranks_and_dummy_nodes():
+    ranks = layer_ranks(5, RESIDUAL_EDGES)
+    assert list(ranks) == [0, 1, 2, 3, 4]
+
+    # The skip connection 0 -> 3 crosses two ranks
+    ranks, edges, routes = add_dummy_nodes(ranks, RESIDUAL_EDGES)
+    assert list(ranks) == [0, 1, 2, 3, 4, 1, 2]
+    assert routes[2] == [0, 5, 6, 3]
+    assert all(ranks[v] == ranks[u] + 1 for u, v in edges)
+
+
+def test_crossings_are_removed():
+    # Rank 1 starts in the order that crosses the edges
+    ranks = np.array([0, 0, 1, 1])
+    edges = [(0, 3), (1, 2)]
+    positions = np.array([0., 1., 0., 1.])
+    assert count_crossings(ranks, positions, edges) == 1
+
+    assert count_crossings(ranks, order_nodes(ranks, edges), edges) == 0
+
+
+def test_layout_goes_left_to_right():
+    x, y, routes = layout_graph(5, RESIDUAL_EDGES, x_step=100)
+    for u, v in RESIDUAL_EDGES:
+        assert x[u] < x[v]
+    assert len(routes) == len(RESIDUAL_EDGES)
+
+
+@pytest.mark.parametrize('render_mode', ['shapes', 'traces'])
+def test_graph_figure(render_mode):
+    graph = LayerGraph(RESIDUAL_NODES, RESIDUAL_EDGES,
+                       render_mode=render_mode)
+    figure = graph.to_figure()
+    text = ' '.join(' '.join(map(str, trace.get('text') or ()))
+                    for trace in figure['data'])
+
+    for layer_class, _, _ in RESIDUAL_NODES:
+        assert layer_class + '<br>' in text
+    if render_mode == 'shapes':
+        assert figure['layout']['shapes']
+
+
+def test_graph_from_config():
+    config = {'class_name': 'Model', 'config': {'layers': [
+        {'class_name': 'InputLayer', 'name': 'input',
+         'config': {'name': 'input', 'batch_input_shape': [None, 8]},
+         'inbound_nodes': []},
+        {'class_name': 'Dense', 'name': 'dense',
+         'config': {'name': 'dense', 'units': 8},
+         'inbound_nodes': [[['input', 0, 0, {}]]]},
+        {'class_name': 'Add', 'name': 'add', 'config': {'name': 'add'},
+         'inbound_nodes': [[['input', 0, 0, {}], ['dense', 0, 0, {}]]]},
+    ]}}
+
+    graph = keras_loader.graphToVnn(*keras_loader.loadGraphFromConfig(config))
+    assert isinstance(graph, LayerGraph)
+    assert graph.to_figure()['data']
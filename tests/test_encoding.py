@@ -0,0 +1,38 @@
+import json
+
+import numpy as np
+
+from visualnn.backend import figure_to_json
+from visualnn.encoding import encode_array, encode_figure, layout_steps
+from visualnn.fc import MultiLayerPerceptron
+
+
+def _dtypes(figure):
+    return [(trace['x']['dtype'], trace['y']['dtype'])
+            for trace in figure['data']]
+
+
+def test_whole_numbers_stay_int16_when_quantized():
+    assert encode_array([0, 1, 2, 3], step=5/4096)['dtype'] == 'i2'
+    assert encode_array([0.5, 1.25], step=0.25)['dtype'] == 'f4'
+
+
+def test_steps_are_powers_of_two():
+    steps = layout_steps({'xaxis': {'range': [0, 5]},
+                          'yaxis': {'range': [0, 401]}})
+    for step in steps.values():
+        assert np.log2(step) == np.floor(np.log2(step))
+    assert steps['x'] <= 5/4096
+
+
+def test_quantized_mlp_figure_is_not_larger():
+    figure = MultiLayerPerceptron([100, 200, 200, 10]).to_figure()
+    quantized = encode_figure(figure)
+    exact = encode_figure(figure, quantize=False)
+
+    assert _dtypes(quantized) == _dtypes(exact)
+    assert sum(dtypes == ('i2', 'i2') for dtypes in _dtypes(quantized)) == 8
+    assert len(json.dumps(quantized['data'])) <= \
+        len(json.dumps(exact['data']))
+    assert len(figure_to_json(figure, binary=True)) < \
+        len(figure_to_json(figure))
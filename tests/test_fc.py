@@ -0,0 +1,192 @@
+import base64
+import io
+import json
+
+import numpy as np
+import pytest
+
+from visualnn.fc import (Dense, MultiLayerPerceptron, connect, get_band,
+                         get_line, select_edges)
+
+
+def test_select_edges_top_k():
+    weights = np.array([[0.1, -3.0], [2.0, 0.5]])
+    src, dst, w = select_edges(weights, top_k=2)
+
+    assert list(zip(src, dst)) == [(0, 1), (1, 0)]
+    assert list(w) == [-3.0, 2.0]
+
+
+def test_select_edges_threshold():
+    weights = np.array([[0.1, -3.0], [2.0, 0.5]])
+    _, _, w = select_edges(weights, threshold=0.5)
+
+    assert sorted(w) == [-3.0, 0.5, 2.0]
+
+
+@pytest.mark.parametrize('top_k', [0, -1])
+def test_top_k_must_be_positive(top_k):
+    with pytest.raises(ValueError, match='top_k must be at least 1'):
+        select_edges(np.ones((3, 4)), top_k=top_k)
+
+    weights = [np.ones((3, 4)), np.ones((4, 2))]
+    model = MultiLayerPerceptron([3, 4, 2], weights=weights)
+    with pytest.raises(ValueError, match='top_k must be at least 1'):
+        model.to_figure(top_k=top_k)
+
+
+def test_max_neurons_must_be_positive():
+    with pytest.raises(ValueError, match='max_neurons must be at least 1'):
+        Dense(10, max_neurons=0)
+
+
+def _values(value):
+    """ Coordinates as floats, whether written as a list or as
+        a typed array. """
+    if isinstance(value, dict):
+        value = np.frombuffer(base64.b64decode(value['bdata']),
+                              dtype=np.dtype(value['dtype']).newbyteorder('<'))
+    return np.array([np.nan if v is None else v for v in value], dtype=float)
+
+
+def _parsed_data(text):
+    return [(_values(trace['x']), _values(trace['y']))
+            for trace in json.loads(text)['data']]
+
+
+def _assert_same_data(data, expected):
+    assert len(data) == len(expected)
+    for (x, y), (ex, ey) in zip(data, expected):
+        np.testing.assert_array_equal(x, ex)
+        np.testing.assert_array_equal(y, ey)
+
+
+@pytest.mark.parametrize('binary', [False, True])
+def test_streamed_json_matches_figure(binary):
+    model = MultiLayerPerceptron([4, 6, 3])
+    stream = io.StringIO()
+    model.write_json(stream, binary=binary)
+
+    _assert_same_data(_parsed_data(stream.getvalue()),
+                      _parsed_data(model.to_json(binary=binary)))
+
+
+def test_streamed_html(tmp_path):
+    path = str(tmp_path / 'mlp.html')
+    MultiLayerPerceptron([4, 6, 3]).write_html(path, include_plotlyjs=False)
+
+    with open(path) as f:
+        assert 'Plotly.newPlot' in f.read()
+
+
+def _edge_traces(data):
+    return [trace for trace in data
+            if trace['mode'] == 'lines' and 'fill' not in trace]
+
+
+def test_batched_edges_match_get_line():
+    figure = MultiLayerPerceptron([3, 4, 2]).to_figure()
+    # Outer circle of the neurons of each layer
+    neurons = [(_values(trace['x']), _values(trace['y']))
+               for trace in figure['data']
+               if trace['mode'] == 'markers' and trace['marker']['size'] == 30]
+    edges = _edge_traces(figure['data'])
+    assert len(edges) == len(neurons) - 1 == 2
+
+    for trace, (x_curr, y_curr), (x_next, y_next) in zip(edges, neurons,
+                                                          neurons[1:]):
+        x = _values(trace['x']).reshape(-1, 3)
+        y = _values(trace['y']).reshape(-1, 3)
+        assert len(x) == len(y_curr)*len(y_next)
+
+        # One NaN after each segment, none inside
+        assert np.isnan(x[:, 2]).all() and np.isnan(y[:, 2]).all()
+        assert not np.isnan(x[:, :2]).any() and not np.isnan(y[:, :2]).any()
+
+        expected_x, expected_y = list(), list()
+        for p1 in zip(x_curr, y_curr):
+            for p2 in zip(x_next, y_next):
+                ends = np.array([p1[0], p2[0]])
+                expected_x.append(ends)
+                expected_y.append(get_line(ends, p1, p2))
+        np.testing.assert_allclose(x[:, :2], expected_x)
+        np.testing.assert_allclose(y[:, :2], expected_y)
+
+
+def test_trace_count_does_not_grow_with_edges():
+    small = MultiLayerPerceptron([3, 4, 2]).to_figure()
+    large = MultiLayerPerceptron([30, 400, 20]).to_figure()
+
+    assert len(large['data']) == len(small['data'])
+    assert len(_edge_traces(large['data'])) == 2
+    assert len(_edge_traces(small['data'])) == 2
+
+
+
+def _band_traces(data):
+    return [trace for trace in data if trace.get('fill') == 'toself']
+
+
+@pytest.mark.parametrize('max_neurons, slots', [(4, [0, 1, 3, 4]),
+                                                (3, [0, 1, 3])])
+def test_group_glyph_between_first_and_last_neurons(max_neurons, slots):
+    layer = Dense(10, x_coord=2, max_neurons=max_neurons)
+    head = (max_neurons + 1)//2
+
+    # Offset 2 and x_offset 1: slot i is at y = 1 + 2*i
+    np.testing.assert_array_equal(layer.y_list, 1 + 2*np.array(slots))
+    assert list(layer.indices) == list(range(head)) + \
+        list(range(10 - max_neurons + head, 10))
+    assert layer.group_y == 1 + 2*head
+    assert layer.num_hidden == 10 - max_neurons
+
+    glyph = layer.data[-1]
+    assert (glyph['x'], glyph['y']) == ([2], [layer.group_y])
+    assert glyph['text'] == ['\u2026' + str(10 - max_neurons) + ' more']
+
+
+def test_band_into_an_aggregated_layer():
+    layer_curr = Dense(3, x_coord=1)
+    layer_next = Dense(10, x_coord=2, max_neurons=4)
+    data = connect(layer_curr, layer_next)
+
+    edges = _edge_traces(data)
+    bands = _band_traces(data)
+    assert len(edges) == len(bands) == 1
+    # Drawn neurons only, 3 x 4 segments of 3 points
+    assert len(edges[0]['x']) == 3*4*3
+
+    # From the extent of the layer (y 1 to 5) to the glyph (5 +- 1)
+    x, y, n_edges = get_band(layer_curr, layer_next)
+    assert x[:5] == [1, 1, 2, 2, 1] and np.isnan(x[5])
+    assert y[:5] == [1, 5, 6, 4, 1] and np.isnan(y[5])
+    assert n_edges == 3*6
+    assert bands[0]['text'] == '18 connections'
+
+
+def test_bands_between_aggregated_layers():
+    layer_curr = Dense(10, x_coord=1, max_neurons=4)
+    layer_next = Dense(10, x_coord=2, max_neurons=4)
+    x, y, n_edges = get_band(layer_curr, layer_next)
+
+    # One band out of each glyph, bundling every edge not drawn
+    assert len(x) == len(y) == 12
+    assert n_edges == 10*10 - 4*4
+    assert len(_band_traces(connect(layer_curr, layer_next))) == 1
+
+
+def test_layer_of_max_neurons_is_drawn_in_full():
+    layer = Dense(4, max_neurons=4)
+
+    assert layer.group_y is None and layer.num_hidden == 0
+    assert len(layer.y_list) == 4 and len(layer.data) == 2
+    data = connect(Dense(3, x_coord=1), Dense(4, x_coord=2, max_neurons=4))
+    assert len(data) == 1 and not _band_traces(data)
+
+
+def test_mlp_max_neurons():
+    figure = MultiLayerPerceptron([3, 10, 2]).to_figure(max_neurons=4)
+
+    # Into and out of the 10 neuron layer
+    assert len(_band_traces(figure['data'])) == 2
+    assert len(_edge_traces(figure['data'])) == 2
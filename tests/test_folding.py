@@ -0,0 +1,49 @@
+import pytest
+
+from visualnn.convnet import ConvNet2D
+from visualnn.fc import MultiLayerPerceptron
+from visualnn.folding import find_repeats, fold_indices, fold_layers
+
+
+def test_find_repeats():
+    assert find_repeats(list('aXbcbcbcY')) == [(2, 2, 3)]
+    assert find_repeats(list('aaaa')) == [(0, 1, 4)]
+    assert find_repeats(list('abc')) == []
+    assert find_repeats(list('abab'), min_repeats=3) == []
+    with pytest.raises(ValueError):
+        find_repeats(list('aa'), min_repeats=1)
+
+
+def test_fold_indices():
+    kept, blocks = fold_indices(9, [(2, 2, 3)])
+
+    assert kept == [0, 1, 2, 3, 8]
+    assert blocks == [(2, 4, 3)]
+
+
+def test_fold_layers_compares_shapes():
+    layers = [['Dense', (4,)], ['Dense', (16,)], ['Dense', (8,)]] + \
+        [['Dense', (16,)], ['Dense', (8,)]]*2 + [['Dense', (2,)]]
+
+    folded, blocks = fold_layers(layers)
+
+    # The first 16 follows the 4 input, not an 8, so it is not
+    # a copy of the block
+    assert folded == layers[:5] + layers[-1:]
+    assert blocks == [(2, 4, 2)]
+
+
+def test_folded_mlp_has_badges():
+    sizes = [8] + [16, 8]*4 + [2]
+    model = MultiLayerPerceptron(sizes, fold=True)
+    layout = model.to_figure()['layout']
+
+    assert [a['text'] for a in layout['annotations']] == ['×4']
+    assert model.expand().to_figure()['layout'].get('annotations') is None
+
+
+def test_folded_convnet_has_badges():
+    layers_conv = [(32, 32, 3)] + [(32, 32, 8)]*4
+    layout = ConvNet2D(layers_conv, [10], fold=True).to_figure()['layout']
+
+    assert [a['text'] for a in layout['annotations']] == ['×3']
@@ -0,0 +1,29 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Heavy packages that only the functions using them may import
+FORBIDDEN = ('keras', 'tensorflow', 'matplotlib', 'torch')
+
+SCRIPT = '''
+import sys
+import {modules}
+print(' '.join(sorted(set(name.split('.')[0] for name in sys.modules))))
+'''
+
+
+@pytest.mark.parametrize('modules', [
+    'visualnn.fc',
+    'visualnn.fc, visualnn.convnet, visualnn.keras_loader',
+    'visualnn.dag, visualnn.torch_loader, visualnn.kernels'])
+def test_import_loads_no_heavy_packages(modules):
+    output = subprocess.check_output(
+        [sys.executable, '-c', SCRIPT.format(modules=modules)],
+        cwd=ROOT, universal_newlines=True)
+    loaded = set(output.split())
+
+    assert not loaded.intersection(FORBIDDEN)
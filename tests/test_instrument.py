@@ -0,0 +1,46 @@
+import pytest
+
+from visualnn import instrument
+from visualnn.fc import MultiLayerPerceptron
+
+
+def test_nothing_recorded_when_off():
+    with instrument.stage('test.off') as record:
+        record['objects'] = 1
+
+    assert not instrument.enabled()
+
+
+def test_collect_stages():
+    with instrument.collect() as stats:
+        MultiLayerPerceptron([4, 6, 3]).to_json()
+
+    stages = stats.stages()
+    assert stages['backend.to_json']['calls'] == 1
+    assert stages['backend.to_json']['bytes'] > 0
+    assert all(record['seconds'] >= 0 for record in stats.records)
+    assert 'backend.to_json' in str(stats)
+
+
+def test_callback_gets_errors():
+    records = list()
+    instrument.add_callback(records.append)
+    try:
+        with pytest.raises(KeyError):
+            with instrument.stage('test.fail', objects=3):
+                raise KeyError('x')
+    finally:
+        instrument.remove_callback(records.append)
+
+    assert records[0]['stage'] == 'test.fail'
+    assert records[0]['objects'] == 3
+    assert records[0]['error'] == 'KeyError'
+    assert not instrument.enabled()
+
+
+def test_memory():
+    with instrument.collect(trace_memory=True) as stats:
+        with instrument.stage('test.alloc'):
+            buffer = bytearray(1 << 20)
+
+    assert stats.records[0]['allocated_bytes'] >= len(buffer)
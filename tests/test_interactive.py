@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from visualnn.interactive import EditableMLP
+
+
+def _coords(data):
+    return [(np.asarray(trace['x'], dtype=float),
+             np.asarray(trace['y'], dtype=float)) for trace in data]
+
+
+def _assert_same_coords(data, expected):
+    assert len(data) == len(expected)
+    for (x, y), (ex, ey) in zip(_coords(data), _coords(expected)):
+        np.testing.assert_array_equal(x, ex)
+        np.testing.assert_array_equal(y, ey)
+
+
+def _rebuilt(net):
+    """ The same network built from scratch, on the same
+        reference line. """
+    fresh = EditableMLP(net.layer_sizes)
+    fresh.reference = net.reference
+    fresh._rebuild()
+    return fresh
+
+
+@pytest.mark.parametrize('edit', [
+    lambda net: net.resize(1, 3),
+    lambda net: net.resize(1, 12),
+    lambda net: net.insert(1, 5),
+    lambda net: net.insert(4, 2),
+    lambda net: net.remove(0),
+    lambda net: net.remove(-1),
+    lambda net: net.remove(2),
+])
+def test_edits_match_a_rebuild(edit):
+    go = pytest.importorskip('plotly.graph_objs')
+    net = EditableMLP([4, 6, 3, 2])
+    figure = net.bind(go.Figure())
+
+    edit(net)
+
+    _assert_same_coords(net.data, _rebuilt(net).data)
+    _assert_same_coords([dict(x=trace.x, y=trace.y) for trace in figure.data],
+                        net.data)
+    assert [trace.uid for trace in figure.data] == \
+        [trace['uid'] for trace in net.data]
+
+
+def test_uids_are_stable():
+    net = EditableMLP([4, 6, 3])
+    uids = set(trace['uid'] for trace in net.data
+               if trace['uid'].startswith('layer-2-'))
+    net.insert(1, 5)
+
+    assert uids <= set(trace['uid'] for trace in net.data)
+    assert net.layer_sizes == [4, 5, 6, 3]
+
+
+def test_bad_edits():
+    net = EditableMLP([4])
+    with pytest.raises(ValueError):
+        net.remove(0)
+    with pytest.raises(IndexError):
+        net.resize(3, 2)
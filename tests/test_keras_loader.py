@@ -0,0 +1,92 @@
+import os
+
+import pytest
+
+from visualnn import keras_loader
+
+VISUALNN = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'visualnn')
+
+# Layer lists of loadFromKerasModel() for the bundled models
+EXPECTED = {
+    'mlp1.h5': [['Dense', (3,)], ['Dense', (2,)], ['Dense', (10,)],
+                ['Dense', (5,)]],
+    'mlp2.h5': [['Dense', (3,)], ['Dense', (12,)], ['Dense', (8,)],
+                ['Dense', (7,)], ['Dense', (1,)]],
+    'mlp3.json': [['Dense', (7,)], ['Dense', (3,)], ['Dense', (10,)],
+                  ['Dense', (8,)]],
+}
+
+
+def _load_config(name):
+    path = os.path.join(VISUALNN, name)
+    if name.endswith('.json'):
+        return keras_loader.loadConfigFromJSON(path)
+    return keras_loader.loadConfigFromFile(path)
+
+
+def _layer(class_name, name, inbound, **config):
+    config['name'] = name
+    return {'class_name': class_name, 'name': name, 'config': config,
+            'inbound_nodes': [[[source, 0, 0, {}] for source in inbound]]
+            if inbound else []}
+
+
+def _residual_config():
+    """ Keras 2 functional config with an Add skip connection and
+        a Concatenate. """
+    return {'class_name': 'Model', 'config': {'layers': [
+        _layer('InputLayer', 'input', [], batch_input_shape=[None, 8]),
+        _layer('Dense', 'dense_1', ['input'], units=8),
+        _layer('Add', 'add', ['input', 'dense_1']),
+        _layer('Dense', 'dense_2', ['add'], units=3),
+        _layer('Concatenate', 'concat', ['dense_2', 'add'], axis=-1),
+    ]}}
+
+
+@pytest.mark.parametrize('name', sorted(EXPECTED))
+def test_load_from_config(name):
+    layers, all_dense = keras_loader.loadFromConfig(_load_config(name))
+
+    assert layers == EXPECTED[name]
+    assert all_dense == 1
+
+
+def test_conv_shapes():
+    config = {'class_name': 'Sequential', 'config': {'layers': [
+        {'class_name': 'Conv2D',
+         'config': {'name': 'conv', 'batch_input_shape': [None, 28, 28, 1],
+                    'filters': 6, 'kernel_size': [5, 5]}},
+        {'class_name': 'MaxPooling2D',
+         'config': {'name': 'pool', 'pool_size': [2, 2]}},
+        {'class_name': 'Flatten', 'config': {'name': 'flatten'}},
+        {'class_name': 'Dense', 'config': {'name': 'dense', 'units': 10}},
+    ]}}
+
+    layers, all_dense = keras_loader.loadFromConfig(config)
+
+    assert layers == [['Conv2D', (28, 28, 1)], ['Conv2D', (24, 24, 6)],
+                      ['Conv2D', (12, 12, 6)], ['Dense', (864,)],
+                      ['Dense', (10,)]]
+    assert all_dense == 0
+
+
+def test_not_chained_raises():
+    with pytest.raises(ValueError, match='loadGraphFromConfig'):
+        keras_loader.loadFromConfig(_residual_config())
+
+
+def test_graph_merge_shapes():
+    nodes, edges = keras_loader.loadGraphFromConfig(_residual_config())
+
+    assert [node[1] for node in nodes] == [(8,), (8,), (8,), (3,), (11,)]
+    assert sorted(edges) == [(0, 1), (0, 2), (1, 2), (2, 3), (2, 4), (3, 4)]
+
+
+@pytest.mark.parametrize('name', ['mlp1.h5', 'mlp2.h5'])
+def test_same_as_keras_model(name):
+    keras = pytest.importorskip('keras')
+    model = keras.models.load_model(os.path.join(VISUALNN, name))
+
+    assert keras_loader.loadFromKerasModel(model) == \
+        keras_loader.loadFromConfig(_load_config(name))
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from visualnn.kernels import KernelMosaic, kernel_mosaic, normalize_filters
+
+
+def _kernel():
+    return np.arange(3*3*2*4, dtype=float).reshape(3, 3, 2, 4) - 30
+
+
+def test_normalize_filters():
+    filters = normalize_filters(_kernel())
+
+    assert filters.shape == (4, 2, 3, 3)
+    np.testing.assert_allclose(np.abs(filters).reshape(4, -1).max(axis=1), 1)
+
+
+def test_channels_mosaic():
+    kernel = _kernel()
+    mosaic = kernel_mosaic(kernel, normalize=False)
+
+    # 4 rows of filters, 2 columns of channels, with one cell
+    # of padding between the tiles
+    assert mosaic.shape == (4*4 - 1, 2*4 - 1)
+    np.testing.assert_array_equal(mosaic[4:7, 4:7], kernel[:, :, 1, 1])
+    assert np.isnan(mosaic[3]).all() and np.isnan(mosaic[:, 3]).all()
+
+
+def test_mean_mosaic_is_normalized_after_averaging():
+    kernel = _kernel()
+    mosaic = kernel_mosaic(kernel, mode='mean', pad=0)
+    mean = kernel[:, :, :, 2].mean(axis=2)
+
+    # 4 filters in a 2 x 2 grid
+    assert mosaic.shape == (6, 6)
+    np.testing.assert_allclose(mosaic[3:, :3], mean/np.abs(mean).max(),
+                               rtol=1e-6)
+
+
+def test_bad_input():
+    with pytest.raises(ValueError, match='mode'):
+        kernel_mosaic(_kernel(), mode='grid')
+    with pytest.raises(ValueError, match='shape'):
+        kernel_mosaic(np.ones((3, 3, 2)))
+
+
+def test_figure_is_one_heatmap():
+    figure = KernelMosaic(_kernel(), name='conv').to_figure()
+
+    assert [trace['type'] for trace in figure['data']] == ['heatmap']
+    assert figure['layout']['yaxis']['autorange'] == 'reversed'
+    pytest.importorskip('matplotlib')
+    assert KernelMosaic(_kernel()).to_image()[:4] == b'\x89PNG'
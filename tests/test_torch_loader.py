@@ -0,0 +1,76 @@
+import pytest
+
+torch = pytest.importorskip('torch')
+
+from visualnn import torch_loader  # noqa: E402
+
+
+def _module():
+    return torch.nn.Sequential(
+        torch.nn.Conv2d(1, 4, 3),
+        torch.nn.ReLU(),
+        torch.nn.MaxPool2d(2),
+        torch.nn.Flatten(),
+        torch.nn.Linear(4*13*13, 10))
+
+
+def test_layer_list():
+    layers, all_dense = torch_loader.loadFromTorchModule(_module(),
+                                                         (1, 28, 28))
+
+    assert layers == [['Conv2D', (28, 28, 1)], ['Conv2D', (26, 26, 4)],
+                      ['Conv2D', (13, 13, 4)], ['Dense', (676,)],
+                      ['Dense', (10,)]]
+    assert all_dense == 0
+
+
+def test_dense_layer_list():
+    module = torch.nn.Sequential(torch.nn.Linear(8, 4), torch.nn.ReLU(),
+                                 torch.nn.Linear(4, 2))
+
+    assert torch_loader.loadFromTorchModule(module, (8,)) == \
+        ([['Dense', (8,)], ['Dense', (4,)], ['Dense', (2,)]], 1)
+
+
+def test_module_is_left_untouched():
+    module = _module()
+    before = dict((name, tensor.clone())
+                  for name, tensor in module.state_dict().items())
+
+    torch_loader.loadFromTorchModule(module, (1, 28, 28))
+
+    for name, tensor in module.state_dict().items():
+        assert tensor.device.type == 'cpu'
+        assert torch.equal(tensor, before[name])
+    assert not any(layer._forward_hooks for layer in module.modules())
+
+
+class _Branching(torch.nn.Module):
+    """ Control flow on the values of a tensor, which meta
+        tensors do not have. """
+
+    def __init__(self):
+        super().__init__()
+        self.first = torch.nn.Linear(8, 4)
+        self.second = torch.nn.Linear(4, 2)
+        self.devices = list()
+
+    def forward(self, x):
+        x = self.first(x)
+        self.devices.append(x.device.type)
+        if bool(x.sum() > 0):
+            x = x.relu()
+        return self.second(x)
+
+
+def test_fallback_to_an_empty_batch():
+    module = _Branching()
+    before = dict((name, tensor.clone())
+                  for name, tensor in module.state_dict().items())
+
+    # The Linear recorded before the meta run failed is not kept
+    assert torch_loader.loadFromTorchModule(module, (8,)) == \
+        ([['Dense', (8,)], ['Dense', (4,)], ['Dense', (2,)]], 1)
+    assert module.devices == ['meta', 'cpu']
+    for name, tensor in module.state_dict().items():
+        assert torch.equal(tensor, before[name])
@@ -0,0 +1,67 @@
+import numpy as np
+
+from visualnn.fc import MultiLayerPerceptron
+
+SIZES = [20, 30, 10]
+
+
+def _brute_force_edges(index, x0, x1, y0, y1):
+    """ No. of edges crossing a viewport, by clipping every
+        edge. """
+    count = 0
+    for i in range(len(index.layers) - 1):
+        xa, xb = index.x[i], index.x[i + 1]
+        ta = np.clip((x0 - xa)/(xb - xa), 0, 1)
+        tb = np.clip((x1 - xa)/(xb - xa), 0, 1)
+        if ta >= tb:
+            continue
+        ya = index.y[i][:, np.newaxis]
+        yb = index.y[i + 1][np.newaxis, :]
+        at_a, at_b = ya + (yb - ya)*ta, ya + (yb - ya)*tb
+        count += int(((np.maximum(at_a, at_b) >= y0) &
+                      (np.minimum(at_a, at_b) <= y1)).sum())
+    return count
+
+
+def test_visible_edges_match_brute_force():
+    index = MultiLayerPerceptron(SIZES).get_viewport_index()
+    x0, x1, y0, y1 = index.full_range()
+    for viewport in [(x0, x1, y0, y1), (1.2, 2.5, 10, 30),
+                     (0.5, 1.5, 0, 5), (2.2, 2.8, 15, 16)]:
+        _, aggregated = index.query(*viewport)
+        runs = [index._visible_runs(i, *viewport)
+                for i in range(len(SIZES) - 1)
+                if index.x[i] < viewport[1] and index.x[i + 1] > viewport[0]]
+        n_edges = sum(int((hi - lo).sum()) for _, lo, hi in runs)
+
+        assert not aggregated
+        assert n_edges == _brute_force_edges(index, *viewport)
+
+
+def test_edges_are_bundled_above_the_budget():
+    index = MultiLayerPerceptron(SIZES).get_viewport_index(max_edges=10,
+                                                           bins=4)
+    data, aggregated = index.query(*index.full_range())
+
+    assert aggregated
+    assert all(len(trace['x']) % 3 == 0 for trace in data
+               if trace.get('mode') == 'lines')
+
+
+def test_neuron_attributes_are_sliced():
+    values = [np.arange(size, dtype=float) for size in SIZES]
+    model = MultiLayerPerceptron(SIZES, activations=values)
+    index = model.get_viewport_index(max_neurons=None,
+                                     max_visible_neurons=1000)
+
+    y = index.y[1]
+    data, _ = index.query(1.5, 2.5, y[5] - 0.1, y[12] + 0.1)
+    filled = [trace for trace in data
+              if isinstance(trace.get('marker', {}).get('color'),
+                            np.ndarray)]
+
+    assert len(filled) == 1
+    trace = filled[0]
+    assert list(trace['marker']['color']) == list(range(5, 13))
+    assert trace['text'] == ['%.4g' % value for value in range(5, 13)]
+    assert len(trace['y']) == 8
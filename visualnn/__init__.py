@@ -0,0 +1,9 @@
+""" VisualNN: plotly figures of neural network architectures.
+
+The models are in visualnn.fc (multi-layer perceptrons),
+visualnn.convnet (convolutional networks), visualnn.dag
+(layer graphs) and visualnn.kernels (filter mosaics), and
+the Keras and PyTorch loaders in visualnn.keras_loader and
+visualnn.torch_loader. The submodules are not imported here,
+so that importing one of them only loads what it needs.
+"""
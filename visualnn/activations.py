@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+""" Activations of the layers of a model, reduced on the fly.
+
+The inputs are passed through the model in batches, and the
+outputs of each layer are reduced to one value per unit (per
+channel for conv layers, the last axis) as they come, so only
+one batch of activations is in memory at a time:
+
+    reducers = reduce_activations(probe, inputs, n_outputs=3)
+
+where probe(batch) returns the outputs of the layers for a
+batch. The values are then mapped to colors of a colorscale to
+draw the neurons and channels of the figures.
+"""
+
+import numpy as np
+
+from .instrument import stage
+
+# Reductions of the activations of each unit
+REDUCTIONS = ('mean', 'max')
+
+# Colorscale of the activations
+COLORSCALE = 'Viridis'
+
+# No. of distinct colors, so that batched traces stay few
+COLOR_LEVELS = 16
+
+class ActivationReducer:
+
+    def __init__(self, reduce='mean'):
+        """ Running mean or max of the activations of each
+            unit of a layer, over the samples and the
+            spatial axes.
+
+            Parameters
+            ----------
+            reduce: string
+                'mean' or 'max'.
+        """
+        if reduce not in REDUCTIONS:
+            raise ValueError('Unknown reduce ' + repr(reduce) +
+                             ', expected one of ' + ', '.join(REDUCTIONS))
+        self.reduce = reduce
+        self.total = None
+        self.count = 0
+
+    def update(self, values):
+        """ Add the activations of a batch, with the units
+            on the last axis. """
+        values = np.asarray(values, dtype=float)
+        flat = values.reshape(-1, values.shape[-1])
+        if not len(flat):
+            return
+        if self.reduce == 'mean':
+            part = flat.sum(axis=0)
+            self.total = part if self.total is None else self.total + part
+        else:
+            part = flat.max(axis=0)
+            self.total = part if self.total is None else \
+                np.maximum(self.total, part)
+        self.count += len(flat)
+
+    def result(self):
+        """ Get the value of each unit, or None if no
+            batch was added. """
+        if self.total is None:
+            return None
+        if self.reduce == 'mean':
+            return self.total/self.count
+        return self.total.copy()
+
+def iter_batches(inputs, batch_size=256):
+    """ Yield the batches of an array of inputs, or the
+        batches of an iterable of batches (e.g. a generator
+        reading them from disk) as they are. """
+    if isinstance(inputs, np.ndarray):
+        for start in range(0, len(inputs), batch_size):
+            yield inputs[start:start + batch_size]
+    else:
+        for batch in inputs:
+            yield np.asarray(batch)
+
+def reduce_activations(probe, inputs, n_outputs, reduce='mean',
+                       batch_size=256):
+    """ Reduce the activations of the layers of a model
+        over a set of inputs, one batch at a time.
+
+        Parameters
+        ----------
+        probe: callable
+            Returns the outputs of the layers (a list of
+            n_outputs arrays) for a batch of inputs.
+        inputs: np.ndarray or iterable of np.ndarray
+            The inputs, or batches of inputs.
+        n_outputs: int
+            No. of outputs of probe.
+        reduce: string
+            'mean' or 'max', see ActivationReducer.
+        batch_size: int
+            No. of samples per batch of an array.
+
+        Returns
+        -------
+        values: list of np.ndarray
+            Value of each unit of each output.
+    """
+    reducers = [ActivationReducer(reduce) for _ in range(n_outputs)]
+    with stage('activations.reduce', outputs=n_outputs) as record:
+        record['samples'] = 0
+        for batch in iter_batches(inputs, batch_size):
+            outputs = probe(batch)
+            if n_outputs == 1 and not isinstance(outputs, (list, tuple)):
+                outputs = [outputs]
+            for reducer, output in zip(reducers, outputs):
+                reducer.update(output)
+            record['samples'] += len(batch)
+            del outputs
+    return [reducer.result() for reducer in reducers]
+
+def value_range(values):
+    """ Get the (min, max) over a list of arrays, skipping
+        None. """
+    arrays = [np.asarray(v, dtype=float).ravel() for v in values
+              if v is not None]
+    if not arrays:
+        return 0.0, 1.0
+    flat = np.concatenate(arrays)
+    return float(flat.min()), float(flat.max())
+
+def get_colors(values, vmin, vmax, colorscale=COLORSCALE,
+               levels=COLOR_LEVELS):
+    """ Map values to (r, g, b) colors of a colorscale,
+        quantized to a few levels.
+
+        Parameters
+        ----------
+        values: np.ndarray
+            The values.
+        vmin, vmax: float
+            Values mapped to the ends of the colorscale.
+        colorscale: string
+            Name of a Plotly colorscale.
+        levels: int
+            No. of distinct colors.
+    """
+    from plotly.colors import sample_colorscale, unlabel_rgb
+
+    values = np.asarray(values, dtype=float)
+    scale = vmax - vmin if vmax > vmin else 1.0
+    level = np.clip(((values - vmin)/scale*levels).astype(int), 0,
+                    levels - 1)
+    palette = [tuple(int(round(c)) for c in unlabel_rgb(color))
+               for color in sample_colorscale(
+                   colorscale, list(np.linspace(0, 1, levels)))]
+    return [palette[i] for i in level]
@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+""" Adjacency of the neurons of an MLP, for highlighting.
+
+The edges drawn between each pair of layers are indexed in
+CSR form, both ways: for the neurons of the current layer,
+offsets into the array of their neighbours in the next layer,
+and the same for the neurons of the next layer. The
+neighbours of neuron i are neighbours[offsets[i]:offsets[i + 1]],
+so fan-in and fan-out are read in O(degree).
+
+The index is embedded in HTML outputs as base64 Int32Arrays
+with a small script, so that hovering over a neuron highlights
+its edges in the browser, without going back to Python.
+"""
+
+import base64
+import json
+
+import numpy as np
+
+from .fc import select_edges
+
+# Color of the highlighted edges
+HIGHLIGHT_COLOR = 'orange'
+
+def get_csr(src, dst, n_src):
+    """ Index edges in CSR form.
+
+        Parameters
+        ----------
+        src, dst: np.ndarray
+            Ends of the edges.
+        n_src: int
+            No. of possible values of src.
+
+        Returns
+        -------
+        offsets: np.ndarray
+            n_src + 1 offsets into neighbours.
+        neighbours: np.ndarray
+            dst of the edges, sorted by src.
+    """
+    src = np.asarray(src, dtype=np.int64)
+    order = np.argsort(src, kind='stable')
+    offsets = np.zeros(n_src + 1, dtype=np.int32)
+    np.cumsum(np.bincount(src, minlength=n_src), out=offsets[1:])
+    neighbours = np.asarray(dst, dtype=np.int32)[order]
+    return offsets, neighbours
+
+def _encode(values):
+    """ Encode an int32 array as base64, little endian. """
+    return base64.b64encode(np.asarray(values, dtype='<i4').tobytes()) \
+        .decode('ascii')
+
+class Adjacency:
+
+    def __init__(self, layers, edges):
+        """ CSR index of the edges between the layers of an
+            MLP, both ways.
+
+            Parameters
+            ----------
+            layers: list of fc.Dense
+                Layers of the MLP.
+            edges: list of (src, dst) pairs of np.ndarray
+                Edges drawn between each pair of layers, as
+                positions among the drawn neurons.
+        """
+        self.x = [float(layer.x_coord) for layer in layers]
+        self.y = [np.asarray(layer.y_list, dtype=float) for layer in layers]
+        self.fan_out_csr = list()
+        self.fan_in_csr = list()
+        for i, (src, dst) in enumerate(edges):
+            self.fan_out_csr.append(get_csr(src, dst, len(self.y[i])))
+            self.fan_in_csr.append(get_csr(dst, src, len(self.y[i + 1])))
+
+    def fan_out(self, layer, neuron):
+        """ Neurons of the next layer that a neuron (its
+            position among the drawn neurons of a layer)
+            connects to. """
+        if layer + 1 >= len(self.y):
+            return np.zeros(0, dtype=np.int32)
+        offsets, neighbours = self.fan_out_csr[layer]
+        return neighbours[offsets[neuron]:offsets[neuron + 1]]
+
+    def fan_in(self, layer, neuron):
+        """ Neurons of the previous layer connected to a
+            neuron. """
+        if layer == 0:
+            return np.zeros(0, dtype=np.int32)
+        offsets, neighbours = self.fan_in_csr[layer - 1]
+        return neighbours[offsets[neuron]:offsets[neuron + 1]]
+
+    def to_dict(self):
+        """ Get the index as a JSON-able dict, with the CSR
+            arrays in base64. """
+        return dict(
+            x=self.x,
+            y=[y.tolist() for y in self.y],
+            out=[[_encode(offsets), _encode(neighbours)]
+                 for offsets, neighbours in self.fan_out_csr],
+            inb=[[_encode(offsets), _encode(neighbours)]
+                 for offsets, neighbours in self.fan_in_csr])
+
+def get_adjacency(layers, weights=None, top_k=None, threshold=None):
+    """ Index the edges of an MLP as drawn by
+        fc.connect_layers().
+
+        Parameters
+        ----------
+        layers: list of fc.Dense
+            Layers of the MLP.
+        weights, top_k, threshold:
+            See fc.connect_layers().
+    """
+    kernels = None if weights is None else iter(weights)
+
+    edges = list()
+    for layer_curr, layer_next in zip(layers[:-1], layers[1:]):
+        if kernels is None:
+            n_curr, n_next = len(layer_curr.y_list), len(layer_next.y_list)
+            src = np.repeat(np.arange(n_curr), n_next)
+            dst = np.tile(np.arange(n_next), n_curr)
+        else:
+            kernel = next(kernels)
+            kernel = np.asarray(kernel[layer_curr.indices]
+                                [:, layer_next.indices], dtype=float)
+            src, dst, _ = select_edges(kernel, top_k=top_k,
+                                       threshold=threshold)
+        edges.append((src, dst))
+
+    return Adjacency(layers, edges)
+
+HIGHLIGHT_SCRIPT = '''
+(function() {
+    var gd = document.getElementById("{plot_id}");
+    var index = INDEX;
+    function decode(text) {
+        var bytes = atob(text), buffer = new ArrayBuffer(bytes.length);
+        var view = new Uint8Array(buffer);
+        for (var k = 0; k < bytes.length; k++) {
+            view[k] = bytes.charCodeAt(k);
+        }
+        return new Int32Array(buffer);
+    }
+    var out = index.out.map(function(csr) { return csr.map(decode); });
+    var inb = index.inb.map(function(csr) { return csr.map(decode); });
+    var highlight = gd.data.length;
+    var first = highlight - index.traces.length;
+    // Edges of a neuron, from its neighbours in one CSR
+    function add(x, y, csr, i, x0, y0, x1, y1) {
+        var offsets = csr[0], neighbours = csr[1];
+        for (var k = offsets[i]; k < offsets[i + 1]; k++) {
+            x.push(x0, x1, null);
+            y.push(y0, y1[neighbours[k]], null);
+        }
+    }
+    Plotly.addTraces(gd, {type: "TYPE", x: [], y: [], mode: "lines",
+                          line: {color: "COLOR", width: 3},
+                          hoverinfo: "skip", showlegend: false});
+    gd.on("plotly_hover", function(event) {
+        var point = event.points[0];
+        var layer = index.traces[point.curveNumber - first];
+        if (layer == null) {
+            return;
+        }
+        var i = point.pointNumber, x = [], y = [];
+        var x0 = index.x[layer], y0 = index.y[layer][i];
+        if (layer + 1 < index.x.length) {
+            add(x, y, out[layer], i, x0, y0, index.x[layer + 1],
+                index.y[layer + 1]);
+        }
+        if (layer > 0) {
+            add(x, y, inb[layer - 1], i, x0, y0, index.x[layer - 1],
+                index.y[layer - 1]);
+        }
+        Plotly.restyle(gd, {x: [x], y: [y]}, [highlight]);
+    });
+    gd.on("plotly_unhover", function() {
+        Plotly.restyle(gd, {x: [[]], y: [[]]}, [highlight]);
+    });
+})();
+'''
+
+def get_highlight_script(adjacency, traces, color=HIGHLIGHT_COLOR,
+                         trace_type='scatter'):
+    """ Get the script highlighting the edges of the
+        neuron under the mouse, to pass as post_script to
+        backend.figure_to_html().
+
+        Parameters
+        ----------
+        adjacency: Adjacency
+            The index of the edges.
+        traces: list
+            Layer of each of the last traces of the
+            figure, or None for those that are not
+            neurons.
+        color: string (Plotly color)
+            Color of the highlighted edges.
+        trace_type: string
+            Type of the highlight trace, 'scatter' or
+            'scattergl'.
+    """
+    index = adjacency.to_dict()
+    index['traces'] = traces
+    # The index goes in last, base64 could contain the other keys
+    return HIGHLIGHT_SCRIPT.replace('TYPE', trace_type) \
+        .replace('COLOR', color).replace('INDEX', json.dumps(index))
@@ -0,0 +1,304 @@
+#!/usr/bin/env python
+
+import json
+
+import numpy as np
+
+from .encoding import encode_figure, encode_trace, layout_steps
+from .instrument import stage
+
+# Trace type used for each rendering backend
+TRACE_TYPES = {'svg': 'scatter',
+               'webgl': 'scattergl'}
+
+# Scatter attributes that scattergl does not support
+SVG_ONLY_KEYS = ('hoveron', 'cliponaxis')
+
+def get_trace_type(backend):
+    """ Get the Plotly trace type for a backend.
+
+        Parameters
+        ----------
+        backend: string
+            'svg' for plain scatter traces or 'webgl'
+            for scattergl traces.
+    """
+    if backend not in TRACE_TYPES:
+        raise ValueError('Unknown backend ' + repr(backend) +
+                         ', expected one of ' +
+                         ', '.join(sorted(TRACE_TYPES)))
+
+    return TRACE_TYPES[backend]
+
+def set_backend(data, backend):
+    """ Set the type of all the traces in a data list
+        for a backend. The traces themselves are not
+        modified, shallow copies are returned.
+
+        Parameters
+        ----------
+        data: list of dicts
+            The data list.
+        backend: string
+            'svg' or 'webgl'.
+
+        Returns
+        -------
+        data: list of dicts
+            The data list with the trace types set.
+    """
+    trace_type = get_trace_type(backend)
+
+    new_data = list()
+    for trace in data:
+        trace = dict(trace, type=trace_type)
+        if trace_type != 'scatter':
+            for key in SVG_ONLY_KEYS:
+                trace.pop(key, None)
+        new_data.append(trace)
+
+    return new_data
+
+def figure_to_json(figure, pretty=False, binary=False):
+    """ Serialize a figure to a JSON string in memory.
+
+        Parameters
+        ----------
+        figure: dict
+            The figure, with data and layout.
+        pretty: bool
+            Set true to indent the output.
+        binary: bool
+            Set true to write the coordinates as base64
+            typed arrays, quantized to the layout (see
+            encoding.encode_figure()). Smaller and much
+            faster for the browser to load.
+    """
+    import plotly.io as pio
+
+    with stage('backend.to_json', traces=len(figure['data'])) as record:
+        if not binary:
+            text = pio.to_json(figure, pretty=pretty)
+        else:
+            # Plotly escapes '/' for HTML, which inflates base64 
+            # by a third. The escape is not needed in JSON.
+            text = pio.to_json(encode_figure(figure), pretty=pretty)
+            text = text.replace('\\u002f', '/')
+        record['bytes'] = len(text)
+    return text
+
+def figure_to_html(figure, include_plotlyjs=True, full_html=True,
+                   binary=False, post_script=None):
+    """ Render a figure to an HTML string in memory,
+        without writing any file or opening a browser.
+
+        Parameters
+        ----------
+        figure: dict
+            The figure, with data and layout.
+        include_plotlyjs: bool or string
+            True embeds plotly.js (~3 MB) in the output.
+            'cdn' loads it from the plotly CDN, a path
+            ending in .js loads it from that path and
+            False leaves it out, so that many outputs can
+            share one bundle (see get_plotlyjs()).
+        full_html: bool
+            Set false to get only a <div> element, to be
+            embedded in a larger page.
+        binary: bool
+            See figure_to_json().
+        post_script: string or None
+            JavaScript run after the plot is made, with
+            {plot_id} replaced by the id of its <div>.
+    """
+    import plotly.io as pio
+
+    with stage('backend.to_html', traces=len(figure['data'])) as record:
+        if binary:
+            figure = encode_figure(figure)
+        text = pio.to_html(figure, include_plotlyjs=include_plotlyjs,
+                           full_html=full_html, post_script=post_script)
+        record['bytes'] = len(text)
+    return text
+
+class FigureMixin:
+    """ Render methods of the visual models, built on the
+        to_figure() method of the class. Keyword arguments
+        of the methods are passed to to_figure(). """
+
+    __slots__ = ()
+
+    def to_json(self, pretty=False, binary=False, **kwargs):
+        """ Get the figure as a JSON string. See
+            figure_to_json() for the options.
+        """
+        return figure_to_json(self.to_figure(**kwargs), pretty=pretty,
+                              binary=binary)
+
+    def to_html(self, include_plotlyjs=True, full_html=True, binary=False,
+                **kwargs):
+        """ Render the figure to an HTML string in memory.
+            See figure_to_html() for the options.
+        """
+        return figure_to_html(self.to_figure(**kwargs),
+                              include_plotlyjs=include_plotlyjs,
+                              full_html=full_html, binary=binary)
+
+    def to_image(self, format='png', fp=None, width=800, height=600,
+                 dpi=100, **kwargs):
+        """ Draw the figure to a static PNG, SVG or PDF
+            image with matplotlib, without a browser. See
+            mpl_backend.figure_to_image() for the options.
+        """
+        from .mpl_backend import figure_to_image
+        return figure_to_image(self.to_figure(**kwargs), format=format,
+                               fp=fp, width=width, height=height, dpi=dpi)
+
+class BuiltFigureMixin(FigureMixin):
+    """ Render methods of the visual models that build
+        their figure once, in their fig attribute. """
+
+    __slots__ = ()
+
+    def to_figure(self, backend='svg'):
+        """ Get the figure of the network. See plot() for
+            the parameters. """
+        return dict(self.fig, data=set_backend(self.fig['data'], backend))
+
+def get_plotlyjs():
+    """ Get the plotly.js bundle, to be served once for
+        the outputs of figure_to_html() with
+        include_plotlyjs=False. """
+    from plotly.offline import get_plotlyjs
+
+    return get_plotlyjs()
+
+def _open_output(fp):
+    """ Get a writable text stream for a path or a
+        file-like object, and whether to close it. """
+    if isinstance(fp, str):
+        return open(fp, 'w', encoding='utf-8'), True
+    return fp, False
+
+def trace_to_json(trace, encoder):
+    """ Encode a trace as JSON. Float arrays, such as the
+        coordinates of the edges, are encoded directly
+        with NaN written as null, which is much faster
+        than going through the Plotly encoder.
+
+        Parameters
+        ----------
+        trace: dict
+            The trace.
+        encoder: plotly.utils.PlotlyJSONEncoder
+            Encoder for everything else.
+    """
+    parts = list()
+    for key, value in trace.items():
+        if isinstance(value, np.ndarray) and value.dtype.kind == 'f':
+            text = json.dumps(value.tolist()).replace('NaN', 'null')
+        else:
+            text = encoder.encode(value)
+        parts.append(json.dumps(key) + ': ' + text)
+
+    return '{' + ', '.join(parts) + '}'
+
+def iter_json(data, layout, binary=False):
+    """ Yield the JSON text of a figure piece by piece,
+        encoding one trace at a time.
+
+        Parameters
+        ----------
+        data: iterable of dicts
+            The traces, can be a generator.
+        layout: dict
+            The layout.
+        binary: bool
+            Set true to write the coordinates as base64
+            typed arrays, quantized to the layout (see
+            encoding.encode_figure()).
+    """
+    from plotly.utils import PlotlyJSONEncoder
+
+    encoder = PlotlyJSONEncoder()
+    steps = layout_steps(layout) if binary else None
+
+    yield '{"data": ['
+    for i, trace in enumerate(data):
+        if i:
+            yield ', '
+        if steps is not None:
+            trace = encode_trace(trace, steps)
+        yield trace_to_json(trace, encoder)
+    yield '], "layout": ' + encoder.encode(layout) + '}'
+
+def write_json(data, layout, fp, binary=False):
+    """ Write a figure as JSON incrementally, so that
+        the whole figure is never held in memory.
+
+        Parameters
+        ----------
+        data: iterable of dicts
+            The traces, can be a generator.
+        layout: dict
+            The layout.
+        fp: string or file-like object
+            Path of the output, or an object with a
+            write() method taking strings.
+        binary: bool
+            See iter_json().
+    """
+    out, close = _open_output(fp)
+    try:
+        with stage('backend.write_json') as record:
+            record['bytes'] = 0
+            for chunk in iter_json(data, layout, binary=binary):
+                out.write(chunk)
+                record['bytes'] += len(chunk)
+    finally:
+        if close:
+            out.close()
+
+def write_html(data, layout, fp, include_plotlyjs=True, div_id='visualnn',
+               binary=False, post_script=None):
+    """ Write a figure as an HTML page incrementally.
+        See write_json() for the parameters and
+        figure_to_html() for include_plotlyjs and
+        post_script.
+    """
+    from plotly.offline import get_plotlyjs_version
+
+    out, close = _open_output(fp)
+    try:
+        out.write('<html>\n<head><meta charset="utf-8" /></head>\n<body>\n')
+        out.write('<div id="' + div_id + '" style="height:100%; '
+                  'width:100%;"></div>\n')
+
+        if include_plotlyjs is True:
+            out.write('<script type="text/javascript">')
+            out.write(get_plotlyjs())
+            out.write('</script>\n')
+        elif include_plotlyjs == 'cdn':
+            out.write('<script src="https://cdn.plot.ly/plotly-' +
+                      get_plotlyjs_version() + '.min.js"></script>\n')
+        elif isinstance(include_plotlyjs, str) and \
+                include_plotlyjs.endswith('.js'):
+            out.write('<script src="' + include_plotlyjs + '"></script>\n')
+
+        out.write('<script type="text/javascript">\nvar figure = ')
+        with stage('backend.write_html') as record:
+            record['bytes'] = 0
+            for chunk in iter_json(data, layout, binary=binary):
+                # Do not let the data close the script element
+                out.write(chunk.replace('</', '<\\/'))
+                record['bytes'] += len(chunk)
+        out.write(';\nPlotly.newPlot("' + div_id + '", figure.data, '
+                  'figure.layout, {"responsive": true})')
+        if post_script is not None:
+            out.write('.then(function() {\n' +
+                      post_script.replace('{plot_id}', div_id) + '\n})')
+        out.write(';\n</script>\n')
+        out.write('</body>\n</html>\n')
+    finally:
+        if close:
+            out.close()
@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+""" Benchmarks of figure construction and export.
+
+    python -m visualnn.bench -o results.json
+    python -m visualnn.bench --quick --compare results.json
+
+Each case is timed over a few runs (the best and the median
+are kept), then run once more under tracemalloc for the peak
+memory. The figure of the case gives the no. of traces and
+shapes and the size of its JSON export. Results are written
+as JSON with the git commit, so that runs on two commits can
+be compared with --compare.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from . import keras_loader
+from .backend import figure_to_json
+from .convnet import ConvNet2D
+from .fc import Dense, MultiLayerPerceptron, connect, connect_layers
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def dense_case(width):
+    return lambda: Dense(width, x_coord=1)
+
+def connect_case(width):
+    layer_curr = Dense(width, x_coord=1)
+    layer_next = Dense(width, x_coord=2)
+    return lambda: connect(layer_curr, layer_next)
+
+def connect_layers_case(width, depth):
+    layers = [Dense(width, x_coord=i + 1) for i in range(depth)]
+    def run():
+        data, layout = connect_layers(layers, 'bench', False)
+        return dict(data=data, layout=layout)
+    return run
+
+def mlp_case(width, depth):
+    return lambda: MultiLayerPerceptron([width]*depth).to_figure()
+
+def export_case(width, depth, binary):
+    figure = MultiLayerPerceptron([width]*depth).to_figure()
+    return lambda: figure_to_json(figure, binary=binary)
+
+def convnet_case(channels, render_mode):
+    layers_conv = [(64, 64, 3), (32, 32, channels), (16, 16, 2*channels),
+                   (8, 8, 4*channels)]
+    return lambda: ConvNet2D(layers_conv, [100, 10],
+                             render_mode=render_mode).to_figure()
+
+def loader_case(name):
+    path = os.path.join(HERE, name)
+    if name.endswith('.json'):
+        return lambda: keras_loader.loadFromJSON(path).to_figure()
+    return lambda: keras_loader.loadFromFile(path).to_figure()
+
+def get_cases(quick=False):
+    """ Get the benchmark cases as (name, params, setup)
+        triples. setup() returns the function to time,
+        which may return a figure. """
+    widths = [10, 100] if quick else [10, 100, 1000]
+    depths = [3, 10] if quick else [3, 10, 30]
+    channels = [8, 32] if quick else [8, 32, 128]
+
+    cases = list()
+    for width in widths + ([] if quick else [10000]):
+        cases.append(('Dense', dict(width=width),
+                      lambda width=width: dense_case(width)))
+    for width in widths:
+        cases.append(('connect', dict(width=width),
+                      lambda width=width: connect_case(width)))
+    for width in widths[:2]:
+        for depth in depths:
+            cases.append(('connect_layers', dict(width=width, depth=depth),
+                          lambda width=width, depth=depth:
+                          connect_layers_case(width, depth)))
+    for width in widths[:2]:
+        for depth in depths:
+            cases.append(('MultiLayerPerceptron',
+                          dict(width=width, depth=depth),
+                          lambda width=width, depth=depth:
+                          mlp_case(width, depth)))
+    for binary in (False, True):
+        cases.append(('figure_to_json', dict(width=100, depth=depths[-1],
+                                             binary=binary),
+                      lambda binary=binary:
+                      export_case(100, depths[-1], binary)))
+    for n_channels in channels:
+        for render_mode in ('shapes', 'traces'):
+            cases.append(('ConvNet2D',
+                          dict(channels=n_channels, render_mode=render_mode),
+                          lambda n_channels=n_channels,
+                          render_mode=render_mode:
+                          convnet_case(n_channels, render_mode)))
+    for name in ('mlp1.h5', 'mlp2.h5', 'mlp3.json'):
+        cases.append(('keras_loader', dict(file=name),
+                      lambda name=name: loader_case(name)))
+
+    return cases
+
+def measure(run, repeat=5):
+    """ Time a case and measure its peak memory.
+
+        Returns
+        -------
+        result: dict
+            Best and median wall time in seconds, peak
+            traced memory in bytes, and for figures the
+            no. of traces and shapes and JSON size.
+    """
+    times = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = run()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result = dict(best=min(times), median=float(np.median(times)),
+                  peak_bytes=peak)
+    if isinstance(output, dict) and 'data' in output:
+        result['n_traces'] = len(output['data'])
+        result['n_shapes'] = len(output['layout'].get('shapes', ()))
+        result['json_bytes'] = len(figure_to_json(output).encode('utf-8'))
+    elif isinstance(output, str):
+        result['json_bytes'] = len(output.encode('utf-8'))
+    return result
+
+def git_commit():
+    """ Commit of the working tree, or None outside git. """
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                       cwd=HERE, stderr=subprocess.DEVNULL,
+                                       universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def case_id(name, params):
+    return name + '(' + ', '.join(key + '=' + str(params[key])
+                                  for key in sorted(params)) + ')'
+
+def run_cases(cases, repeat=5, pattern=None):
+    results = list()
+    for name, params, setup in cases:
+        if pattern is not None and pattern not in case_id(name, params):
+            continue
+        result = dict(case=name, params=params)
+        result.update(measure(setup(), repeat=repeat))
+        results.append(result)
+        print('%-50s %9.4fs %10.1f kB' % (case_id(name, params),
+                                          result['best'],
+                                          result['peak_bytes']/1024))
+    return results
+
+def compare(results, baseline):
+    """ Print the ratio of the best times of the cases
+        found in both runs. """
+    old = {case_id(result['case'], result['params']): result
+           for result in baseline['results']}
+    print('\nCompared with ' + str(baseline.get('commit')))
+    for result in results:
+        key = case_id(result['case'], result['params'])
+        if key in old:
+            ratio = result['best']/old[key]['best']
+            flag = '  slower' if ratio > 1.2 else ''
+            print('%-50s %6.2fx%s' % (key, ratio, flag))
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description='Benchmark figure construction and export.')
+    parser.add_argument('-o', '--output', default=None,
+                        help='JSON file for the results')
+    parser.add_argument('-n', '--repeat', type=int, default=5,
+                        help='runs per case (default: 5)')
+    parser.add_argument('-k', '--filter', default=None,
+                        help='only run the cases containing this text')
+    parser.add_argument('--quick', action='store_true',
+                        help='smaller sweeps')
+    parser.add_argument('--compare', default=None,
+                        help='JSON results of an earlier run')
+    return parser
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+
+    results = run_cases(get_cases(quick=args.quick), repeat=args.repeat,
+                        pattern=args.filter)
+    report = dict(commit=git_commit(), time=time.time(),
+                  python=platform.python_version(),
+                  numpy=np.__version__, repeat=args.repeat,
+                  results=results)
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=1)
+    if args.compare is not None:
+        with open(args.compare, 'r') as f:
+            compare(results, json.load(f))
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
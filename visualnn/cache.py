@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+from collections import OrderedDict
+
+# Version of the figures, hashed into every key. Bump it when a
+# change to the library changes the figures it builds, so that
+# on-disk caches from older versions are not served
+FIGURE_VERSION = 1
+
+def _canonical(value):
+    """ JSON fallback for NumPy scalars and arrays in the
+        parameters of a figure key. """
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    raise TypeError('Cannot use ' + type(value).__name__ +
+                    ' in a figure key')
+
+def figure_key(kind, **params):
+    """ Get a canonical hash of the parameters of a
+        figure. Tuples and lists, and NumPy and Python
+        numbers, give the same key. The key changes with
+        FIGURE_VERSION.
+
+        Parameters
+        ----------
+        kind: string
+            Name of the visual model, e.g. 'ConvNet2D'.
+        params: keyword arguments
+            Architecture and style options.
+    """
+    text = json.dumps([FIGURE_VERSION, kind, params], sort_keys=True,
+                      separators=(',', ':'), default=_canonical)
+
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+class FigureCache:
+
+    def __init__(self, maxsize=128, cache_dir=None):
+        """ Bounded LRU cache of built figures, with an
+            optional on-disk tier. Figures returned by the
+            cache are shared, so treat them as read-only.
+
+            Parameters
+            ----------
+            maxsize: int
+                Maximum no. of figures kept in memory.
+            cache_dir: string or None
+                Directory for the on-disk tier. Figures
+                evicted from memory stay on disk and are
+                shared between processes.
+        """
+        if maxsize < 1:
+            raise ValueError('maxsize must be at least 1, got ' +
+                             str(maxsize))
+
+        self.maxsize = maxsize
+        self.cache_dir = cache_dir
+        if self.cache_dir is not None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._figures = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._figures)
+
+    def __contains__(self, key):
+        return key in self._figures or \
+            (self.cache_dir is not None and os.path.exists(self._path(key)))
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + '.json')
+
+    def _read(self, key):
+        """ Read a figure from the on-disk tier, or None. """
+        if self.cache_dir is None:
+            return None
+        try:
+            with open(self._path(key), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, key, figure):
+        """ Write a figure to the on-disk tier. The file is
+            replaced atomically so concurrent readers never
+            see a partial figure. """
+        from plotly.utils import PlotlyJSONEncoder
+
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(PlotlyJSONEncoder().encode(figure))
+            os.replace(tmp, self._path(key))
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+    def _store(self, key, figure):
+        """ Keep a figure in memory, evicting the least
+            recently used ones. Called with the lock held. """
+        self._figures[key] = figure
+        self._figures.move_to_end(key)
+        while len(self._figures) > self.maxsize:
+            self._figures.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key):
+        """ Get a figure, or None if it is not cached. """
+        with self._lock:
+            if key in self._figures:
+                self._figures.move_to_end(key)
+                self.hits += 1
+                return self._figures[key]
+
+        figure = self._read(key)
+        with self._lock:
+            if figure is None:
+                self.misses += 1
+            else:
+                self.disk_hits += 1
+                self._store(key, figure)
+        return figure
+
+    def put(self, key, figure):
+        """ Add a figure to the cache. """
+        with self._lock:
+            self._store(key, figure)
+        if self.cache_dir is not None:
+            self._write(key, figure)
+
+    def get_or_build(self, key, build):
+        """ Get a figure, building and adding it to the
+            cache with build() if it is not cached. """
+        figure = self.get(key)
+        if figure is None:
+            figure = build()
+            self.put(key, figure)
+        return figure
+
+    def clear(self):
+        """ Empty the in-memory tier and reset the counters.
+            The on-disk tier is left as it is. """
+        with self._lock:
+            self._figures.clear()
+            self.hits = self.disk_hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """ Get the counters of the cache as a dict. """
+        with self._lock:
+            return {'hits': self.hits,
+                    'disk_hits': self.disk_hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'size': len(self._figures),
+                    'maxsize': self.maxsize}
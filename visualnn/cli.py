@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+
+import argparse
+import glob
+import os
+import sys
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+# Extensions of the saved Keras models and architectures
+MODEL_EXTENSIONS = ('.h5', '.hdf5', '.json')
+
+# Output formats
+FORMATS = ('html', 'json', 'png', 'svg', 'pdf')
+
+def input_root(pattern):
+    """ Directory that a directory, file or glob pattern
+        starts from: the part of the pattern before its
+        first wildcard. """
+    if os.path.isdir(pattern):
+        return pattern
+    parts = list()
+    for part in os.path.normpath(pattern).split(os.sep):
+        if glob.has_magic(part):
+            break
+        parts.append(part)
+    else:
+        # A file, without wildcards
+        parts = parts[:-1]
+
+    return os.sep.join(parts) or os.curdir
+
+def find_models(inputs):
+    """ Get the model files for a list of directories,
+        files or glob patterns.
+
+        Parameters
+        ----------
+        inputs: list of strings
+            Directories, files or glob patterns.
+
+        Returns
+        -------
+        paths: list of (string, string) pairs
+            Sorted paths of the model files, without
+            duplicates, each with the root of the input
+            it was found from (see input_root()).
+    """
+    paths = dict()
+    for pattern in inputs:
+        root = input_root(pattern)
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, '*')
+        for path in glob.glob(pattern, recursive=True):
+            name = path.lower()
+            # Skip JSON figures written next to the models
+            if os.path.splitext(name)[0].endswith(MODEL_EXTENSIONS):
+                continue
+            if os.path.isfile(path) and name.endswith(MODEL_EXTENSIONS):
+                paths.setdefault(path, root)
+
+    return sorted(paths.items())
+
+def output_path(path, fmt, output_dir=None, root=None):
+    """ Path of the output file for a model file. The
+        format is appended to the full file name so that
+        mlp.h5 and mlp.json do not clash. In output_dir,
+        the outputs keep the path of the models relative
+        to root, so that a/mlp.h5 and b/mlp.h5 do not
+        clash either. """
+    if output_dir is None:
+        return path + '.' + fmt
+    if root is None:
+        root = os.path.dirname(path)
+
+    return os.path.join(output_dir, os.path.relpath(path, root) + '.' + fmt)
+
+def find_collisions(jobs):
+    """ Get the outputs written by more than one model, as
+        a dict of output to the list of models. """
+    models = dict()
+    for path, out in jobs:
+        models.setdefault(os.path.normpath(out), list()).append(path)
+
+    return dict((out, paths) for out, paths in models.items()
+                if len(paths) > 1)
+
+def is_up_to_date(path, out):
+    """ Whether the output exists and is newer than the
+        model file. """
+    return os.path.exists(out) and \
+        os.path.getmtime(out) >= os.path.getmtime(path)
+
+def load_figure(path):
+    """ Load a saved Keras model or architecture and get
+        the figure of its visual model, or of its graph of
+        layers if it is not sequential. """
+    from . import keras_loader
+
+    if path.lower().endswith('.json'):
+        modelConfig = keras_loader.loadConfigFromJSON(path)
+    else:
+        modelConfig = keras_loader.loadConfigFromFile(path)
+
+    try:
+        model = keras_loader.layersToVnn(
+            *keras_loader.loadFromConfig(modelConfig))
+    except ValueError:
+        # Branching models and layers that the sequential
+        # renderers do not know are drawn as a graph
+        model = keras_loader.graphToVnn(
+            *keras_loader.loadGraphFromConfig(modelConfig))
+
+    return model.to_figure()
+
+def convert(path, out, fmt, include_plotlyjs=True, binary=False):
+    """ Convert one model file. Runs in a worker process,
+        so errors are returned instead of raised.
+
+        Returns
+        -------
+        path: string
+            The model file.
+        seconds: float
+            Time taken.
+        error: string or None
+            The error, if the conversion failed.
+    """
+    start = time.perf_counter()
+    try:
+        from .backend import figure_to_html, figure_to_json
+
+        figure = load_figure(path)
+        if fmt == 'html':
+            with open(out, 'w') as f:
+                f.write(figure_to_html(figure, 
+                                       include_plotlyjs=include_plotlyjs,
+                                       binary=binary))
+        elif fmt == 'json':
+            with open(out, 'w') as f:
+                f.write(figure_to_json(figure, binary=binary))
+        else:
+            from .mpl_backend import figure_to_image
+            figure_to_image(figure, format=fmt, fp=out)
+        error = None
+    except Exception as e:
+        error = type(e).__name__ + ': ' + str(e)
+
+    return path, time.perf_counter() - start, error
+
+def write_plotlyjs(directories):
+    """ Write plotly.min.js in each directory that does
+        not have it yet. """
+    from .backend import get_plotlyjs
+
+    bundle = None
+    for directory in directories:
+        path = os.path.join(directory, 'plotly.min.js')
+        if os.path.exists(path):
+            continue
+        if bundle is None:
+            bundle = get_plotlyjs()
+        with open(path, 'w') as f:
+            f.write(bundle)
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        prog='visualnn',
+        description='Convert saved Keras models (.h5) and architectures '
+                    '(.json) to VisualNN figures.')
+    parser.add_argument('inputs', nargs='+',
+                        help='model files, directories or glob patterns '
+                             '(use ** to search recursively)')
+    parser.add_argument('-f', '--format', choices=FORMATS, default='html',
+                        help='output format, images are drawn with '
+                             'matplotlib (default: html)')
+    parser.add_argument('-o', '--output-dir', default=None,
+                        help='directory for the outputs, keeping the '
+                             'subdirectories of the inputs (default: next '
+                             'to each model)')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of worker processes (default: no. '
+                             'of CPUs)')
+    parser.add_argument('--plotlyjs', choices=('inline', 'cdn', 'directory'),
+                        default='inline',
+                        help='how HTML outputs get plotly.js (default: '
+                             'inline)')
+    parser.add_argument('--binary', action='store_true',
+                        help='write the coordinates of html and json outputs '
+                             'as base64 typed arrays')
+    parser.add_argument('--force', action='store_true',
+                        help='convert models whose output is up to date')
+
+    return parser
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+
+    paths = find_models(args.inputs)
+    if not paths:
+        print('No models found', file=sys.stderr)
+        return 1
+
+    outputs = [(path, output_path(path, args.format, args.output_dir, root))
+               for path, root in paths]
+    collisions = find_collisions(outputs)
+    if collisions:
+        for out, models in sorted(collisions.items()):
+            print('Models with the same output %s: %s' %
+                  (out, ', '.join(models)), file=sys.stderr)
+        return 1
+    for directory in set(os.path.dirname(out) for _, out in outputs):
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    include_plotlyjs = True if args.plotlyjs == 'inline' else args.plotlyjs
+
+    # Skip the models whose output is up to date
+    jobs = list()
+    skipped = list()
+    for path, out in outputs:
+        if not args.force and is_up_to_date(path, out):
+            skipped.append(path)
+        else:
+            jobs.append((path, out))
+
+    # Share one plotly.js bundle per output directory
+    if args.format == 'html' and args.plotlyjs == 'directory':
+        write_plotlyjs(set(os.path.dirname(out) for _, out in jobs))
+
+    start = time.perf_counter()
+    results = list()
+    if jobs:
+        with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+            futures = [executor.submit(convert, path, out, args.format,
+                                       include_plotlyjs, args.binary)
+                       for path, out in jobs]
+            for future in futures:
+                path, seconds, error = future.result()
+                results.append((path, seconds, error))
+                if error is None:
+                    print('ok    %8.3fs  %s' % (seconds, path))
+                else:
+                    print('FAIL  %8.3fs  %s  (%s)' % (seconds, path, error))
+    for path in skipped:
+        print('skip  %9s  %s' % ('', path))
+
+    failed = [result for result in results if result[2] is not None]
+    print('%d converted, %d skipped, %d failed in %.3fs' %
+          (len(results) - len(failed), len(skipped), len(failed),
+           time.perf_counter() - start))
+
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,13 +1,48 @@
 import numpy as np
-import plotly.graph_objs as go
 
-from plotly.offline import plot
+from collections import OrderedDict
+from .backend import BuiltFigureMixin
+from .folding import find_repeats, fold_indices, get_badges, shape_tokens
+from .instrument import stage
+
+def channel_depth(n_channels, max_drawn_channels=None):
+    """ Depth of a conv stack, in channel offsets. Above
+        max_drawn_channels the depth grows logarithmically
+        with the no. of channels instead of linearly.
+        
+        Parameters
+        ----------
+        n_channels: int
+            No. of channels of the layer.
+        max_drawn_channels: int or None
+            Maximum no. of channels drawn for the layer.
+    """
+    if max_drawn_channels is None or n_channels <= max_drawn_channels:
+        return n_channels
+    
+    return max_drawn_channels*(1 + np.log(n_channels/max_drawn_channels))
 
 class Conv2DLeNetStyle:
     
     def __init__(self, x_init, y_mid, layer_shape=(10, 20), 
                  n_channels=10, col1=(128, 0, 128), col2=(45, 0, 65),
-                 x_shift=2, y_shift=5, transparency=0.9):
+                 x_shift=2, y_shift=5, transparency=0.9,
+                 max_drawn_channels=None, values=None, value_range=None):
+        """ Class to represent a convolutional layer as a 
+            stack of offset rectangles, one per channel.
+            
+            With max_drawn_channels, wider layers draw a
+            representative sample of that many channels 
+            over a logarithmically scaled depth, and the 
+            label keeps the true no. of channels.
+            
+            With values, one per channel (such as the mean
+            activation), the rectangles are filled with the
+            colors of a colorscale over value_range.
+        """
+        if max_drawn_channels is not None and max_drawn_channels < 1:
+            raise ValueError('max_drawn_channels must be at least 1, got '
+                             + str(max_drawn_channels))
         
         self.x_init = x_init
         self.y_mid = y_mid
@@ -17,8 +52,26 @@ class Conv2DLeNetStyle:
         self.n_w = int(self.n_h/2)
         
         self.n_c = n_channels
+        self.n_drawn = self.n_c
+        if max_drawn_channels is not None:
+            self.n_drawn = min(self.n_c, max_drawn_channels)
+        self.depth = channel_depth(self.n_c, max_drawn_channels)
+        # Channels drawn, evenly spread over the layer
+        self.channels = np.round(np.linspace(0, self.n_c - 1, 
+                                             self.n_drawn)).astype(int)
         
-        if self.n_c % 2 == 0:
+        self.channel_colors = None
+        if values is not None:
+            from .activations import get_colors, value_range as get_range
+            values = np.asarray(values, dtype=float)
+            if len(values) != self.n_c:
+                raise ValueError('Expected ' + str(self.n_c) + 
+                                 ' values, got ' + str(len(values)))
+            vmin, vmax = value_range or get_range([values])
+            self.channel_colors = get_colors(values[self.channels], 
+                                             vmin, vmax)
+        
+        if self.n_drawn % 2 == 0:
             self.col1 = col1
             self.col2 = col2
         else:
@@ -29,9 +82,17 @@ class Conv2DLeNetStyle:
         
         self.x_shift = x_shift
         self.y_shift = y_shift
+        
+        # Offset between two drawn channels
+        if self.n_drawn > 1:
+            step = (self.depth - 1)/(self.n_drawn - 1)
+        else:
+            step = 1
+        self.x_step = self.x_shift*step
+        self.y_step = self.y_shift*step
 
-        self.x_mid_init_box = self.x_init - (self.x_shift * self.n_c/2)
-        self.y_mid_init_box = self.y_mid + (self.y_shift * self.n_c/2)
+        self.x_mid_init_box = self.x_init - (self.x_shift * self.depth/2)
+        self.y_mid_init_box = self.y_mid + (self.y_shift * self.depth/2)
 
         self.x0 = self.x_mid_init_box - self.n_w/2
         self.x1 = self.x_mid_init_box + self.n_w/2
@@ -42,7 +103,8 @@ class Conv2DLeNetStyle:
         
         self.layer_text = str(self.n_c) + '@' + str(self.height) + 'x' + str(2*self.width)
         
-        self.data = [go.Scatter(
+        self.data = [dict(
+                type='scatter',
                 x=[self.x0],
                 y=[int(15*self.y1/14)],
                 text=[self.layer_text],
@@ -67,10 +129,12 @@ class Conv2DLeNetStyle:
                   1: self._color_layer(self.col2)}
 
         shapes = list()
-        for i in range(self.n_c):
+        for i in range(self.n_drawn):
             choice = i % 2
 
             lcolor, fcolor = colors[choice]
+            if self.channel_colors is not None:
+                lcolor, fcolor = self._color_layer(self.channel_colors[i])
 
             shapes.append({
                 'type': 'rect',
@@ -86,11 +150,11 @@ class Conv2DLeNetStyle:
             })
 
             
-            if i != self.n_c - 1:
-                x0 += self.x_shift
-                x1 += self.x_shift
-                y0 -= self.y_shift
-                y1 -= self.y_shift
+            if i != self.n_drawn - 1:
+                x0 += self.x_step
+                x1 += self.x_step
+                y0 -= self.y_step
+                y1 -= self.y_step
 
         self.lower_right_corner = (x1, y0)
         
@@ -150,7 +214,8 @@ class DenseLeNetStyle:
         self.y0 = int(self.y_mid - self.height/2)
         self.y1 = int(self.y_mid + self.height/2)
         
-        self.data = [go.Scatter(
+        self.data = [dict(
+                type='scatter',
                 x=[self.x_init],
                 y=[self.y_mid + self.height*17/28],
                 text=['Dense (' + str(self.num_neurons) + ')'],
@@ -196,10 +261,269 @@ class DenseLeNetStyle:
         return shapes
 
 
-class ConvNet2D:
+def _visible_polygon(shape, above):
+    """ Get the corners of the part of a rect left visible
+        by the rect drawn above it, when that one is the
+        same rect shifted by less than its size, as the
+        channels of a conv stack are: an L shape. The
+        whole rect otherwise.
+        
+        Parameters
+        ----------
+        shape: dict
+            A rect shape.
+        above: dict or None
+            The shape drawn right after it.
+            
+        Returns
+        -------
+        x, y: lists
+            Corners of the polygon, or None if the rect
+            is fully covered.
+    """
+    x0, y0, x1, y1 = (float(shape[key]) for key in ('x0', 'y0', 'x1', 'y1'))
+    if above is None or above['type'] != 'rect':
+        return [x0, x1, x1, x0], [y0, y0, y1, y1]
     
-    def __init__(self, layers_conv, layers_dense, scaling_factor=2):
-        prods = np.array([layers_conv[i][0]*layers_conv[i][2]/3 for i in range(len(layers_conv))])
+    dx, dy = float(above['x0']) - x0, float(above['y0']) - y0
+    shifted = np.isclose(float(above['x1']) - x1, dx) and \
+        np.isclose(float(above['y1']) - y1, dy)
+    if not shifted or abs(dx) >= abs(x1 - x0) or abs(dy) >= abs(y1 - y0):
+        return [x0, x1, x1, x0], [y0, y0, y1, y1]
+    if dx == 0 and dy == 0:
+        return None
+    
+    # Sides away from the shift stay visible, the others are
+    # cut at the edges of the rect above
+    xa, xc = (x0, x1) if dx >= 0 else (x1, x0)
+    ya, yc = (y1, y0) if dy <= 0 else (y0, y1)
+    xb, yb = xa + dx, ya + dy
+    return [xa, xb, xb, xc, xc, xa], [yc, yc, yb, yb, ya, ya]
+
+def shapes_to_traces(shapes):
+    """ Convert rect and line layout shapes into batched
+        scatter traces. Rects with the same style become
+        one fill='toself' trace of NaN-separated polygons
+        and lines with the same style become one line
+        trace, so Plotly has far fewer objects to redraw
+        on zoom and pan than with layout shapes.
+        
+        Batching changes the drawing order, so each rect
+        covered by the next one, like the channels of a
+        conv stack, is reduced to its visible part first
+        (see _visible_polygon()) and the picture stays
+        the same.
+        
+        Parameters
+        ----------
+        shapes: list of dicts
+            Layout shapes of type 'rect' or 'line'.
+            
+        Returns
+        -------
+        data: list of dicts
+            The traces, in the order in which each style
+            first appears.
+    """
+    with stage('convnet.batch_traces', shapes=len(shapes)) as record:
+        groups = OrderedDict()
+        for i, shape in enumerate(shapes):
+            key = (shape['type'], shape['line']['color'], 
+                   shape['line']['width'], shape.get('fillcolor'))
+            if shape['type'] == 'rect':
+                above = shapes[i + 1] if i + 1 < len(shapes) else None
+                points = _visible_polygon(shape, above)
+                if points is None:
+                    continue
+                # Closed polygon, then a gap
+                x, y = points
+                points = x + x[:1] + [np.nan], y + y[:1] + [np.nan]
+            else:
+                points = ([shape['x0'], shape['x1'], np.nan], 
+                          [shape['y0'], shape['y1'], np.nan])
+            group = groups.setdefault(key, (list(), list()))
+            group[0].extend(points[0])
+            group[1].extend(points[1])
+    
+        data = list()
+        for (kind, lcolor, lwidth, fcolor), (x, y) in groups.items():
+            trace = dict(type='scatter', mode='lines', hoverinfo='skip',
+                         line=dict(color=lcolor, width=lwidth),
+                         x=np.array(x, dtype=float), 
+                         y=np.array(y, dtype=float))
+            if kind == 'rect':
+                trace['fill'] = 'toself'
+                trace['fillcolor'] = fcolor
+            data.append(trace)
+        record['traces'] = len(data)
+    
+    return data
+
+def figure_ranges(shapes, data, margin=0.05):
+    """ Get square x and y axis ranges around everything a
+        figure draws: its rect and line shapes and the
+        points of its traces.
+        
+        Parameters
+        ----------
+        shapes: list of dicts
+            Layout shapes, with x0, y0, x1 and y1.
+        data: list of dicts
+            Traces. Missing points (None, NaN) are skipped.
+        margin: float
+            Space left on each side, as a fraction of the
+            range.
+            
+        Returns
+        -------
+        x_range, y_range: lists
+            [min, max] of each axis, of the same length so
+            that the layers keep their proportions.
+    """
+    xs = [shape[key] for shape in shapes for key in ('x0', 'x1')]
+    ys = [shape[key] for shape in shapes for key in ('y0', 'y1')]
+    for trace in data:
+        xs += [x for x in trace.get('x', ()) if x is not None]
+        ys += [y for y in trace.get('y', ()) if y is not None]
+    xs = np.array(xs, dtype=float)
+    ys = np.array(ys, dtype=float)
+    xs, ys = xs[np.isfinite(xs)], ys[np.isfinite(ys)]
+    
+    x_mid = (xs.min() + xs.max())/2
+    y_mid = (ys.min() + ys.max())/2
+    half = max(xs.max() - xs.min(), ys.max() - ys.min())*(0.5 + margin)
+    x_range = [float(x_mid - half), float(x_mid + half)]
+    y_range = [float(y_mid - half), float(y_mid + half)]
+    return x_range, y_range
+
+class ConvNet2D(BuiltFigureMixin):
+    
+    def __init__(self, layers_conv, layers_dense, scaling_factor=2, 
+                 cache=None, render_mode='shapes', max_drawn_channels=None,
+                 fold=False, min_repeats=2, activations=None):
+        """ Class for visual representation of a 2D 
+            convolutional neural network.
+            
+            Parameters
+            ----------
+            layers_conv: list of tuples
+                (width, height, channels) of each 
+                convolutional layer.
+            layers_dense: list
+                Sizes of each fully connected layer.
+            scaling_factor: int or float
+                Height of the dense layers per neuron.
+            cache: cache.FigureCache or None
+                Cache for the figure, shared by networks
+                with the same architecture.
+            render_mode: string
+                'shapes' draws the layers and connectors
+                as layout shapes. 'traces' batches them
+                into a few filled scatter traces, which
+                is much faster to zoom and pan for wide
+                conv stacks.
+            max_drawn_channels: int or None
+                Maximum no. of channels drawn per conv
+                layer. Deeper stacks are sampled and their
+                depth scales logarithmically, which bounds 
+                the size and build cost of each layer.
+            fold: bool
+                Set true to draw layers repeated back to
+                back (same shapes in and out) once, with an
+                "×N" badge. See expand().
+            min_repeats: int
+                Minimum no. of copies of a block to fold.
+            activations: list of np.ndarray or None
+                Value of each channel of each conv layer, 
+                then of each neuron of each dense layer, 
+                such as the mean activations over a set of
+                inputs (see keras_loader.kerasToVnn()). The
+                channels are filled with the colors of a
+                colorscale, the dense layers with the color
+                of their mean. Networks with activations 
+                are not cached.
+        """
+        if render_mode not in ('shapes', 'traces'):
+            raise ValueError('Unknown render_mode ' + repr(render_mode) + 
+                             ", expected 'shapes' or 'traces'")
+        
+        self.layers_conv = layers_conv
+        self.layers_dense = layers_dense
+        self.scaling_factor = scaling_factor
+        self.cache = cache
+        self.render_mode = render_mode
+        self.max_drawn_channels = max_drawn_channels
+        self.fold = fold
+        self.min_repeats = min_repeats
+        self.activations = activations
+        
+        if activations is not None and \
+                len(activations) != len(layers_conv) + len(layers_dense):
+            raise ValueError('Expected activations for ' + 
+                             str(len(layers_conv) + len(layers_dense)) + 
+                             ' layers, got ' + str(len(activations)))
+        
+        if self.cache is None or activations is not None:
+            self.fig = self._timed_build()
+        else:
+            from .cache import figure_key
+            key = figure_key('ConvNet2D', layers_conv=layers_conv,
+                             layers_dense=layers_dense, 
+                             scaling_factor=scaling_factor,
+                             render_mode=render_mode,
+                             max_drawn_channels=max_drawn_channels,
+                             fold=fold, min_repeats=min_repeats)
+            self.fig = self.cache.get_or_build(key, self._timed_build)
+    
+    def _timed_build(self,):
+        """ _build_figure(), as an instrumented stage. """
+        with stage('convnet.build', conv_layers=len(self.layers_conv),
+                   dense_layers=len(self.layers_dense)) as record:
+            fig = self._build_figure()
+            record['traces'] = len(fig['data'])
+            record['shapes'] = len(fig['layout'].get('shapes', ()))
+        return fig
+    
+    def _fold(self, layers):
+        """ Get the drawn layers, their indices and the 
+            folded blocks of a list of layers. """
+        if not self.fold:
+            return layers, list(range(len(layers))), list()
+        repeats = find_repeats(shape_tokens(layers), self.min_repeats)
+        kept, blocks = fold_indices(len(layers), repeats)
+        return [layers[i] for i in kept], kept, blocks
+    
+    def expand(self):
+        """ Get a copy of the network with its folded 
+            blocks drawn in full. """
+        return ConvNet2D(self.layers_conv, self.layers_dense,
+                         scaling_factor=self.scaling_factor,
+                         cache=self.cache, render_mode=self.render_mode,
+                         max_drawn_channels=self.max_drawn_channels,
+                         activations=self.activations)
+        
+    def _build_figure(self,):
+        layers_conv, conv_kept, conv_blocks = self._fold(self.layers_conv)
+        layers_dense, dense_kept, dense_blocks = self._fold(self.layers_dense)
+        scaling_factor = self.scaling_factor
+        max_drawn_channels = self.max_drawn_channels
+        
+        # Values of the drawn layers, on one colorscale
+        conv_values = [None]*len(layers_conv)
+        scale_range = None
+        dense_colors = [(128, 0, 128)]*len(layers_dense)
+        if self.activations is not None:
+            from .activations import get_colors, value_range
+            n_conv = len(self.layers_conv)
+            conv_values = [self.activations[i] for i in conv_kept]
+            dense_values = [self.activations[n_conv + i] for i in dense_kept]
+            vmin, vmax = value_range(conv_values + dense_values)
+            scale_range = (vmin, vmax)
+            dense_colors = get_colors([np.mean(v) for v in dense_values], 
+                                      vmin, vmax)
+        
+        depths = [channel_depth(n_c, max_drawn_channels) for _, _, n_c in layers_conv]
+        prods = np.array([layers_conv[i][0]*depths[i]/3 for i in range(len(layers_conv))])
 
         y_mid = np.max(prods)
         x_shift = 2*y_mid/100
@@ -211,11 +535,14 @@ class ConvNet2D:
         for i in range(len(layers_conv)):
             n_w, n_h, n_c = layers_conv[i]
             if i != 0:
-                x_curr += 11/10*n_w + x_shift*n_c/2
+                x_curr += 11/10*n_w + x_shift*depths[i]/2
             conv_layers.append(Conv2DLeNetStyle(x_curr, y_mid, 
                                             layer_shape=(int(n_w/2), n_h), 
                                             n_channels=n_c, x_shift=x_shift, 
-                                            y_shift=y_shift))
+                                            y_shift=y_shift,
+                                            max_drawn_channels=max_drawn_channels,
+                                            values=conv_values[i],
+                                            value_range=scale_range))
 
 
         all_data = []
@@ -260,7 +587,8 @@ class ConvNet2D:
         dense_layers = []
         for i in range(len(layers_dense)):
             x_init += 3*const_width
-            dense_layers.append(DenseLeNetStyle(x_init, y_mid, const_width, layers_dense[i], layers_dense[i]))
+            dense_layers.append(DenseLeNetStyle(x_init, y_mid, const_width, layers_dense[i], layers_dense[i],
+                                                color=dense_colors[i]))
 
         for i in range(len(dense_layers)):
             all_data += dense_layers[i].layer_data()
@@ -318,15 +646,66 @@ class ConvNet2D:
         }]
 
         layout = {
-            'xaxis': {'range': [0, int(2*y_mid)], 'showgrid': False, 'showticklabels': False},
-            'yaxis': {'range': [0, int(2*y_mid)], 'showgrid': False, 'showticklabels': False},
-            'shapes': all_shapes
+            'xaxis': {'showgrid': False, 'showticklabels': False},
+            'yaxis': {'showgrid': False, 'showticklabels': False},
         }
+        
+        # Colorbar of the activations, on an empty trace
+        if self.activations is not None:
+            from .activations import COLORSCALE
+            all_data.append(dict(type='scatter', x=[None], y=[None], 
+                                 mode='markers', hoverinfo='skip',
+                                 marker=dict(colorscale=COLORSCALE, 
+                                             cmin=vmin, cmax=vmax, 
+                                             color=[vmin], showscale=True)))
+        
+        # Axis ranges fitting the boxes as they are placed, which
+        # sampled deep stacks can push far from y_mid
+        x_range, y_range = figure_ranges(all_shapes, all_data)
+        
+        if self.render_mode == 'traces':
+            all_data = shapes_to_traces(all_shapes) + all_data
+            layout['showlegend'] = False
+        else:
+            layout['shapes'] = all_shapes
+        
+        # Badges of the folded blocks, labels included
+        if conv_blocks or dense_blocks:
+            conv_extents = [(layer.x0, layer.lower_right_corner[0],
+                             layer.lower_right_corner[1], 15*layer.y1/14)
+                            for layer in conv_layers]
+            dense_extents = [(layer.x0, layer.x1, layer.y0, 
+                              layer.y_mid + layer.height*17/28)
+                             for layer in dense_layers]
+            shapes, annotations = get_badges(conv_blocks, conv_extents, 
+                                             pad=x_shift)
+            dense_shapes, dense_annotations = get_badges(dense_blocks, 
+                                                         dense_extents,
+                                                         pad=x_shift)
+            layout['shapes'] = layout.get('shapes', list()) + shapes + \
+                dense_shapes
+            layout['annotations'] = annotations + dense_annotations
+            x_range, y_range = figure_ranges(
+                all_shapes + shapes + dense_shapes, all_data)
+        
+        layout['xaxis']['range'] = x_range
+        layout['yaxis']['range'] = y_range
 
-        self.fig = {
+        return {
             'data': all_data,
             'layout': layout,
         }
         
-    def plot(self,):
-        plot(self.fig)
\ No newline at end of file
+    def plot(self, backend='svg'):
+        """ Plot the network.
+            
+            Parameters
+            ----------
+            backend: string
+                'svg' for scatter traces or 'webgl' for
+                scattergl traces. With render_mode 
+                'shapes', the layers and connectors are 
+                layout shapes, which are always SVG.
+        """
+        from plotly.offline import plot
+        plot(self.to_figure(backend=backend))
\ No newline at end of file
@@ -1,4 +1,4 @@
-from convnet import ConvNet2D
+from visualnn.convnet import ConvNet2D
 
 layers_conv = [(200, 200, 12),
           (100, 100, 6),
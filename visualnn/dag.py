@@ -0,0 +1,388 @@
+#!/usr/bin/env python
+""" Graphs of layers, for models with branches and merges.
+
+The layers of a functional model are placed with a layered
+(Sugiyama style) layout: each layer gets the rank of its
+longest path from an input, long edges are split by dummy
+nodes so that every edge spans one rank, and a few barycenter
+sweeps reorder the ranks to reduce crossings. Skip connections
+are then drawn as polylines through their dummy nodes.
+
+    graph = keras_loader.loadGraphFromFile('model.h5')
+    graph.to_image(fp='model.png')
+
+By default the boxes of the layers are batched into a few
+filled traces, as ConvNet2D does with render_mode='traces'.
+"""
+
+import numpy as np
+
+from .backend import BuiltFigureMixin
+from .convnet import DenseLeNetStyle, shapes_to_traces
+from .instrument import stage
+
+# Colors of the layer boxes, by kind of output
+NODE_COLORS = {'conv': (128, 0, 128),
+               'dense': (45, 0, 65),
+               'merge': (0, 110, 160),
+               'other': (120, 120, 120)}
+
+# Layers that combine several inputs
+MERGE_LAYERS = ('Add', 'Subtract', 'Multiply', 'Average', 'Maximum',
+                'Minimum', 'Concatenate', 'Dot')
+
+def topological_order(n_nodes, edges):
+    """ Order the nodes of a DAG so that every edge goes
+        from an earlier to a later node (Kahn's
+        algorithm). Ties keep the order of the nodes.
+
+        Parameters
+        ----------
+        n_nodes: int
+            No. of nodes.
+        edges: list of pairs
+            (source, target) node indices.
+    """
+    succs = [list() for _ in range(n_nodes)]
+    n_preds = np.zeros(n_nodes, dtype=int)
+    for u, v in edges:
+        succs[u].append(v)
+        n_preds[v] += 1
+
+    ready = [v for v in range(n_nodes) if n_preds[v] == 0][::-1]
+    order = list()
+    while ready:
+        u = ready.pop()
+        order.append(u)
+        for v in reversed(succs[u]):
+            n_preds[v] -= 1
+            if n_preds[v] == 0:
+                ready.append(v)
+
+    if len(order) != n_nodes:
+        raise ValueError('The layer graph has a cycle')
+
+    return order
+
+def layer_ranks(n_nodes, edges):
+    """ Rank of each node with longest-path layering:
+        sources get rank 0 and every other node the rank
+        right after its latest input.
+    """
+    preds = [list() for _ in range(n_nodes)]
+    for u, v in edges:
+        preds[v].append(u)
+
+    ranks = np.zeros(n_nodes, dtype=int)
+    for v in topological_order(n_nodes, edges):
+        if preds[v]:
+            ranks[v] = max(ranks[u] for u in preds[v]) + 1
+
+    return ranks
+
+def add_dummy_nodes(ranks, edges):
+    """ Split the edges spanning more than one rank into
+        chains of dummy nodes, one per rank crossed, so
+        that crossing minimization and routing only deal
+        with edges between adjacent ranks.
+
+        Returns
+        -------
+        ranks: np.ndarray
+            Ranks of the nodes, followed by the dummies.
+        edges: list of pairs
+            Edges between adjacent ranks.
+        routes: list of lists
+            Nodes visited by each original edge, from
+            its source to its target.
+    """
+    ranks = list(ranks)
+    short_edges = list()
+    routes = list()
+    for u, v in edges:
+        route = [u]
+        for rank in range(ranks[u] + 1, ranks[v]):
+            ranks.append(rank)
+            route.append(len(ranks) - 1)
+        route.append(v)
+        short_edges += zip(route[:-1], route[1:])
+        routes.append(route)
+
+    return np.array(ranks, dtype=int), short_edges, routes
+
+def count_crossings(rows, positions, edges):
+    """ No. of edge crossings of an ordering. Two edges
+        between the same pair of ranks cross when their
+        ends are in opposite orders.
+    """
+    edges = np.array(edges, dtype=int).reshape(-1, 2)
+    if not len(edges):
+        return 0
+
+    rank = rows[edges[:, 0]]
+    pos_u = positions[edges[:, 0]]
+    pos_v = positions[edges[:, 1]]
+
+    crossings = 0
+    for r in np.unique(rank):
+        u = pos_u[rank == r]
+        v = pos_v[rank == r]
+        du = u[:, None] - u[None, :]
+        dv = v[:, None] - v[None, :]
+        crossings += np.count_nonzero(du*dv < 0)//2
+
+    return crossings
+
+def order_nodes(ranks, edges, n_sweeps=8):
+    """ Order the nodes within each rank to reduce the
+        no. of edge crossings, with the barycenter
+        heuristic: alternately sweep down and up the
+        ranks, moving each node to the mean position of
+        its neighbours in the previous rank.
+
+        Parameters
+        ----------
+        ranks: np.ndarray
+            Rank of each node, see add_dummy_nodes().
+        edges: list of pairs
+            Edges between adjacent ranks.
+        n_sweeps: int
+            Maximum no. of sweeps.
+
+        Returns
+        -------
+        positions: np.ndarray
+            Position of each node within its rank.
+    """
+    n_nodes = len(ranks)
+    n_ranks = ranks.max() + 1 if n_nodes else 0
+
+    preds = [list() for _ in range(n_nodes)]
+    succs = [list() for _ in range(n_nodes)]
+    for u, v in edges:
+        preds[v].append(u)
+        succs[u].append(v)
+
+    # Start from the order of the nodes in the model
+    rows = [list() for _ in range(n_ranks)]
+    for v in range(n_nodes):
+        rows[ranks[v]].append(v)
+    positions = np.zeros(n_nodes, dtype=float)
+    for row in rows:
+        positions[row] = np.arange(len(row))
+
+    best = positions.copy()
+    best_crossings = count_crossings(ranks, positions, edges)
+
+    for sweep in range(n_sweeps):
+        if best_crossings == 0:
+            break
+        if sweep % 2 == 0:
+            sweep_ranks, neighbours = range(1, n_ranks), preds
+        else:
+            sweep_ranks, neighbours = range(n_ranks - 2, -1, -1), succs
+
+        for r in sweep_ranks:
+            row = rows[r]
+            keys = [np.mean(positions[neighbours[v]]) if neighbours[v]
+                    else positions[v] for v in row]
+            # Stable sort, ties keep their current order
+            row = [row[i] for i in np.argsort(keys, kind='stable')]
+            rows[r] = row
+            positions[row] = np.arange(len(row))
+
+        crossings = count_crossings(ranks, positions, edges)
+        if crossings < best_crossings:
+            best, best_crossings = positions.copy(), crossings
+
+    return best
+
+def layout_graph(n_nodes, edges, x_step=100, y_step=60):
+    """ Layered (Sugiyama style) layout of a DAG: rank
+        the nodes, add dummy nodes on long edges, reduce
+        crossings and center each rank vertically. Ranks
+        go from left to right.
+
+        Parameters
+        ----------
+        n_nodes: int
+            No. of nodes.
+        edges: list of pairs
+            (source, target) node indices.
+        x_step: int or float
+            Distance between two ranks.
+        y_step: int or float
+            Distance between two nodes of a rank.
+
+        Returns
+        -------
+        x, y: np.ndarray
+            Coordinates of the nodes, followed by those
+            of the dummy nodes.
+        routes: list of lists
+            Nodes visited by each edge, see
+            add_dummy_nodes().
+    """
+    ranks, short_edges, routes = add_dummy_nodes(layer_ranks(n_nodes, edges),
+                                                 edges)
+    positions = order_nodes(ranks, short_edges)
+
+    sizes = np.bincount(ranks)
+    x = ranks*float(x_step)
+    y = ((sizes[ranks] - 1)/2 - positions)*y_step
+
+    return x, y, routes
+
+def get_routes(x, y, routes, box_width):
+    """ Polylines of the edges as NaN-separated
+        coordinates, from the right side of the source
+        box through the dummy nodes to the left side of
+        the target box.
+    """
+    xs = list()
+    ys = list()
+    for route in routes:
+        xs += [x[route[0]] + box_width/2] + [x[v] for v in route[1:-1]] + \
+              [x[route[-1]] - box_width/2, np.nan]
+        ys += [y[v] for v in route] + [np.nan]
+
+    return np.array(xs, dtype=float), np.array(ys, dtype=float)
+
+def node_kind(layer_class, shape):
+    """ Kind of a node, used to color its box. """
+    if layer_class in MERGE_LAYERS:
+        return 'merge'
+    if shape is None:
+        return 'other'
+    if len(shape) == 3:
+        return 'conv'
+    if len(shape) == 1:
+        return 'dense'
+    return 'other'
+
+def shape_text(shape):
+    """ Short text of an output shape, in the style of
+        the ConvNet2D labels. """
+    if shape is None:
+        return '?'
+    shape = ['?' if dim is None else str(dim) for dim in shape]
+    if len(shape) == 3:
+        return shape[2] + '@' + shape[0] + 'x' + shape[1]
+    return '(' + ', '.join(shape) + ')'
+
+class LayerGraph(BuiltFigureMixin):
+
+    def __init__(self, nodes, edges, cache=None, render_mode='traces',
+                 x_step=100, y_step=60, box_width=60, box_height=30):
+        """ Class for visual representation of a network
+            as a graph of layers, for models with
+            branches, merges and skip connections.
+
+            Parameters
+            ----------
+            nodes: list
+                [class name, output shape, name] of each
+                layer, see keras_loader.loadGraphFromConfig().
+                The output shape can be None if unknown.
+            edges: list of pairs
+                (source, target) indices into nodes.
+            cache: cache.FigureCache or None
+                Cache for the figure, shared by networks
+                with the same graph.
+            render_mode: string
+                'traces' batches the boxes into a few
+                filled scatter traces, 'shapes' draws them
+                as layout shapes, as in ConvNet2D.
+            x_step, y_step: int or float
+                Distance between two ranks, and between
+                two layers of a rank.
+            box_width, box_height: int or float
+                Size of the box of a layer.
+        """
+        if render_mode not in ('shapes', 'traces'):
+            raise ValueError('Unknown render_mode ' + repr(render_mode) +
+                             ", expected 'shapes' or 'traces'")
+
+        self.nodes = nodes
+        self.edges = edges
+        self.cache = cache
+        self.render_mode = render_mode
+        self.x_step = x_step
+        self.y_step = y_step
+        self.box_width = box_width
+        self.box_height = box_height
+
+        if self.cache is None:
+            self.fig = self._build_figure()
+        else:
+            from .cache import figure_key
+            key = figure_key('LayerGraph', nodes=nodes, edges=edges,
+                             render_mode=render_mode, x_step=x_step,
+                             y_step=y_step, box_width=box_width,
+                             box_height=box_height)
+            self.fig = self.cache.get_or_build(key, self._build_figure)
+
+    def _build_figure(self,):
+        n_nodes = len(self.nodes)
+        with stage('dag.layout', nodes=n_nodes,
+                   edges=len(self.edges)) as record:
+            x, y, routes = layout_graph(n_nodes, self.edges,
+                                        x_step=self.x_step, 
+                                        y_step=self.y_step)
+            record['dummies'] = len(x) - n_nodes
+
+        edge_x, edge_y = get_routes(x, y, routes, self.box_width)
+        all_data = [dict(type='scatter', mode='lines', x=edge_x, y=edge_y,
+                         hoverinfo='skip',
+                         line=dict(color='rgb(0, 0, 0)', width=1))]
+
+        all_shapes = list()
+        text = list()
+        hovertext = list()
+        for i, (layer_class, shape, name) in enumerate(self.nodes):
+            box = DenseLeNetStyle(x[i], y[i], self.box_width, self.box_height,
+                                  None,
+                                  color=NODE_COLORS[node_kind(layer_class,
+                                                              shape)])
+            all_shapes += box.layer_shapes()
+            text.append(layer_class + '<br>' + shape_text(shape))
+            hovertext.append(name + '<br>' + layer_class + ' ' +
+                             shape_text(shape))
+
+        labels = dict(type='scatter', mode='text', x=x[:n_nodes],
+                      y=y[:n_nodes], text=text, hovertext=hovertext,
+                      hoverinfo='text', textfont=dict(color='white', size=9))
+
+        layout = {
+            'xaxis': {'range': [x.min() - self.x_step/2,
+                                x.max() + self.x_step/2],
+                      'showgrid': False, 'showticklabels': False,
+                      'zeroline': False},
+            'yaxis': {'range': [y.min() - self.y_step, y.max() + self.y_step],
+                      'showgrid': False, 'showticklabels': False,
+                      'zeroline': False},
+            'showlegend': False,
+        }
+
+        if self.render_mode == 'traces':
+            all_data += shapes_to_traces(all_shapes)
+        else:
+            layout['shapes'] = all_shapes
+        all_data.append(labels)
+
+        return {
+            'data': all_data,
+            'layout': layout,
+        }
+
+    def plot(self, backend='svg'):
+        """ Plot the network.
+
+            Parameters
+            ----------
+            backend: string
+                'svg' for scatter traces or 'webgl' for
+                scattergl traces.
+        """
+        from plotly.offline import plot
+        plot(self.to_figure(backend=backend))
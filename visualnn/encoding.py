@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+
+import base64
+
+import numpy as np
+
+# Coordinates written to the figures
+COORD_KEYS = ('x', 'y')
+
+# Range of int16 typed arrays
+INT16_MIN, INT16_MAX = -2**15, 2**15 - 1
+
+def _whole_int16(values):
+    """ Get an array as whole numbers, or None if it has
+        other values or does not fit in int16. """
+    whole = np.round(values)
+    if values.size and np.isfinite(values).all() and \
+            np.allclose(values, whole, rtol=0, atol=1e-6) and \
+            whole.min() >= INT16_MIN and whole.max() <= INT16_MAX:
+        return whole
+    return None
+
+def encode_array(values, step=None):
+    """ Encode a coordinate array as a Plotly typed array,
+        i.e. base64 little-endian binary data. Arrays of
+        whole numbers that fit are written as int16, the
+        others as float32. NaN (gaps) is kept as NaN.
+
+        Parameters
+        ----------
+        values: np.ndarray or list
+            The coordinates. None is read as NaN.
+        step: float or None
+            Quantization step. Coordinates are rounded to
+            a multiple of it, unless they are all whole
+            numbers.
+
+        Returns
+        -------
+        typed_array: dict
+            {'dtype': 'i2' or 'f4', 'bdata': base64 text}
+    """
+    values = np.asarray(values, dtype=float)
+    whole = _whole_int16(values)
+    if whole is None and step:
+        # Whole numbers are left as they are, rounding would
+        # only move them off the int16 path
+        values = np.round(values/step)*step
+        whole = _whole_int16(values)
+
+    if whole is not None:
+        buffer = whole.astype('<i2')
+        dtype = 'i2'
+    else:
+        buffer = values.astype('<f4')
+        dtype = 'f4'
+
+    return {'dtype': dtype,
+            'bdata': base64.b64encode(buffer.tobytes()).decode('ascii')}
+
+def layout_steps(layout, resolution=4096):
+    """ Get the quantization steps of the x and y axes
+        of a layout: the largest power of two below the
+        range of the axis divided by the resolution, so
+        that rounding moves a point by less than one pixel
+        on a plot up to that many pixels wide, and the
+        multiples of the step are exact in float32. None
+        for an axis without a range.
+
+        Parameters
+        ----------
+        layout: dict
+            The layout.
+        resolution: int
+            No. of distinct positions along each axis.
+    """
+    steps = dict()
+    for key in COORD_KEYS:
+        axis = layout.get(key + 'axis') or dict()
+        axis_range = axis.get('range')
+        if axis_range is None:
+            steps[key] = None
+        else:
+            span = abs(axis_range[1] - axis_range[0])
+            steps[key] = 2.0**np.floor(np.log2(span/resolution)) \
+                if span else None
+
+    return steps
+
+def _is_coords(value):
+    """ Whether a trace attribute is an array of numbers. """
+    if isinstance(value, np.ndarray):
+        return value.dtype.kind in 'iuf'
+    if isinstance(value, (list, tuple)) and value:
+        return all(v is None or isinstance(v, (int, float, np.number))
+                   for v in value)
+    return False
+
+def encode_trace(trace, steps=None):
+    """ Get a copy of a trace with its coordinates
+        encoded as typed arrays.
+
+        Parameters
+        ----------
+        trace: dict
+            The trace.
+        steps: dict or None
+            Quantization step of each axis, see
+            layout_steps().
+    """
+    trace = dict(trace)
+    for key in COORD_KEYS:
+        if _is_coords(trace.get(key)):
+            step = None if steps is None else steps.get(key)
+            trace[key] = encode_array(trace[key], step=step)
+
+    return trace
+
+def encode_figure(figure, quantize=True, resolution=4096):
+    """ Get a copy of a figure with the coordinates of
+        all its traces encoded as typed arrays.
+
+        Parameters
+        ----------
+        figure: dict
+            The figure, with data and layout.
+        quantize: bool
+            Round coordinates to the pixel grid given by
+            the axis ranges of the layout, see
+            layout_steps().
+        resolution: int
+            No. of distinct positions along each axis.
+    """
+    steps = layout_steps(figure['layout'], resolution) if quantize else None
+
+    return dict(figure, data=[encode_trace(trace, steps)
+                              for trace in figure['data']])
@@ -1,12 +1,10 @@
 #!/usr/bin/env python
 
 import numpy as np
-import matplotlib.pyplot as plt
-from keras.models import load_model
-from keras.models import model_from_json
-# from keras_loader import *
-from convnet import ConvNet2D
-from plotly.offline import init_notebook_mode, plot
+from .backend import FigureMixin, set_backend, figure_to_html
+from .backend import write_json, write_html
+from .folding import find_repeats, fold_indices, get_badges, iter_selected
+from .instrument import stage
 
 def get_line(x, p1, p2):
     """ Function to get a line
@@ -34,11 +32,35 @@ def get_line(x, p1, p2):
     
     return m*x + c
 
-class Dense:
+def num_slots(num_neurons, max_neurons=None):
+    """ Number of vertical positions taken by a layer,
+        counting the group glyph of an aggregated layer.
+        
+        Parameters
+        ----------
+        num_neurons: int
+            No. of neurons in layer.
+        max_neurons: int or None
+            Maximum no. of neurons drawn for the layer.
+    """
+    if max_neurons is None or num_neurons <= max_neurons:
+        return num_neurons
+    
+    return max_neurons + 1
+
+class Dense(FigureMixin):
+    
+    # Layers are built in bulk, so keep them compact
+    __slots__ = ('offset', 'x_offset', 'x_coord', 'num_neurons',
+                 'n_color', 'showgrid', 'x_list', 'y_list', 'max_y',
+                 'data', 'x_min', 'x_max', 'y_min', 'y_max',
+                 'layout', 'figure', 'max_neurons', 'indices',
+                 'group_y', 'num_hidden', 'values', 'value_range')
     
     def __init__(self, num_neurons, x_coord=1, 
                  offset=2, x_offset=1, n_color='blue',
-                 showgrid=False):
+                 showgrid=False, max_neurons=None, values=None,
+                 value_range=None):
         """ Class to represent a layer of the MLP class.
             
             Parameters
@@ -54,78 +76,66 @@ class Dense:
                 neuron in the layer.
             n_color: string (Plotly color)
                 Color of the neurons. 
+            max_neurons: int or None
+                Maximum no. of neurons to draw. Wider
+                layers only draw their first and last
+                neurons, with a single group glyph for
+                the ones in between.
+            values: np.ndarray or None
+                Value of each neuron, such as its mean 
+                activation, to fill the neurons with the 
+                colors of a colorscale.
+            value_range: tuple or None
+                (min, max) of the colorscale, shared by the
+                layers of a network. By default the range 
+                of values.
         """
         
+        if max_neurons is not None and max_neurons < 1:
+            raise ValueError('max_neurons must be at least 1, got '
+                             + str(max_neurons))
+        
         self.offset = offset
         self.x_offset = x_offset
         self.x_coord = x_coord
         self.num_neurons = num_neurons
         self.n_color = n_color
         self.showgrid = showgrid
-        
-        self.data = list()
-        self.x_list = list()
-        self.y_list = list()
+        self.max_neurons = max_neurons
+        self.values = values
+        self.value_range = value_range
         
         # Highest value of y for any neuron + offset
-        self.max_y = self.x_offset + self.num_neurons*self.offset
+        self.max_y = self.x_offset + \
+            num_slots(self.num_neurons, self.max_neurons)*self.offset
         
         # Set coordinates
         self._set_coords()
         # Set data
         self._set_data()
         
-    # Getter and setter methods
-    
-    @property
-    def x_list(self):
-        return self.__x_list
-    
-    @x_list.setter
-    def x_list(self, new):
-        self.__x_list = new
-        
-    @property
-    def y_list(self):
-        return self.__y_list
-    
-    @y_list.setter
-    def y_list(self, new):
-        self.__y_list = new
+    # Methods
         
-    @property
-    def data(self):
-        return self.__data
-    
-    @data.setter
-    def data(self, new):
-        self.__data = new
+    def _get_layout(self):
+        """ Gets the layout if the layer needs
+            to be plotted. """
         
-    @property
-    def x_offset(self):
-        return self.__x_offset
-    
-    @x_offset.setter
-    def x_offset(self, new):
-        self.__x_offset = new
-    
-    @property
-    def offset(self):
-        return self.__offset
-    
-    @offset.setter
-    def offset(self, new):
-        self.__offset = new
-    
-    @property
-    def x_coord(self):
-        return self.__x_coord
-    
-    @x_coord.setter
-    def x_coord(self, new):
-        self.__x_coord = new
+        # Range for x and y
+        x_min, x_max = self.x_coord - 1, self.x_coord + 1
+        y_min, y_max = 0, self.max_y
         
-    # Methods
+        return {'xaxis': {'range': [x_min, x_max], 
+                          'autorange': False, 
+                          'zeroline': False,
+                          'showgrid': self.showgrid,
+                          'showticklabels': self.showgrid},
+                'yaxis': {'range': [y_min, y_max], 
+                          'autorange': False, 
+                          'zeroline': False,
+                          'showgrid': self.showgrid,
+                          'showticklabels': self.showgrid},
+                'title': 'MLP Layer',
+                'hovermode': 'closest'}
         
     def _set_layout(self):
         """ Sets the layout if the layer needs
@@ -140,18 +150,7 @@ class Dense:
         self.y_max = self.max_y
         
         # Set the layout
-        self.layout = {'xaxis': {'range': [self.x_min, self.x_max], 
-                                 'autorange': False, 
-                                 'zeroline': False,
-                                 'showgrid': self.showgrid,
-                                 'showticklabels': self.showgrid},
-                       'yaxis': {'range': [self.y_min, self.y_max], 
-                                 'autorange': False, 
-                                 'zeroline': False,
-                                 'showgrid': self.showgrid,
-                                 'showticklabels': self.showgrid},
-                       'title': 'MLP Layer',
-                       'hovermode': 'closest'}
+        self.layout = self._get_layout()
 
     def _set_coords(self):
         """ Sets the x and y coordinates of the
@@ -159,12 +158,26 @@ class Dense:
             is set even if the object doesn't need
             to be plotted. """
         
-        self.coords = list()
+        n_slots = num_slots(self.num_neurons, self.max_neurons)
+        slots = np.arange(n_slots, dtype=float)
         
-        initial = self.x_offset
-        for i in range(self.num_neurons):
-            self.x_list.append(self.x_coord)
-            self.y_list.append(initial + i*self.offset)
+        if n_slots == self.num_neurons:
+            self.indices = np.arange(self.num_neurons)
+            self.group_y = None
+            self.num_hidden = 0
+        else:
+            # First and last neurons around the group glyph
+            head = (self.max_neurons + 1)//2
+            tail = self.max_neurons - head
+            self.indices = np.concatenate([
+                np.arange(head),
+                np.arange(self.num_neurons - tail, self.num_neurons)])
+            self.group_y = self.x_offset + head*self.offset
+            self.num_hidden = self.num_neurons - self.max_neurons
+            slots = np.delete(slots, head)
+        
+        self.x_list = np.full(len(slots), self.x_coord, dtype=float)
+        self.y_list = self.x_offset + self.offset*slots
         
     def _set_data(self):
         """ Sets the data attribute of the class.
@@ -172,23 +185,76 @@ class Dense:
             doesn't need to be plotted. """
     
         # Set data for the neurons
-        self.data += [dict(x=self.x_list, y=self.y_list,
+        self.data = [dict(x=self.x_list, y=self.y_list,
                     mode='markers',
-                    marker=dict(color=self.n_color, size=30))]
-        self.data += [dict(x=self.x_list, y=self.y_list,
+                    marker=dict(color=self.n_color, size=30)),
+                     dict(x=self.x_list, y=self.y_list,
                     mode='markers',
                     marker=dict(color='white', size=20))]
         
-    def plot(self):
+        # Fill the neurons by value
+        if self.values is not None:
+            self.data[1] = self._get_value_trace()
+        
+        # Group glyph standing in for the hidden neurons
+        if self.group_y is not None:
+            self.data += [dict(x=[self.x_coord], y=[self.group_y],
+                    mode='markers+text',
+                    marker=dict(color=self.n_color, size=30,
+                                symbol='square'),
+                    text=['\u2026' + str(self.num_hidden) + ' more'],
+                    textposition='middle right',
+                    hovertext=['Layer of ' + str(self.num_neurons) + 
+                               ' neurons, ' + str(self.num_hidden) + 
+                               ' not drawn'],
+                    hoverinfo='text')]
+        
+    def _get_value_trace(self):
+        """ Get the trace filling the drawn neurons with
+            the colors of their values. """
+        from .activations import COLORSCALE, value_range
+        
+        values = np.asarray(self.values, dtype=float)
+        if len(values) != self.num_neurons:
+            raise ValueError('Expected ' + str(self.num_neurons) + 
+                             ' values, got ' + str(len(values)))
+        values = values[self.indices]
+        vmin, vmax = self.value_range or value_range([values])
+        
+        return dict(x=self.x_list, y=self.y_list,
+                    mode='markers',
+                    marker=dict(color=values, size=20,
+                                colorscale=COLORSCALE, cmin=vmin, 
+                                cmax=vmax),
+                    hoverinfo='text',
+                    text=['%.4g' % value for value in values])
+        
+    def plot(self, backend='svg'):
         """ For plotting the MLP layer. Mostly used
-            for testing or such. """
+            for testing or such. 
+            
+            Parameters
+            ----------
+            backend: string
+                'svg' for scatter traces or 'webgl'
+                for scattergl traces.
+        """
         
         # Set the layout
         self._set_layout()
         
         # Create figure and plot
-        self.figure = dict(data=self.data, layout=self.layout)
+        from plotly.offline import plot
+        self.figure = dict(data=set_backend(self.data, backend), 
+                           layout=self.layout)
         plot(self.figure)
+        
+    def to_figure(self, backend='svg'):
+        """ Get the figure of the layer, without setting
+            any attribute. See plot() for the parameters.
+        """
+        return dict(data=set_backend(self.data, backend), 
+                    layout=self._get_layout())
 
 def get_standard_layout(x_min, x_max, y_min, y_max, name, 
                         showgrid):
@@ -225,7 +291,7 @@ def get_standard_layout(x_min, x_max, y_min, y_max, name,
     
     return standard_layout
 
-def get_trace(x, y, color='blue'):
+def get_trace(x, y, color='blue', width=2):
     """ Get trace for a line. 
         
         Parameters
@@ -236,25 +302,280 @@ def get_trace(x, y, color='blue'):
             List of y-coords
         color: string (Plotly color)
             Color of trace. 
+        width: int or float
+            Width of the line.
     """
     trace = [dict(x=x, y=y,
                    mode='lines',
-                   line=dict(width=2, color=color)
+                   line=dict(width=width, color=color)
                   )
             ]
     
     return trace
 
+def get_edges(layer_curr, layer_next, src=None, dst=None):
+    """ Get the coordinates of every edge between
+        two layers in a single vectorized step.
+        
+        The segments are laid out one after another
+        and separated by NaN, which Plotly treats as
+        a gap (same as None), so that all of them can
+        be drawn as one trace.
+        
+        Parameters
+        ----------
+        layer_curr: Dense
+            Current layer
+        layer_next: Dense
+            Next layer
+        src, dst: np.ndarray or None
+            Positions, among the drawn neurons, of the 
+            ends of a subset of the edges. All the edges
+            are drawn if not given.
+            
+        Returns
+        -------
+        x: np.ndarray
+            x-coords of the segments, 3 per edge.
+        y: np.ndarray
+            y-coords of the segments, 3 per edge.
+    """
+    y_curr = np.asarray(layer_curr.y_list, dtype=float)
+    y_next = np.asarray(layer_next.y_list, dtype=float)
+    
+    # Every (neuron, neuron) pair as (start, end, gap)
+    if src is None:
+        n_edges = len(y_curr) * len(y_next)
+        y = np.empty((len(y_curr), len(y_next), 3))
+        y[:, :, 0] = y_curr[:, np.newaxis]
+        y[:, :, 1] = y_next[np.newaxis, :]
+    else:
+        n_edges = len(src)
+        y = np.empty((n_edges, 3))
+        y[:, 0] = y_curr[src]
+        y[:, 1] = y_next[dst]
+    y[..., 2] = np.nan
+    
+    x = np.empty((n_edges, 3))
+    x[:, 0] = layer_curr.x_coord
+    x[:, 1] = layer_next.x_coord
+    x[:, 2] = np.nan
+    
+    return x.ravel(), y.ravel()
+
+def select_edges(weights, top_k=None, threshold=None):
+    """ Select the edges between two layers by the
+        magnitude of their weights.
+        
+        Parameters
+        ----------
+        weights: np.ndarray
+            Weights between the drawn neurons, of shape 
+            (no. of neurons in current layer, 
+             no. of neurons in next layer).
+        top_k: int or None
+            Keep only the k edges with the largest 
+            absolute weight, at least 1.
+        threshold: float or None
+            Keep only the edges whose absolute weight is
+            at least this.
+            
+        Returns
+        -------
+        src: np.ndarray
+            Positions of the edges in the current layer.
+        dst: np.ndarray
+            Positions of the edges in the next layer.
+        w: np.ndarray
+            Weights of the edges.
+    """
+    if top_k is not None and top_k < 1:
+        raise ValueError('top_k must be at least 1, got ' + str(top_k))
+    
+    weights = np.asarray(weights)
+    flat = weights.ravel()
+    magnitude = np.abs(flat)
+    
+    keep = np.arange(flat.size)
+    if threshold is not None:
+        keep = keep[magnitude >= threshold]
+    if top_k is not None and top_k < keep.size:
+        largest = np.argpartition(magnitude[keep], keep.size - top_k)
+        keep = np.sort(keep[largest[keep.size - top_k:]])
+    
+    src, dst = np.unravel_index(keep, weights.shape)
+    
+    return src, dst, flat[keep]
+
+def connect_weighted(layer_curr, layer_next, weights, color='blue', 
+                     neg_color='red', top_k=None, threshold=None,
+                     n_widths=4, max_width=4):
+    """ Connect two layers with edges colored by the sign
+        and sized by the magnitude of their weights.
+        
+        Edges are grouped into one line trace per 
+        (sign, width) pair, at most 2*n_widths traces.
+        
+        Parameters
+        ----------
+        layer_curr: Dense
+            Current layer
+        layer_next: Dense
+            Next layer
+        weights: np.ndarray
+            Kernel between the two layers, of shape 
+            (layer_curr.num_neurons, layer_next.num_neurons).
+            Only the rows and columns of drawn neurons 
+            are read.
+        color: string (Plotly color)
+            Color of the positive edges.
+        neg_color: string (Plotly color)
+            Color of the negative edges.
+        top_k, threshold: 
+            Edge filter, see select_edges().
+        n_widths: int
+            No. of distinct edge widths.
+        max_width: int or float
+            Width of the edges with the largest weight.
+            
+        Returns
+        -------
+        data: list of dicts
+            The data list.
+    """
+    if weights.shape != (layer_curr.num_neurons, layer_next.num_neurons):
+        raise ValueError('Expected weights of shape ' + 
+                         str((layer_curr.num_neurons, layer_next.num_neurons)) +
+                         ', got ' + str(weights.shape))
+    
+    # Weights between the drawn neurons only
+    weights = np.asarray(weights[layer_curr.indices][:, layer_next.indices],
+                         dtype=float)
+    src, dst, w = select_edges(weights, top_k=top_k, threshold=threshold)
+    
+    # Width bin of each edge
+    magnitude = np.abs(w)
+    scale = magnitude.max() if magnitude.size else 0
+    if scale > 0:
+        bins = np.minimum((magnitude/scale*n_widths).astype(int), n_widths - 1)
+    else:
+        bins = np.zeros(len(w), dtype=int)
+    
+    data = list()
+    for sign_color, sign in ((color, w >= 0), (neg_color, w < 0)):
+        for b in range(n_widths):
+            mask = sign & (bins == b)
+            if not mask.any():
+                continue
+            x, y = get_edges(layer_curr, layer_next, src[mask], dst[mask])
+            data += get_trace(x, y, color=sign_color, 
+                              width=max_width*(b + 1)/n_widths)
+    
+    return data
+
+def get_band(layer_curr, layer_next):
+    """ Get the outline of the bundled bands of edges
+        going in and out of the group glyphs of
+        aggregated layers.
+        
+        Each band is a quadrilateral from the extent of
+        the group glyph to the full extent of the other
+        layer. Bands are separated by NaN.
+        
+        Parameters
+        ----------
+        layer_curr: Dense
+            Current layer
+        layer_next: Dense
+            Next layer
+            
+        Returns
+        -------
+        x: list
+            x-coords of the outlines.
+        y: list
+            y-coords of the outlines.
+        n_edges: int
+            No. of edges bundled in the bands.
+    """
+    x, y = list(), list()
+    n_edges = 0
+    
+    def extent(layer):
+        y_s = list(layer.y_list)
+        if layer.group_y is not None:
+            y_s.append(layer.group_y)
+        return float(min(y_s)), float(max(y_s))
+    
+    x0, x1 = layer_curr.x_coord, layer_next.x_coord
+    
+    if layer_curr.group_y is not None:
+        g0 = layer_curr.group_y - layer_curr.offset/2
+        g1 = layer_curr.group_y + layer_curr.offset/2
+        n0, n1 = extent(layer_next)
+        x += [x0, x0, x1, x1, x0, np.nan]
+        y += [g0, g1, n1, n0, g0, np.nan]
+        n_edges += layer_curr.num_hidden*layer_next.num_neurons
+    
+    if layer_next.group_y is not None:
+        g0 = layer_next.group_y - layer_next.offset/2
+        g1 = layer_next.group_y + layer_next.offset/2
+        c0, c1 = extent(layer_curr)
+        x += [x0, x0, x1, x1, x0, np.nan]
+        y += [c0, c1, g1, g0, c0, np.nan]
+        n_edges += layer_next.num_hidden*(layer_curr.num_neurons - 
+                                          layer_curr.num_hidden)
+    
+    return x, y, n_edges
+
+def get_band_trace(layer_curr, layer_next, color='blue'):
+    """ Get the trace of the bundled bands of edges
+        between two layers, see get_band(). The list is 
+        empty if neither layer is aggregated.
+        
+        Parameters
+        ----------
+        layer_curr: Dense
+            Current layer
+        layer_next: Dense
+            Next layer
+        color: string (Plotly color)
+            Color of the bands.
+    """
+    x, y, n_edges = get_band(layer_curr, layer_next)
+    if not n_edges:
+        return list()
+    
+    trace = [dict(x=x, y=y,
+                  mode='lines',
+                  fill='toself',
+                  fillcolor=color,
+                  opacity=0.3,
+                  line=dict(width=0, color=color),
+                  hoveron='fills',
+                  hoverinfo='text',
+                  text=str(n_edges) + ' connections')]
+    
+    return trace
 
-def connect(layer_curr, layer_next):
+def connect(layer_curr, layer_next, color='blue', width=2):
     """ Connect two layers in the neural network.
     
+        All the edges between the two layers are
+        drawn as a single line trace. The neurons
+        themselves are not included, see the data
+        attribute of the layers for that.
+    
         Parameters
         ----------
         layer_curr: MultiLayerPerceptronLayer
             Current layer
         layer_next: MultiLayerPerceptronLayer
             Next layer
+        color: string (Plotly color)
+            Color of the edges.
+        width: int or float
+            Width of the edges.
             
         Returns
         -------
@@ -263,57 +584,129 @@ def connect(layer_curr, layer_next):
     """
     data = list()
     
-    # Points in current and next layer in tuple form
-    curr_points = [(layer_curr.x_list[i], layer_curr.y_list[i]) 
-                   for i in range(len(layer_curr.x_list))]
-    next_points = [(layer_next.x_list[i], layer_next.y_list[i]) 
-                   for i in range(len(layer_next.x_list))]
-    
-    # Set of points on the x-axis
-    x = np.linspace(layer_curr.x_coord, layer_next.x_coord, 2)
-    
-    # Get y-coordinates of x for all lines
-    y_s = list()
-    for i in curr_points:
-        for j in next_points:
-            y_s.append(get_line(x, i, j))
-     
-    # Add traces to data
-    for i in range(len(y_s)):
-        data += get_trace(x, y_s[i])
+    # Add the edges as one trace
+    x, y = get_edges(layer_curr, layer_next)
+    data += get_trace(x, y, color=color, width=width)
     
-    data += layer_curr.data
-    data += layer_next.data
+    # Add the bundled edges of aggregated layers
+    data += get_band_trace(layer_curr, layer_next, color=color)
     
     return data
     
-def connect_layers(layers, name, showgrid):
-    """ Connect all layers in the MLP. """
-    data_s = [layer.data for layer in layers]
+def iter_connections(layers, weights=None, top_k=None, threshold=None):
+    """ Yield the traces connecting each pair of layers,
+        one pair at a time, so that only one pair of
+        layers and its edges need to be in memory.
+        
+        Parameters
+        ----------
+        layers: iterable of Dense
+            Layers of the MLP, can be a generator.
+        weights, top_k, threshold:
+            See connect_layers().
+            
+        Yields
+        ------
+        data: list of dicts
+            The traces of one pair of layers.
+    """
+    kernels = None if weights is None else iter(weights)
     
-    # Range of x in layout
-    x_min = layers[0].x_coord - 1
-    x_max = layers[-1].x_coord + 1
+    layer_curr = None
+    for i, layer_next in enumerate(layers):
+        if layer_curr is not None:
+            if kernels is None:
+                yield connect(layer_curr, layer_next)
+            else:
+                kernel = next(kernels, None)
+                if kernel is None:
+                    raise ValueError('Expected a kernel for each pair of '
+                                     'layers, got ' + str(i - 1))
+                yield connect_weighted(layer_curr, layer_next, kernel, 
+                                       top_k=top_k, threshold=threshold) + \
+                    get_band_trace(layer_curr, layer_next)
+                del kernel
+        layer_curr = layer_next
+
+def get_mlp_layout(layers, name, showgrid):
+    """ Get the layout of an MLP. 
     
-    # Range of y in layout
+        Parameters
+        ----------
+        layers: iterable of Dense
+            Layers of the MLP, can be a generator.
+        name: string
+            Name of plot.
+        showgrid: bool
+            To show the grid or not.
+    """
+    first = last = None
+    y_max = 0
+    for layer in layers:
+        if first is None:
+            first = layer
+        last = layer
+        y_max = max(y_max, layer.max_y)
+    
+    # Range of x and y in layout
+    x_min = first.x_coord - 1
+    x_max = last.x_coord + 1
     y_min = 0
-    y_max = max([layer.max_y for layer in layers])
+    
+    return get_standard_layout(x_min, x_max, y_min, y_max, 
+                               name, showgrid)
+
+def connect_layers(layers, name, showgrid, backend='svg', weights=None, 
+                   top_k=None, threshold=None):
+    """ Connect all layers in the MLP. 
+    
+        Parameters
+        ----------
+        layers: list of Dense
+            Layers of the MLP.
+        name: string
+            Name of plot.
+        showgrid: bool
+            To show the grid or not.
+        backend: string
+            'svg' for scatter traces or 'webgl'
+            for scattergl traces.
+        weights: iterable of np.ndarray or None
+            Kernel of each pair of layers. They are read
+            one at a time, so this can be a generator 
+            loading them lazily.
+        top_k, threshold:
+            Edge filter for each pair of layers, see 
+            select_edges().
+    """
     
     # Get standard layout
-    layout = get_standard_layout(x_min, x_max, y_min, y_max, 
-                                 name, showgrid)
+    layout = get_mlp_layout(layers, name, showgrid)
 
     # Get the connection traces
     data = list()
-    for i in range(len(layers)-1):
-        data += connect(layers[i], layers[i+1])
+    with stage('fc.edges', layers=len(layers)) as record:
+        for traces in iter_connections(layers, weights=weights, top_k=top_k,
+                                       threshold=threshold):
+            data += traces
+        record['traces'] = len(data)
+        record['points'] = sum(len(trace['x']) for trace in data)
+    
+    with stage('fc.assemble') as record:
+        # Neurons are drawn once per layer, above the edges
+        for layer in layers:
+            data += layer.data
+        data = set_backend(data, backend)
+        record['traces'] = len(data)
     
     return data, layout
 
-class MultiLayerPerceptron:
+class MultiLayerPerceptron(FigureMixin):
     
     def __init__(self, layer_sizes, n_color='blue', b_color='red', 
-                 showgrid=False, name='Multi-Layer Perceptron'):
+                 showgrid=False, name='Multi-Layer Perceptron',
+                 cache=None, weights=None, fold=False, min_repeats=2,
+                 activations=None):
         """ Class for visual representation of a multi-layer 
             perceptron.
             
@@ -329,6 +722,27 @@ class MultiLayerPerceptron:
                 Set true to show the grid
             name: string
                 Title of plot.
+            cache: cache.FigureCache or None
+                Cache for the figures of the network, shared
+                by networks with the same architecture.
+            weights: list of np.ndarray, callable or None
+                Kernel of each pair of layers, to color and
+                size the edges by weight. A callable must
+                return an iterable of the kernels; it is
+                called on each render, so that the kernels 
+                can be loaded lazily, one at a time (see 
+                keras_loader.iterKernels()).
+            fold: bool
+                Set true to draw layers repeated back to 
+                back (same sizes in and out) once, with an
+                "×N" badge. See expand().
+            min_repeats: int
+                Minimum no. of copies of a block to fold.
+            activations: list of np.ndarray or None
+                Value of each neuron of each layer, such as
+                its mean activation over a set of inputs 
+                (see keras_loader.kerasToVnn()), to fill the
+                neurons with the colors of a colorscale.
         """
         
         self.name = name
@@ -336,53 +750,350 @@ class MultiLayerPerceptron:
         self.n_color = n_color
         self.b_color = b_color
         self.showgrid = showgrid
+        self.cache = cache
+        self.weights = weights
+        self.fold = fold
+        self.min_repeats = min_repeats
+        self.activations = activations
         
+        self._assign_folds()
         self._assign_x_coords()
         self._assign_x_offsets()
         
+    def _assign_folds(self):
+        """ Assign the indices of the drawn layers and the
+            folded blocks of the network.
+        """
+        n_layers = len(self.layer_sizes)
+        if self.fold:
+            tokens = list(zip([None] + list(self.layer_sizes[:-1]),
+                              self.layer_sizes))
+            repeats = find_repeats(tokens, self.min_repeats)
+        else:
+            repeats = list()
+        self.kept, self.blocks = fold_indices(n_layers, repeats)
+        self.drawn_sizes = [self.layer_sizes[i] for i in self.kept]
+        
     def _assign_x_coords(self):
         """ Assign the x coordinates to the 
             layers in the network.
         """
         # x coordinate of layer is # of layer + 1
         self.x_coords = list()
-        for i in range(len(self.layer_sizes)):
+        for i in range(len(self.drawn_sizes)):
             self.x_coords.append(i+1)
         
-    def _assign_x_offsets(self):
-        """ Assign the x offsets to the 
-            layers in the network.
+    def _get_x_offsets(self, max_neurons=None):
+        """ Get the x offsets of the layers 
+            in the network.
+            
+            Parameters
+            ----------
+            max_neurons: int or None
+                Maximum no. of neurons drawn per layer.
         """
+        sizes = [num_slots(size, max_neurons) for size in self.drawn_sizes]
         
         # Set x_offset of largest layer to 1
-        max_layer = max(self.layer_sizes)
+        max_layer = max(sizes)
         max_layer_x_offset = 1
         
         # Set x_offset of other layers
-        self.x_offsets = list()
-        for i in range(len(self.layer_sizes)):
-            self.x_offsets.append(max_layer - self.layer_sizes[i] + max_layer_x_offset)
+        x_offsets = list()
+        for i in range(len(sizes)):
+            x_offsets.append(max_layer - sizes[i] + max_layer_x_offset)
+        
+        return x_offsets
+        
+    def _assign_x_offsets(self):
+        """ Assign the x offsets to the 
+            layers in the network.
+        """
+        self.x_offsets = self._get_x_offsets()
+        
+    def _get_weights(self):
+        """ Get an iterable of the kernels of the drawn
+            layers, or None. """
+        weights = self.weights
+        if callable(weights):
+            weights = weights()
+        if weights is None or not self.blocks:
+            return weights
+        # The kernel into each drawn layer, the first copy
+        # of a folded block stands for the others
+        return iter_selected(weights, [i - 1 for i in self.kept[1:]])
+        
+    def _check_filter(self, top_k, threshold):
+        """ Check that an edge filter is valid and has 
+            weights to use. """
+        if top_k is not None and top_k < 1:
+            raise ValueError('top_k must be at least 1, got ' + str(top_k))
+        if self.weights is None and (top_k is not None or 
+                                     threshold is not None):
+            raise ValueError('top_k and threshold need the weights of '
+                             'the network')
+        
+    def _iter_layers(self, max_neurons=None):
+        """ Build the layers of the network one at a time. """
+        x_offsets = self._get_x_offsets(max_neurons)
+        values = [None]*len(self.drawn_sizes)
+        colors = None
+        if self.activations is not None:
+            from .activations import value_range
+            values = [self.activations[i] for i in self.kept]
+            colors = value_range(values)
+        
+        for i in range(len(self.drawn_sizes)):
+            layer = Dense(self.drawn_sizes[i], 
+                          x_coord=self.x_coords[i], 
+                          x_offset=x_offsets[i],
+                          max_neurons=max_neurons,
+                          values=values[i], value_range=colors)
+            # One colorbar for the network
+            if values[i] is not None and i == len(self.drawn_sizes) - 1:
+                layer.data[1]['marker']['showscale'] = True
+            yield layer
+        
+    def _build_figure(self, max_neurons=None, backend='svg', top_k=None,
+                      threshold=None):
+        """ Build the layers and the figure of the network,
+            without setting any attribute. 
+            
+            Returns
+            -------
+            figure: dict
+                The figure.
+            layers: list of Dense
+                Layers of the network.
+        """
+        self._check_filter(top_k, threshold)
+        
+        # Build the layers
+        with stage('fc.layers', layers=len(self.drawn_sizes)) as record:
+            layers = list(self._iter_layers(max_neurons))
+            record['neurons'] = sum(len(layer.y_list) for layer in layers)
         
-    def plot(self, show_bias=False):
+        # Connect the layers
+        data, layout = connect_layers(layers, self.name, self.showgrid,
+                                      backend=backend, 
+                                      weights=self._get_weights(),
+                                      top_k=top_k, threshold=threshold)
+        self._add_badges(layout, layers)
+        return dict(data=data, layout=layout), layers
+    
+    def _add_badges(self, layout, layers):
+        """ Add the badges of the folded blocks to a 
+            layout. A block is framed with the edges 
+            going into it. """
+        if not self.blocks:
+            return
+        
+        extents = [(layer.x_coord - 0.5, layer.x_coord + 0.25,
+                    layer.x_offset - layer.offset/2,
+                    layer.max_y - layer.offset/2) for layer in layers]
+        shapes, annotations = get_badges(self.blocks, extents)
+        layout['shapes'] = layout.get('shapes', list()) + shapes
+        layout['annotations'] = layout.get('annotations', list()) + \
+            annotations
+    
+    def expand(self):
+        """ Get a copy of the network with its folded 
+            blocks drawn in full. """
+        return MultiLayerPerceptron(self.layer_sizes, n_color=self.n_color,
+                                    b_color=self.b_color,
+                                    showgrid=self.showgrid, name=self.name,
+                                    cache=self.cache, weights=self.weights,
+                                    activations=self.activations)
+    
+    def to_figure(self, show_bias=False, max_neurons=None, backend='svg',
+                  top_k=None, threshold=None):
+        """ Get the figure of the network. Nothing is 
+            written or set, so this is safe to call from
+            many threads at once. See plot() for the 
+            parameters.
+            
+            With a cache, the figure is shared with the 
+            other networks of the same architecture, so 
+            treat it as read-only. Networks with weights
+            or activations are not cached.
+        """
+        self._check_filter(top_k, threshold)
+        
+        def build():
+            figure, _ = self._build_figure(max_neurons=max_neurons, 
+                                           backend=backend, top_k=top_k,
+                                           threshold=threshold)
+            return figure
+        
+        if self.cache is None or self.weights is not None or \
+                self.activations is not None:
+            return build()
+        
+        from .cache import figure_key
+        key = figure_key('MultiLayerPerceptron', 
+                         layer_sizes=self.layer_sizes, 
+                         n_color=self.n_color, showgrid=self.showgrid,
+                         name=self.name, max_neurons=max_neurons, 
+                         backend=backend, fold=self.fold,
+                         min_repeats=self.min_repeats)
+        return self.cache.get_or_build(key, build)
+    
+    def to_html(self, include_plotlyjs=True, full_html=True, binary=False,
+                highlight=False, **kwargs):
+        """ Render the network to an HTML string in memory.
+            See backend.figure_to_html() for the options.
+            Set highlight to true to highlight the edges of
+            the neuron under the mouse (see adjacency.py).
+            Keyword arguments are passed to to_figure().
+        """
+        figure = self.to_figure(**kwargs)
+        post_script = None
+        if highlight:
+            post_script = self.get_highlight_script(**kwargs)
+        return figure_to_html(figure, include_plotlyjs=include_plotlyjs,
+                              full_html=full_html, binary=binary, 
+                              post_script=post_script)
+    
+    def get_adjacency(self, max_neurons=None, top_k=None, threshold=None):
+        """ Get the CSR index of the edges drawn between
+            each pair of layers, see adjacency.Adjacency. 
+            Positions are among the drawn neurons.
+        """
+        from .adjacency import get_adjacency
+        self._check_filter(top_k, threshold)
+        return get_adjacency(list(self._iter_layers(max_neurons)),
+                             weights=self._get_weights(), top_k=top_k,
+                             threshold=threshold)
+    
+    def get_highlight_script(self, show_bias=False, max_neurons=None, 
+                             backend='svg', top_k=None, threshold=None):
+        """ Get the script highlighting the edges of the
+            neuron under the mouse in the figure of the 
+            network. The parameters are those passed to
+            to_figure().
+        """
+        from .adjacency import get_highlight_script
+        from .backend import get_trace_type
+        
+        # Layer of each of the last traces of the figure, 
+        # the neurons, or None for the group glyphs
+        traces = list()
+        for i, layer in enumerate(self._iter_layers(max_neurons)):
+            traces += [i, i] + [None]*(len(layer.data) - 2)
+        
+        adjacency = self.get_adjacency(max_neurons=max_neurons, top_k=top_k,
+                                       threshold=threshold)
+        return get_highlight_script(adjacency, traces, 
+                                    trace_type=get_trace_type(backend))
+    
+    def iter_data(self, max_neurons=None, backend='svg', top_k=None,
+                  threshold=None):
+        """ Yield the traces of the network one at a time,
+            generating the edges one pair of layers at a
+            time. See plot() for the parameters. 
+        """
+        self._check_filter(top_k, threshold)
+        
+        for traces in iter_connections(self._iter_layers(max_neurons),
+                                       weights=self._get_weights(),
+                                       top_k=top_k, threshold=threshold):
+            for trace in set_backend(traces, backend):
+                yield trace
+        
+        # Neurons are drawn once per layer, above the edges
+        for layer in self._iter_layers(max_neurons):
+            for trace in set_backend(layer.data, backend):
+                yield trace
+    
+    def get_layout(self, max_neurons=None):
+        """ Get the layout of the figure of the network. """
+        layout = get_mlp_layout(self._iter_layers(max_neurons), self.name, 
+                                self.showgrid)
+        self._add_badges(layout, self._iter_layers(max_neurons))
+        return layout
+    
+    def get_viewport_index(self, max_neurons=None, **kwargs):
+        """ Get an index of the neurons and edges of the 
+            network, to query them by viewport or serve them
+            tile by tile (see viewport.py). max_neurons is
+            the level of detail of the layers, see Dense.
+            Keyword arguments, such as max_edges or
+            max_visible_neurons, are passed to
+            viewport.ViewportIndex.
+        """
+        from .viewport import ViewportIndex
+        layers = list(self._iter_layers(max_neurons))
+        return ViewportIndex(layers, self.get_layout(max_neurons), 
+                             color=self.n_color, **kwargs)
+    
+    def write_json(self, fp, binary=False, **kwargs):
+        """ Stream the figure of the network as JSON to a 
+            file or socket. Peak memory is that of one pair
+            of layers, not of the whole figure.
+            
+            Parameters
+            ----------
+            fp: string or file-like object
+                Path of the output, or an object with a 
+                write() method taking strings, such as an
+                open file or socket.makefile('w').
+            binary: bool
+                Write the coordinates as typed arrays, see
+                backend.figure_to_json().
+            kwargs: keyword arguments
+                Passed to iter_data().
+        """
+        layout = self.get_layout(kwargs.get('max_neurons'))
+        write_json(self.iter_data(**kwargs), layout, fp, binary=binary)
+    
+    def write_html(self, fp, include_plotlyjs=True, binary=False, 
+                   highlight=False, **kwargs):
+        """ Stream the network as an HTML page to a file or 
+            socket. See write_json() for the parameters, 
+            backend.figure_to_html() for include_plotlyjs
+            and to_html() for highlight.
+        """
+        layout = self.get_layout(kwargs.get('max_neurons'))
+        post_script = None
+        if highlight:
+            post_script = self.get_highlight_script(**kwargs)
+        write_html(self.iter_data(**kwargs), layout, fp, 
+                   include_plotlyjs=include_plotlyjs, binary=binary,
+                   post_script=post_script)
+        
+    def plot(self, show_bias=False, max_neurons=None, backend='svg',
+             top_k=None, threshold=None):
         """ Plot the network.
             
             Parameters
             ----------
             show_bias: bool
                 Set true to show bias neurons.
+            max_neurons: int or None
+                Level of detail. Layers wider than this
+                only draw their first and last neurons
+                and a group glyph for the rest, so the
+                size of the figure is bounded.
+            backend: string
+                'svg' for scatter traces or 'webgl' for
+                scattergl traces, which keeps pan and
+                zoom interactive on dense networks.
+            top_k: int or None
+                With weights, draw only the k edges with 
+                the largest absolute weight per layer pair.
+            threshold: float or None
+                With weights, draw only the edges whose 
+                absolute weight is at least this.
         """
+        from plotly.offline import plot
         self.show_bias = show_bias
-        
-        # Build the layers
-        self.layers = list()
-        for i in range(len(self.layer_sizes)):
-            self.layers.append(Dense(self.layer_sizes[i], 
-                                     x_coord=self.x_coords[i], 
-                                     x_offset=self.x_offsets[i]))
-        
-        # Connect the layers
-        data, layout = connect_layers(self.layers, self.name, self.showgrid)
-        figure = dict(data=data, layout=layout)
+        if self.cache is None:
+            figure, self.layers = self._build_figure(max_neurons=max_neurons,
+                                                     backend=backend,
+                                                     top_k=top_k,
+                                                     threshold=threshold)
+        else:
+            figure = self.to_figure(max_neurons=max_neurons, backend=backend,
+                                    top_k=top_k, threshold=threshold)
         plot(figure)
 
-
@@ -1,5 +1,5 @@
-import keras_loader
-import fc
+from visualnn import keras_loader
+from visualnn import fc
 from keras.models import Sequential
 from keras.layers.normalization import BatchNormalization
 from keras.layers.convolutional import Conv2D
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+
+# Style of the frame drawn around a folded block
+BADGE_COLOR = 'rgb(90, 90, 90)'
+
+def find_repeats(tokens, min_repeats=2, max_period=None):
+    """ Find the runs of a block of tokens repeated back
+        to back, e.g. the conv-bn-relu blocks of a deep
+        network. The sequence is scanned from the start
+        and at each position the run saving the most
+        tokens is taken, the shortest block on ties.
+
+        Parameters
+        ----------
+        tokens: list
+            Comparable tokens, one per layer.
+        min_repeats: int
+            Minimum no. of back to back copies of a block.
+        max_period: int or None
+            Maximum no. of tokens in a block.
+
+        Returns
+        -------
+        repeats: list of tuples
+            (start, period, count) of each run: the block
+            tokens[start:start + period] is repeated count
+            times.
+    """
+    if min_repeats < 2:
+        raise ValueError('min_repeats must be at least 2, got ' +
+                         str(min_repeats))
+
+    n = len(tokens)
+    repeats = list()
+    i = 0
+    while i < n:
+        best = None
+        longest = (n - i)//min_repeats
+        if max_period is not None:
+            longest = min(longest, max_period)
+        for period in range(1, longest + 1):
+            block = tokens[i:i + period]
+            count = 1
+            while tokens[i + count*period:i + (count + 1)*period] == block:
+                count += 1
+            saved = (count - 1)*period
+            if count >= min_repeats and (best is None or saved > best[0]):
+                best = (saved, period, count)
+
+        if best is None:
+            i += 1
+        else:
+            _, period, count = best
+            repeats.append((i, period, count))
+            i += period*count
+
+    return repeats
+
+def fold_indices(n, repeats):
+    """ Indices kept when each run of repeats is folded
+        into one copy of its block.
+
+        Parameters
+        ----------
+        n: int
+            No. of tokens.
+        repeats: list of tuples
+            See find_repeats().
+
+        Returns
+        -------
+        kept: list of int
+            Indices of the kept tokens.
+        blocks: list of tuples
+            (start, stop, count) of each folded block, in
+            positions of the kept list.
+    """
+    kept = list()
+    blocks = list()
+    i = 0
+    for start, period, count in repeats:
+        kept += range(i, start + period)
+        blocks.append((len(kept) - period, len(kept), count))
+        i = start + period*count
+    kept += range(i, n)
+
+    return kept, blocks
+
+def shape_tokens(shapes, classes=None):
+    """ Tokens of the shape transitions of a list of
+        layers: (class, input shape, output shape). """
+    tokens = list()
+    previous = None
+    for i, shape in enumerate(shapes):
+        shape = tuple(shape) if isinstance(shape, (list, tuple)) else shape
+        layer_class = None if classes is None else classes[i]
+        tokens.append((layer_class, previous, shape))
+        previous = shape
+
+    return tokens
+
+def fold_layers(layers, min_repeats=2, max_period=None):
+    """ Fold the repeated blocks of a layer list, as
+        returned by keras_loader.loadFromKerasModel().
+        Layers are the same when they have the same class
+        and the same input and output shapes.
+
+        Returns
+        -------
+        layers: list
+            The layer list with one copy of each block.
+        blocks: list of tuples
+            (start, stop, count) of each folded block, see
+            fold_indices().
+    """
+    tokens = shape_tokens([layer[1] for layer in layers],
+                          [layer[0] for layer in layers])
+    kept, blocks = fold_indices(len(layers),
+                                find_repeats(tokens, min_repeats, max_period))
+
+    return [layers[i] for i in kept], blocks
+
+def iter_selected(values, indices):
+    """ Yield the items of an iterable at the given
+        indices, without reading the others into a list.
+    """
+    indices = set(indices)
+    for i, value in enumerate(values):
+        if i in indices:
+            yield value
+
+def get_badges(blocks, extents, pad=0):
+    """ Get the frame and the "×N" badge of each folded
+        block, as layout shapes and annotations.
+
+        Parameters
+        ----------
+        blocks: list of tuples
+            (start, stop, count) of each block.
+        extents: list of tuples
+            (x0, x1, y0, y1) of each drawn layer.
+        pad: int or float
+            Margin between the layers and the frame.
+    """
+    shapes = list()
+    annotations = list()
+    for start, stop, count in blocks:
+        x0 = min(extent[0] for extent in extents[start:stop]) - pad
+        x1 = max(extent[1] for extent in extents[start:stop]) + pad
+        y0 = min(extent[2] for extent in extents[start:stop]) - pad
+        y1 = max(extent[3] for extent in extents[start:stop]) + pad
+
+        shapes.append({
+            'type': 'rect',
+            'x0': x0,
+            'y0': y0,
+            'x1': x1,
+            'y1': y1,
+            'line': {
+                'color': BADGE_COLOR,
+                'width': 1,
+                'dash': 'dash',
+            },
+        })
+        n_layers = stop - start
+        annotations.append(dict(
+            x=(x0 + x1)/2, y=y1, yanchor='bottom', showarrow=False,
+            text='×' + str(count),
+            font=dict(color='white'), bgcolor=BADGE_COLOR,
+            hovertext=str(n_layers) + (' layer' if n_layers == 1 else
+                                       ' layers') +
+                      ' repeated ' + str(count) + ' times'))
+
+    return shapes, annotations
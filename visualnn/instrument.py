@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+""" Opt-in instrumentation of the stages of a render.
+
+The loaders, the models and the backend wrap their stages
+in stage(). Nothing is recorded unless a collector is
+active, a callback is registered or the 'visualnn' logger
+is enabled for DEBUG:
+
+    with instrument.collect() as stats:
+        model = keras_loader.loadFromFile('mlp1.h5')
+        model.to_html()
+    print(stats)
+
+Each record is a dict with the name of the stage, its
+duration in seconds and counts set by the stage (objects,
+traces, bytes, ...). With collect(trace_memory=True), the
+memory allocated in each stage is recorded too.
+"""
+
+import logging
+import threading
+import time
+import tracemalloc
+
+from contextlib import contextmanager
+
+logger = logging.getLogger('visualnn')
+
+_collectors = list()
+_callbacks = list()
+_lock = threading.Lock()
+
+class Stats:
+
+    def __init__(self, trace_memory=False):
+        """ Totals of the records of each stage.
+
+            Parameters
+            ----------
+            trace_memory: bool
+                Record the memory allocated in each stage,
+                with tracemalloc.
+        """
+        self.trace_memory = trace_memory
+        self.records = list()
+        self._lock = threading.Lock()
+
+    def add(self, record):
+        with self._lock:
+            self.records.append(record)
+
+    def stages(self):
+        """ Get the totals of each stage, in the order in
+            which the stages first ran.
+
+            Returns
+            -------
+            stages: dict
+                For each stage, the no. of calls, the total
+                and maximum seconds, and the sum of each
+                count set by the stage.
+        """
+        stages = dict()
+        with self._lock:
+            records = list(self.records)
+        for record in records:
+            total = stages.setdefault(record['stage'],
+                                      dict(calls=0, seconds=0.0,
+                                           max_seconds=0.0))
+            total['calls'] += 1
+            total['seconds'] += record['seconds']
+            total['max_seconds'] = max(total['max_seconds'],
+                                       record['seconds'])
+            for key, value in record.items():
+                if key not in ('stage', 'seconds') and \
+                        isinstance(value, (int, float)):
+                    total[key] = total.get(key, 0) + value
+        return stages
+
+    def as_dict(self):
+        return dict(stages=self.stages(), records=list(self.records))
+
+    def __str__(self):
+        lines = ['%-32s %6s %10s' % ('stage', 'calls', 'seconds')]
+        for name, total in self.stages().items():
+            counts = ', '.join(key + '=' + str(value)
+                               for key, value in total.items()
+                               if key not in ('calls', 'seconds',
+                                              'max_seconds'))
+            lines.append('%-32s %6d %10.4f  %s' % (name, total['calls'],
+                                                   total['seconds'], counts))
+        return '\n'.join(lines)
+
+@contextmanager
+def collect(trace_memory=False):
+    """ Context manager collecting the records of the
+        stages run inside it into a Stats object, which
+        it returns. Collectors can be nested.
+
+        Parameters
+        ----------
+        trace_memory: bool
+            See Stats.
+    """
+    stats = Stats(trace_memory=trace_memory)
+    started = trace_memory and not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    with _lock:
+        _collectors.append(stats)
+    try:
+        yield stats
+    finally:
+        with _lock:
+            _collectors.remove(stats)
+        if started:
+            tracemalloc.stop()
+
+def add_callback(callback):
+    """ Register a function called with each record. """
+    with _lock:
+        _callbacks.append(callback)
+
+def remove_callback(callback):
+    with _lock:
+        _callbacks.remove(callback)
+
+def enabled():
+    """ Whether stages are recorded at all. """
+    return bool(_collectors or _callbacks) or \
+        logger.isEnabledFor(logging.DEBUG)
+
+def _emit(record):
+    """ Pass a record to the collectors, the callbacks
+        and the logger. """
+    with _lock:
+        collectors = list(_collectors)
+        callbacks = list(_callbacks)
+    for stats in collectors:
+        stats.add(record)
+    for callback in callbacks:
+        callback(record)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(' '.join(key + '=' + (format(value, '.6f')
+                                           if isinstance(value, float)
+                                           else str(value))
+                              for key, value in record.items()))
+
+@contextmanager
+def stage(name, **counts):
+    """ Context manager timing one stage of a render. It
+        returns the record, so that the stage can add its
+        counts to it, e.g. record['traces'] = len(data).
+        When instrumentation is off, the record is thrown
+        away and the stage is not timed.
+
+        Parameters
+        ----------
+        name: string
+            Name of the stage, e.g. 'fc.edges'.
+        counts: keyword arguments
+            Counts known before the stage runs.
+    """
+    if not enabled():
+        yield dict()
+        return
+
+    record = dict(stage=name, **counts)
+    memory = tracemalloc.is_tracing()
+    if memory:
+        allocated = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    try:
+        yield record
+    except BaseException as e:
+        record['error'] = type(e).__name__
+        raise
+    finally:
+        record['seconds'] = time.perf_counter() - start
+        if memory and tracemalloc.is_tracing():
+            record['allocated_bytes'] = \
+                tracemalloc.get_traced_memory()[0] - allocated
+        _emit(record)
@@ -0,0 +1,341 @@
+#!/usr/bin/env python
+""" Editable MLPs for notebooks, with incremental updates.
+
+An EditableMLP keeps the layers and the edges of each pair of
+layers of a network. Inserting, removing or resizing a layer
+rebuilds only that layer and the edges next to it; the layers
+after an inserted or removed one only move along x. The
+changes are then pushed to a bound Plotly figure as a diff:
+the traces that changed are updated in place, the new ones
+are added and the old ones removed.
+
+    net = EditableMLP([784, 128, 64, 10])
+    widget = net.widget()    # display it in the notebook
+    net.resize(1, 256)
+    net.insert(2, 32)
+    net.remove(3)
+
+Each trace has a stable uid, 'layer-<id>-<j>' or
+'edges-<id>-<id>-<j>', where the ids are given to the layers
+when they are created and never reused.
+"""
+
+import numpy as np
+
+from .backend import set_backend
+from .fc import Dense, connect, get_standard_layout, num_slots
+from .instrument import stage
+
+class EditableMLP:
+
+    def __init__(self, layer_sizes, n_color='blue', showgrid=False,
+                 name='Multi-Layer Perceptron', max_neurons=None,
+                 backend='svg'):
+        """ Class for a multi-layer perceptron whose layers
+            can be edited, with the figure updated
+            incrementally.
+
+            Parameters
+            ----------
+            layer_sizes: list
+                Sizes of each layer, at least one.
+            n_color: string (plotly color)
+                Color of the neurons and the edges.
+            showgrid: bool
+                Set true to show the grid.
+            name: string
+                Title of plot.
+            max_neurons: int or None
+                Maximum no. of neurons drawn per layer, see
+                fc.Dense.
+            backend: string
+                'svg' for scatter traces or 'webgl' for
+                scattergl traces.
+        """
+        if not len(layer_sizes):
+            raise ValueError('Expected at least one layer')
+
+        self.name = name
+        self.n_color = n_color
+        self.showgrid = showgrid
+        self.max_neurons = max_neurons
+        self.backend = backend
+        self.figure = None
+
+        self._sizes = list(layer_sizes)
+        self._ids = list(range(len(self._sizes)))
+        self._next_id = len(self._ids)
+
+        # Layers and traces by id, and edge traces by pair of ids
+        self._layers = dict()
+        self._layer_data = dict()
+        self._edge_data = dict()
+        # Properties to push to the figure, by trace uid
+        self._changes = dict()
+
+        self._set_reference()
+        self._rebuild()
+
+    # Building
+
+    @property
+    def layer_sizes(self):
+        """ Sizes of the layers, as a new list. """
+        return list(self._sizes)
+
+    def _slots(self, size):
+        return num_slots(size, self.max_neurons)
+
+    def _set_reference(self):
+        """ Set the line on which the layers are centered.
+            It only moves when a layer outgrows it, so that
+            the other layers keep their coordinates. """
+        self.reference = max(self._slots(size) for size in self._sizes)
+
+    def _mark(self, trace, props=None):
+        """ Record the properties of a trace to push, all
+            of them by default. """
+        if props is None:
+            props = {key: value for key, value in trace.items()
+                     if key not in ('type', 'uid')}
+        self._changes.setdefault(trace['uid'], dict()).update(props)
+
+    def _build_layer(self, i):
+        """ Build the layer at index i and its traces. """
+        size = self._sizes[i]
+        layer = Dense(size, x_coord=i + 1,
+                      x_offset=self.reference - self._slots(size) + 1,
+                      n_color=self.n_color, showgrid=self.showgrid,
+                      max_neurons=self.max_neurons)
+        layer_id = self._ids[i]
+        self._layers[layer_id] = layer
+        self._layer_data[layer_id] = [
+            dict(trace, uid='layer-%d-%d' % (layer_id, j))
+            for j, trace in enumerate(set_backend(layer.data, self.backend))]
+        for trace in self._layer_data[layer_id]:
+            self._mark(trace)
+
+    def _build_edges(self, i):
+        """ Build the edges between the layers at index i
+            and i + 1. """
+        key = (self._ids[i], self._ids[i + 1])
+        traces = connect(self._layers[key[0]], self._layers[key[1]],
+                         color=self.n_color)
+        self._edge_data[key] = [
+            dict(trace, uid='edges-%d-%d-%d' % (key + (j,)))
+            for j, trace in enumerate(set_backend(traces, self.backend))]
+        for trace in self._edge_data[key]:
+            self._mark(trace)
+
+    def _shift(self, start, delta):
+        """ Move the layers from index start on, and the
+            edges between them, by delta along x. Only the
+            x-coords of their traces are pushed. """
+        for i in range(start, len(self._sizes)):
+            layer_id = self._ids[i]
+            self._build_layer(i)
+            # Same traces as before apart from x
+            for trace in self._layer_data[layer_id]:
+                self._changes[trace['uid']] = dict(x=trace['x'])
+
+            if i + 1 < len(self._sizes):
+                key = (layer_id, self._ids[i + 1])
+                for trace in self._edge_data[key]:
+                    trace['x'] = np.asarray(trace['x'], dtype=float) + delta
+                    self._mark(trace, dict(x=trace['x']))
+
+    def _rebuild(self):
+        """ Build every layer and edge. """
+        self._layers.clear()
+        self._layer_data.clear()
+        self._edge_data.clear()
+        for i in range(len(self._sizes)):
+            self._build_layer(i)
+        for i in range(len(self._sizes) - 1):
+            self._build_edges(i)
+
+    def _check_reference(self):
+        """ Rebuild everything if a layer outgrew the
+            reference line. Returns whether it did. """
+        largest = max(self._slots(size) for size in self._sizes)
+        if largest <= self.reference:
+            return False
+        self.reference = largest
+        self._rebuild()
+        return True
+
+    def _index(self, index, n):
+        """ Normalize a (possibly negative) index into
+            range(n). """
+        if not -n <= index < n:
+            raise IndexError('Layer index ' + str(index) +
+                             ' out of range for ' + str(n) + ' layers')
+        return index % n
+
+    # Edits
+
+    def resize(self, index, size):
+        """ Set the no. of neurons of a layer. Only the
+            layer and the edges on either side of it are
+            rebuilt.
+
+            Parameters
+            ----------
+            index: int
+                Index of the layer.
+            size: int
+                New no. of neurons.
+        """
+        with stage('interactive.resize') as record:
+            i = self._index(index, len(self._sizes))
+            self._sizes[i] = size
+            if not self._check_reference():
+                self._build_layer(i)
+                if i > 0:
+                    self._build_edges(i - 1)
+                if i + 1 < len(self._sizes):
+                    self._build_edges(i)
+            record['traces'] = self._push()
+
+    def insert(self, index, size):
+        """ Insert a layer before the layer at index (at the
+            end if index is the no. of layers). The layers
+            after it move right.
+
+            Parameters
+            ----------
+            index: int
+                Index of the new layer.
+            size: int
+                No. of neurons of the new layer.
+        """
+        with stage('interactive.insert') as record:
+            n = len(self._sizes)
+            i = n if index == n else self._index(index, n)
+            if 0 < i < n:
+                del self._edge_data[(self._ids[i - 1], self._ids[i])]
+
+            self._sizes.insert(i, size)
+            self._ids.insert(i, self._next_id)
+            self._next_id += 1
+
+            if not self._check_reference():
+                self._shift(i + 1, 1)
+                self._build_layer(i)
+                if i > 0:
+                    self._build_edges(i - 1)
+                if i + 1 < len(self._sizes):
+                    self._build_edges(i)
+            record['traces'] = self._push()
+
+    def remove(self, index):
+        """ Remove a layer. The layers after it move left
+            and its neighbours are connected.
+
+            Parameters
+            ----------
+            index: int
+                Index of the layer.
+        """
+        with stage('interactive.remove') as record:
+            n = len(self._sizes)
+            if n == 1:
+                raise ValueError('Cannot remove the only layer')
+            i = self._index(index, n)
+
+            layer_id = self._ids.pop(i)
+            self._sizes.pop(i)
+            del self._layers[layer_id]
+            del self._layer_data[layer_id]
+            for key in list(self._edge_data):
+                if layer_id in key:
+                    del self._edge_data[key]
+
+            # The reference is kept, so the other layers stay put
+            self._shift(i, -1)
+            if 0 < i < n - 1:
+                self._build_edges(i - 1)
+            record['traces'] = self._push()
+
+    # Output
+
+    @property
+    def data(self):
+        """ Traces of the network, the edges below the
+            neurons. """
+        data = list()
+        for i in range(len(self._ids) - 1):
+            data += self._edge_data[(self._ids[i], self._ids[i + 1])]
+        for layer_id in self._ids:
+            data += self._layer_data[layer_id]
+        return data
+
+    def get_layout(self):
+        """ Get the layout of the figure of the network. """
+        y_max = max(layer.max_y for layer in self._layers.values())
+        return get_standard_layout(0, len(self._sizes) + 1, 0, y_max,
+                                   self.name, self.showgrid)
+
+    def to_figure(self):
+        """ Get the figure of the network as a dict. """
+        return dict(data=self.data, layout=self.get_layout())
+
+    def bind(self, figure):
+        """ Push the edits to a figure from now on. Its
+            traces are replaced by those of the network.
+
+            Parameters
+            ----------
+            figure: plotly.graph_objs.FigureWidget or Figure
+                The figure. Edits of a FigureWidget shown
+                in a notebook are sent to the browser as
+                the changed properties only.
+        """
+        figure.data = list()
+        figure.add_traces(self.data)
+        figure.layout.update(self.get_layout())
+        self.figure = figure
+        self._changes.clear()
+        return figure
+
+    def widget(self):
+        """ Get a FigureWidget bound to the network (needs
+            ipywidgets). """
+        import plotly.graph_objs as go
+
+        return self.bind(go.FigureWidget())
+
+    def _push(self):
+        """ Push the recorded changes to the bound figure.
+            Returns the no. of traces changed or added. """
+        changes, self._changes = self._changes, dict()
+        if self.figure is None:
+            return len(changes)
+
+        figure = self.figure
+        data = self.data
+        uids = [trace['uid'] for trace in data]
+        wanted = set(uids)
+
+        # Removed traces
+        kept = [trace for trace in figure.data if trace.uid in wanted]
+        if len(kept) < len(figure.data):
+            figure.data = kept
+
+        # Changed traces, and the layout, in one message
+        current = {trace.uid: trace for trace in figure.data}
+        with figure.batch_update():
+            for uid, props in changes.items():
+                if uid in current:
+                    current[uid].update(props)
+            figure.layout.update(self.get_layout())
+
+        # New traces, then their order
+        new = [trace for trace in data if trace['uid'] not in current]
+        if new:
+            figure.add_traces(new)
+        if [trace.uid for trace in figure.data] != uids:
+            by_uid = {trace.uid: trace for trace in figure.data}
+            figure.data = [by_uid[uid] for uid in uids]
+
+        return len(changes)
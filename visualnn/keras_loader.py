@@ -1,8 +1,20 @@
 #!/usr/bin/env python
 
-from keras.models import load_model
-from keras.models import model_from_json
-from fc import MultiLayerPerceptron
+import json
+
+from .fc import MultiLayerPerceptron
+from .convnet import ConvNet2D
+from .instrument import stage
+
+# Layers that do not change the shape of their input
+PASSTHROUGH_LAYERS = ('Activation', 'Dropout', 'BatchNormalization',
+                      'SpatialDropout2D', 'GaussianNoise', 'GaussianDropout',
+                      'AlphaDropout', 'ActivityRegularization', 'Masking',
+                      'LeakyReLU', 'PReLU', 'ELU', 'ThresholdedReLU',
+                      'ReLU', 'Softmax')
+
+# Layers listed by loadFromKerasModel()
+DRAWN_LAYERS = ('Dense', 'Conv2D', 'Flatten', 'MaxPooling2D')
 
 def loadFromKerasModel(model):
     layers = []
@@ -22,38 +34,622 @@ def loadFromKerasModel(model):
                 layers.append(['Dense', layer.output_shape[1:]])
             else:
                 layers.append([layerClass, layer.output_shape[1:]])
-            
+
             if layerClass != 'Dense':
                 allDense = 0
     return layers, allDense
 
-def kerasToVnn(model):
-    layers, allDense = loadFromKerasModel(model)
-    if allDense:
-        units = []
-        for layer in layers:
-            units.append(layer[1][0])
-        vnnModel = MultiLayerPerceptron(layer_sizes=units,showgrid=True)
+def _pair(value):
+    """ Expand an int or a sequence into a pair. """
+    if isinstance(value, int):
+        return (value, value)
+    return tuple(value)
+
+def _windowOutput(size, kernel, stride, padding, dilation=1):
+    """ Output length of a sliding window along one axis. """
+    if size is None:
+        return None
+    if padding == 'same':
+        return -(-size // stride)
+    if padding == 'valid':
+        return (size - dilation*(kernel - 1) - 1) // stride + 1
+    raise ValueError('Unsupported padding ' + repr(padding))
+
+def _windowShape(shape, kernel, strides, padding, dataFormat, channels,
+                 dilation=(1, 1)):
+    """ Output shape (without batch axis) of a 2D
+        sliding window layer. """
+    if dataFormat == 'channels_first':
+        c, h, w = shape
+    else:
+        h, w, c = shape
+    if channels is None:
+        channels = c
+
+    h = _windowOutput(h, kernel[0], strides[0], padding, dilation[0])
+    w = _windowOutput(w, kernel[1], strides[1], padding, dilation[1])
+
+    if dataFormat == 'channels_first':
+        return (channels, h, w)
+    return (h, w, channels)
+
+def inferOutputShape(layerClass, config, shape):
+    """ Infer the output shape (without batch axis) of
+        a Keras layer from its config, without building
+        the layer.
+
+        Parameters
+        ----------
+        layerClass: string
+            Class name of the layer.
+        config: dict
+            Config of the layer, as saved by Keras.
+        shape: tuple
+            Input shape of the layer, without batch axis.
+    """
+    if layerClass == 'Dense':
+        return tuple(shape[:-1]) + (config['units'],)
+
+    if layerClass == 'Conv2D':
+        kernel = _pair(config['kernel_size'])
+        return _windowShape(shape, kernel,
+                            _pair(config.get('strides', 1)),
+                            config.get('padding', 'valid'),
+                            config.get('data_format', 'channels_last'),
+                            config['filters'],
+                            _pair(config.get('dilation_rate', 1)))
+
+    if layerClass == 'SeparableConv2D':
+        return inferOutputShape('Conv2D', config, shape)
+
+    if layerClass == 'DepthwiseConv2D':
+        dataFormat = config.get('data_format', 'channels_last')
+        channels = shape[0] if dataFormat == 'channels_first' else shape[-1]
+        if channels is not None:
+            channels *= config.get('depth_multiplier', 1)
+        return _windowShape(shape, _pair(config['kernel_size']),
+                            _pair(config.get('strides', 1)),
+                            config.get('padding', 'valid'), dataFormat,
+                            channels, _pair(config.get('dilation_rate', 1)))
+
+    if layerClass in ('MaxPooling2D', 'AveragePooling2D'):
+        pool = _pair(config.get('pool_size', 2))
+        strides = config.get('strides')
+        return _windowShape(shape, pool,
+                            pool if strides is None else _pair(strides),
+                            config.get('padding', 'valid'),
+                            config.get('data_format', 'channels_last'),
+                            None)
+
+    if layerClass in ('GlobalAveragePooling2D', 'GlobalMaxPooling2D'):
+        dataFormat = config.get('data_format', 'channels_last')
+        if config.get('keepdims'):
+            if dataFormat == 'channels_first':
+                return (shape[0], 1, 1)
+            return (1, 1, shape[-1])
+        return (shape[0],) if dataFormat == 'channels_first' else (shape[-1],)
+
+    if layerClass == 'ZeroPadding2D':
+        padding = config.get('padding', 1)
+        if isinstance(padding, int):
+            padding = ((padding, padding), (padding, padding))
+        padding = [_pair(pad) for pad in padding]
+        axes = (1, 2) if config.get('data_format') == 'channels_first' \
+            else (0, 1)
+        shape = list(shape)
+        for axis, pad in zip(axes, padding):
+            if shape[axis] is not None:
+                shape[axis] += sum(pad)
+        return tuple(shape)
+
+    if layerClass == 'Reshape':
+        target = list(config['target_shape'])
+        if -1 in target and None not in shape:
+            size = 1
+            for dim in shape:
+                size *= dim
+            known = 1
+            for dim in target:
+                if dim != -1:
+                    known *= dim
+            target[target.index(-1)] = size // known
+        return tuple(None if dim == -1 else dim for dim in target)
+
+    if layerClass == 'Flatten':
+        if None in shape:
+            return (None,)
+        size = 1
+        for dim in shape:
+            size *= dim
+        return (size,)
+
+    if layerClass in PASSTHROUGH_LAYERS:
+        return tuple(shape)
+
+    raise ValueError('Cannot infer the output shape of ' + layerClass +
+                     ' layers, load the model with fast=False')
+
+def inferMergeShape(layerClass, config, shapes):
+    """ Infer the output shape (without batch axis) of
+        a Keras merge layer, such as Add or Concatenate,
+        from the shapes of its inputs.
+    """
+    if layerClass == 'Concatenate':
+        axis = config.get('axis', -1)
+        shape = list(shapes[0])
+        if any(s[axis] is None for s in shapes):
+            shape[axis] = None
+        else:
+            shape[axis] = sum(s[axis] for s in shapes)
+        return tuple(shape)
+
+    if layerClass in ('Add', 'Subtract', 'Multiply', 'Average', 'Maximum',
+                      'Minimum'):
+        return tuple(shapes[0])
+
+    raise ValueError('Cannot infer the output shape of ' + layerClass +
+                     ' layers')
+
+def _configInputShape(config):
+    """ Input shape (without batch axis) declared in a
+        layer config, or None. """
+    for key in ('batch_input_shape', 'batch_shape'):
+        if config.get(key) is not None:
+            return tuple(config[key][1:])
+    if config.get('input_shape') is not None:
+        return tuple(config['input_shape'])
+    return None
+
+def _inboundNames(layerConfig):
+    """ Names of the layers feeding a layer, in the
+        Keras 2 and Keras 3 formats of inbound nodes. """
+    names = []
+
+    def visit(value):
+        if isinstance(value, dict):
+            # Keras 3 saves tensors with their keras_history
+            history = (value.get('config') or {}).get('keras_history')
+            if value.get('class_name') == '__keras_tensor__' and history:
+                names.append(history[0])
+            else:
+                for item in value.values():
+                    visit(item)
+        elif isinstance(value, list):
+            # Keras 2 saves [layer name, node index, tensor index, kwargs]
+            if len(value) >= 3 and isinstance(value[0], str) and \
+                    isinstance(value[1], int):
+                names.append(value[0])
+            else:
+                for item in value:
+                    visit(item)
+
+    for node in layerConfig.get('inbound_nodes') or []:
+        if isinstance(node, dict):
+            node = node.get('args') or []
+        visit(node)
+    return names
+
+def loadFromConfig(modelConfig):
+    """ Get the same layer list as loadFromKerasModel()
+        from a saved model config, using shape inference
+        instead of building the model.
+
+        Parameters
+        ----------
+        modelConfig: dict
+            Model config, as saved in the model_config
+            attribute of a .h5 file or in a .json file.
+    """
+    config = modelConfig['config']
+    # Keras < 2.2 saves a Sequential config as a plain list
+    if isinstance(config, dict):
+        layerConfigs = config['layers']
+    else:
+        layerConfigs = config
+
+    shape = None
+    layers = []
+    allDense = 1
+    previous = None
+    for layerConfig in layerConfigs:
+        layerClass = layerConfig['class_name']
+        name = layerConfig.get('name') or layerConfig['config'].get('name')
+        # Layers of a Sequential model have no inbound nodes
+        inbound = _inboundNames(layerConfig)
+        if len(layerConfig.get('inbound_nodes') or []) > 1 or \
+                (inbound and inbound != [previous]):
+            raise ValueError('Layer ' + str(name) + ' is not chained to '
+                             'the previous layer, load the graph of the '
+                             'model with loadGraphFromConfig()')
+        previous = name
+
+        if shape is None:
+            shape = _configInputShape(layerConfig['config'])
+            if shape is None:
+                raise ValueError('The model config does not declare an input shape')
+            if len(shape) == 1:
+                layers.append(['Dense', shape])
+            else:
+                allDense = 0
+                layers.append(['Conv2D', shape])
+        if layerClass == 'InputLayer':
+            continue
+
+        shape = inferOutputShape(layerClass, layerConfig['config'], shape)
+
+        if layerClass == 'MaxPooling2D':
+            layers.append(['Conv2D', shape])
+        elif layerClass == 'Flatten':
+            layers.append(['Dense', shape])
+        elif layerClass == 'Dense' or layerClass == 'Conv2D':
+            layers.append([layerClass, shape])
+        else:
+            continue
+
+        if layerClass != 'Dense':
+            allDense = 0
+    return layers, allDense
+
+def loadGraphFromConfig(modelConfig):
+    """ Get the graph of layers of a saved model config,
+        with branches, merges and skip connections, using
+        shape inference. Layers whose shape cannot be
+        inferred get the shape None.
+
+        Parameters
+        ----------
+        modelConfig: dict
+            Model config, as saved in the model_config
+            attribute of a .h5 file or in a .json file.
+
+        Returns
+        -------
+        nodes: list
+            [class name, output shape, name] of each 
+            layer, see dag.LayerGraph.
+        edges: list of pairs
+            (source, target) indices into nodes.
+    """
+    from .dag import MERGE_LAYERS, topological_order
+
+    config = modelConfig['config']
+    if isinstance(config, dict):
+        layerConfigs = config['layers']
     else:
-        layers_conv = []
-        layers_dense = []
-        for layer in layers:
-            print(layer)
-            if layer[0] == 'Conv2D':
-                layers_conv.append(layer[1])
+        layerConfigs = config
+
+    names = {}
+    nodes = []
+    configs = []
+    edges = []
+    for layerConfig in layerConfigs:
+        layerClass = layerConfig['class_name']
+        name = layerConfig.get('name') or layerConfig['config'].get('name')
+        if name is None:
+            name = layerClass.lower() + '_' + str(len(nodes))
+        
+        inbound = _inboundNames(layerConfig)
+        if not inbound and nodes and 'inbound_nodes' not in layerConfig:
+            # Layer of a Sequential model
+            inbound = [nodes[-1][2]]
+        elif not inbound and layerClass != 'InputLayer':
+            # First layer of a Sequential model, add its input
+            shape = _configInputShape(layerConfig['config'])
+            if shape is not None:
+                names[name + '_input'] = len(nodes)
+                nodes.append(['InputLayer', shape, name + '_input'])
+                configs.append({'batch_input_shape': (None,) + shape})
+                inbound = [name + '_input']
+
+        index = len(nodes)
+        names[name] = index
+        nodes.append([layerClass, None, name])
+        configs.append(layerConfig['config'])
+        for source in inbound:
+            if source not in names:
+                raise ValueError('Layer ' + name + ' has an unknown input ' +
+                                 source)
+            # Shared layers are drawn once
+            if (names[source], index) not in edges:
+                edges.append((names[source], index))
+
+    preds = [[] for _ in nodes]
+    for u, v in edges:
+        preds[v].append(u)
+
+    for v in topological_order(len(nodes), edges):
+        layerClass = nodes[v][0]
+        shapes = [nodes[u][1] for u in preds[v]]
+        try:
+            if not shapes:
+                nodes[v][1] = _configInputShape(configs[v])
+            elif None in shapes:
+                continue
+            elif len(shapes) > 1 or layerClass in MERGE_LAYERS:
+                nodes[v][1] = inferMergeShape(layerClass, configs[v], shapes)
             else:
-                layers_dense.append(layer[1][0])
-        print(layers_dense,layers_conv)
-        vnnModel = ConvNet2D(layers_conv, layers_dense)
-    return vnnModel
-
-def loadFromFile(filepath):
-    model = load_model(filepath)
-    return kerasToVnn(model)
-
-def loadFromJSON(filepath):
-    json_file = open(filepath, 'r')
-    loaded_model_json = json_file.read()
-    json_file.close()
-    loaded_model = model_from_json(loaded_model_json)
-    return kerasToVnn(loaded_model)
\ No newline at end of file
+                nodes[v][1] = inferOutputShape(layerClass, configs[v],
+                                               shapes[0])
+        except (ValueError, KeyError, TypeError, IndexError):
+            # Unknown layers are drawn without a shape
+            nodes[v][1] = None
+
+    return nodes, edges
+
+def loadConfigFromFile(filepath):
+    """ Read the model config of a saved Keras model
+        without loading Keras or the weights. """
+    import h5py
+
+    with stage('keras_loader.read_config') as record:
+        with h5py.File(filepath, 'r') as f:
+            modelConfig = f.attrs.get('model_config')
+        if modelConfig is None:
+            raise ValueError('No model config found in ' + str(filepath))
+        if isinstance(modelConfig, bytes):
+            modelConfig = modelConfig.decode('utf-8')
+        record['bytes'] = len(modelConfig)
+        return json.loads(modelConfig)
+
+def loadConfigFromJSON(filepath):
+    """ Read a saved Keras architecture. """
+    with stage('keras_loader.read_config'):
+        with open(filepath, 'r') as json_file:
+            return json.load(json_file)
+
+def _inferLayers(modelConfig):
+    """ loadFromConfig(), as an instrumented stage. """
+    with stage('keras_loader.infer_shapes') as record:
+        layers, allDense = loadFromConfig(modelConfig)
+        record['layers'] = len(layers)
+    return layers, allDense
+
+def _inferGraph(modelConfig):
+    """ loadGraphFromConfig(), as an instrumented stage. """
+    with stage('keras_loader.infer_graph') as record:
+        nodes, edges = loadGraphFromConfig(modelConfig)
+        record['layers'] = len(nodes)
+        record['edges'] = len(edges)
+    return nodes, edges
+
+def _readKernel(dataset):
+    """ Read a kernel from an HDF5 dataset. Contiguous,
+        uncompressed datasets are memory-mapped instead
+        of being read into memory. """
+    import numpy as np
+
+    with stage('keras_loader.read_kernel') as record:
+        record['bytes'] = dataset.size*dataset.dtype.itemsize
+        offset = dataset.id.get_offset()
+        if offset is None or dataset.chunks is not None or \
+                dataset.compression is not None:
+            return dataset[()]
+        record['mapped'] = 1
+        return np.memmap(dataset.file.filename, mode='r', 
+                         dtype=dataset.dtype, offset=offset, 
+                         shape=dataset.shape)
+
+def _decode(name):
+    if isinstance(name, bytes):
+        return name.decode('utf-8')
+    return name
+
+def _iterKernels(filepath, ndim):
+    """ Yield the names and kernels with ndim axes of the
+        layers of a saved Keras model, in the order of the
+        layers. """
+    import h5py
+
+    with h5py.File(filepath, 'r') as f:
+        group = f['model_weights'] if 'model_weights' in f else f
+        for layerName in group.attrs['layer_names']:
+            layerName = _decode(layerName)
+            layerGroup = group[layerName]
+            for weightName in layerGroup.attrs['weight_names']:
+                weightName = _decode(weightName)
+                dataset = layerGroup[weightName]
+                if 'kernel' in weightName.split('/')[-1] and \
+                        len(dataset.shape) == ndim:
+                    yield layerName, _readKernel(dataset)
+
+def iterKernels(filepath):
+    """ Yield the 2D kernels (Dense layers) of a saved
+        Keras model one layer at a time, in the order of
+        the layers, without loading Keras. """
+    for _, kernel in _iterKernels(filepath, 2):
+        yield kernel
+
+def iterConvKernels(filepath):
+    """ Yield the names and the 4D kernels (Conv2D layers,
+        of shape (height, width, input channels, filters))
+        of a saved Keras model one layer at a time, without
+        loading Keras. See kernels.KernelMosaic to view
+        them. """
+    for layerName, kernel in _iterKernels(filepath, 4):
+        yield layerName, kernel
+
+def iterKerasKernels(model):
+    """ Yield the kernels of the Dense layers of a Keras
+        model one layer at a time. """
+    for layer in model.layers:
+        if layer.__class__.__name__ == 'Dense':
+            yield layer.get_weights()[0]
+
+def iterKerasConvKernels(model):
+    """ Yield the names and the kernels of the Conv2D
+        layers of a Keras model one layer at a time. """
+    for layer in model.layers:
+        if layer.__class__.__name__ == 'Conv2D':
+            yield layer.name, layer.get_weights()[0]
+
+def kerasActivations(model, inputs, reduce='mean', batchSize=256):
+    """ Get the activations of the layers listed by
+        loadFromKerasModel(), reduced over a set of inputs.
+
+        The inputs go through one model with the outputs of
+        those layers, a batch at a time, and each batch of
+        activations is reduced as soon as it is computed 
+        (see activations.reduce_activations()), so that 
+        inputs of any size can be streamed.
+
+        Parameters
+        ----------
+        model: keras.Model
+            The model.
+        inputs: np.ndarray or iterable of np.ndarray
+            The inputs, or batches of inputs, e.g. from a
+            generator.
+        reduce: string
+            'mean' or 'max' over the samples (and the
+            spatial axes of conv layers).
+        batchSize: int
+            No. of samples per batch of an array.
+
+        Returns
+        -------
+        values: list of np.ndarray
+            Value of each neuron, or of each channel of 
+            conv layers, of each layer in the layer list.
+    """
+    from keras.models import Model
+    from .activations import reduce_activations
+
+    drawn = [layer for layer in model.layers
+             if layer.__class__.__name__ in DRAWN_LAYERS]
+    probe = Model(inputs=model.inputs,
+                  outputs=[layer.output for layer in drawn])
+
+    def run(batch):
+        outputs = probe.predict_on_batch(batch)
+        if len(drawn) == 1:
+            outputs = [outputs]
+        # The input is the first layer of the list
+        return [batch] + list(outputs)
+
+    return reduce_activations(run, inputs, len(drawn) + 1, reduce=reduce,
+                              batch_size=batchSize)
+
+def layersToVnn(layers, allDense, weights=None, fold=False, 
+                activations=None):
+    """ Build the visual model for a layer list, as
+        returned by loadFromKerasModel(). weights is 
+        passed to MultiLayerPerceptron. With fold=True,
+        blocks of layers repeated back to back are drawn
+        once with an "×N" badge (see folding.py). 
+        activations, one array per layer of the list, 
+        colors the neurons and channels (see 
+        kerasActivations()). """
+    with stage('keras_loader.build_model', layers=len(layers)):
+        if allDense:
+            units = []
+            for layer in layers:
+                units.append(layer[1][0])
+            vnnModel = MultiLayerPerceptron(layer_sizes=units,showgrid=True,
+                                            weights=weights, fold=fold,
+                                            activations=activations)
+        else:
+            layers_conv = []
+            layers_dense = []
+            values_conv = []
+            values_dense = []
+            for i, layer in enumerate(layers):
+                value = None if activations is None else activations[i]
+                if layer[0] == 'Conv2D':
+                    layers_conv.append(layer[1])
+                    values_conv.append(value)
+                else:
+                    layers_dense.append(layer[1][0])
+                    values_dense.append(value)
+            if activations is not None:
+                activations = values_conv + values_dense
+            vnnModel = ConvNet2D(layers_conv, layers_dense, fold=fold,
+                                 activations=activations)
+        return vnnModel
+
+def kerasToVnn(model, weights=False, fold=False, inputs=None, 
+               reduce='mean', batchSize=256):
+    """ Build the visual model of a Keras model. With 
+        weights=True, the edges of an MLP are colored
+        and sized by the weights of the model. See 
+        layersToVnn() for fold. With inputs, the neurons
+        and channels are colored by their mean or max
+        activation over the inputs, see 
+        kerasActivations() for the parameters. """
+    with stage('keras_loader.keras_shapes'):
+        layers, allDense = loadFromKerasModel(model)
+    if weights:
+        weights = lambda: iterKerasKernels(model)
+    else:
+        weights = None
+    activations = None
+    if inputs is not None:
+        activations = kerasActivations(model, inputs, reduce=reduce,
+                                       batchSize=batchSize)
+    return layersToVnn(layers, allDense, weights=weights, fold=fold,
+                       activations=activations)
+
+def loadFromFile(filepath, fast=True, weights=False, fold=False):
+    """ Load a saved Keras model (.h5).
+
+        With fast=True only the architecture is read,
+        Keras is not used and no weights are loaded.
+        With weights=True, the edges of an MLP are 
+        colored and sized by the weights in the file,
+        which are read lazily one layer at a time on
+        each render (see iterKernels()). See 
+        layersToVnn() for fold.
+    """
+    if fast:
+        if weights:
+            weights = lambda: iterKernels(filepath)
+        else:
+            weights = None
+        return layersToVnn(*_inferLayers(loadConfigFromFile(filepath)),
+                           weights=weights, fold=fold)
+    from keras.models import load_model
+    with stage('keras_loader.keras_load'):
+        model = load_model(filepath)
+    return kerasToVnn(model, weights=weights, fold=fold)
+
+def loadFromJSON(filepath, fast=True, fold=False):
+    """ Load a saved Keras architecture (.json).
+
+        With fast=True the architecture is read without
+        building the model in Keras. See layersToVnn()
+        for fold.
+    """
+    if fast:
+        return layersToVnn(*_inferLayers(loadConfigFromJSON(filepath)),
+                           fold=fold)
+    from keras.models import model_from_json
+    with stage('keras_loader.keras_load'):
+        json_file = open(filepath, 'r')
+        loaded_model_json = json_file.read()
+        json_file.close()
+        loaded_model = model_from_json(loaded_model_json)
+    return kerasToVnn(loaded_model, fold=fold)
+
+def graphToVnn(nodes, edges, **kwargs):
+    """ Build the visual graph of layers for the output
+        of loadGraphFromConfig(). Keyword arguments are 
+        passed to dag.LayerGraph. """
+    from .dag import LayerGraph
+    return LayerGraph(nodes, edges, **kwargs)
+
+def kerasGraphToVnn(model, **kwargs):
+    """ Build the visual graph of layers of a Keras
+        model, including functional models with
+        branches, merges and skip connections. """
+    modelConfig = {'class_name': model.__class__.__name__,
+                   'config': model.get_config()}
+    return graphToVnn(*_inferGraph(modelConfig), **kwargs)
+
+def loadGraphFromFile(filepath, **kwargs):
+    """ Load the graph of layers of a saved Keras model
+        (.h5), without loading Keras or the weights. """
+    return graphToVnn(*_inferGraph(loadConfigFromFile(filepath)), **kwargs)
+
+def loadGraphFromJSON(filepath, **kwargs):
+    """ Load the graph of layers of a saved Keras
+        architecture (.json). """
+    return graphToVnn(*_inferGraph(loadConfigFromJSON(filepath)), **kwargs)
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+""" Mosaics of the kernels of Conv2D layers.
+
+All the filters of a layer are tiled into one 2D array with a
+few reshapes, and drawn as a single heatmap instead of one
+subplot per filter:
+
+    for name, kernel in keras_loader.iterConvKernels('model.h5'):
+        KernelMosaic(kernel, name=name).to_image(fp=name + '.png')
+
+Each filter is scaled by its largest absolute weight, so the
+colors compare the weights within a filter, not across filters.
+"""
+
+import numpy as np
+
+from .backend import FigureMixin
+
+# Diverging colorscale, the weights are scaled to [-1, 1]
+COLORSCALE = 'RdBu'
+
+# Layouts of the mosaic
+MODES = ('channels', 'mean')
+
+def normalize_filters(kernel):
+    """ Scale each filter of a kernel by its largest
+        absolute weight.
+
+        Parameters
+        ----------
+        kernel: np.ndarray
+            Kernel of shape (height, width, input channels,
+            filters).
+
+        Returns
+        -------
+        filters: np.ndarray
+            float32 array of shape (filters, input channels,
+            height, width), in [-1, 1].
+    """
+    filters = np.asarray(kernel, dtype=np.float32).transpose(3, 2, 0, 1)
+    scale = np.abs(filters).reshape(len(filters), -1).max(axis=1)
+    scale[scale == 0] = 1
+    return filters/scale[:, np.newaxis, np.newaxis, np.newaxis]
+
+def kernel_mosaic(kernel, mode='channels', pad=1, normalize=True):
+    """ Tile the filters of a Conv2D kernel into one array,
+        with NaN between the tiles.
+
+        Parameters
+        ----------
+        kernel: np.ndarray
+            Kernel of shape (height, width, input channels,
+            filters).
+        mode: string
+            'channels' draws one row per filter and one
+            tile per input channel. 'mean' averages each
+            filter over the input channels and tiles the
+            filters in a square grid.
+        pad: int
+            Cells between two tiles.
+        normalize: bool
+            Scale each filter by its largest absolute
+            weight, see normalize_filters().
+
+        Returns
+        -------
+        mosaic: np.ndarray
+            The 2D float32 array.
+    """
+    if mode not in MODES:
+        raise ValueError('Unknown mode ' + repr(mode) +
+                         ', expected one of ' + ', '.join(MODES))
+    if np.ndim(kernel) != 4:
+        raise ValueError('Expected a kernel of shape (height, width, '
+                         'input channels, filters), got ' +
+                         str(np.shape(kernel)))
+
+    filters = np.asarray(kernel, dtype=np.float32)
+    if mode == 'mean':
+        # One channel, the mean over the input channels
+        filters = filters.mean(axis=2, keepdims=True)
+    if normalize:
+        filters = normalize_filters(filters)
+    else:
+        filters = filters.transpose(3, 2, 0, 1)
+    n_filters, _, height, width = filters.shape
+
+    if mode == 'mean':
+        # Square grid of filters, as (rows, cols, h, w)
+        n_cols = int(np.ceil(np.sqrt(n_filters)))
+        n_rows = -(-n_filters // n_cols)
+        grid = np.full((n_rows*n_cols, height, width), np.nan,
+                       dtype=np.float32)
+        grid[:n_filters] = filters[:, 0]
+        filters = grid.reshape(n_rows, n_cols, height, width)
+    # Otherwise one row per filter, one column per channel
+
+    rows, cols = filters.shape[:2]
+    tiles = np.full((rows, cols, height + pad, width + pad), np.nan,
+                    dtype=np.float32)
+    tiles[:, :, :height, :width] = filters
+    # (rows, h, cols, w) puts the tiles side by side
+    mosaic = tiles.transpose(0, 2, 1, 3).reshape(rows*(height + pad),
+                                                 cols*(width + pad))
+    return mosaic[:-pad, :-pad] if pad else mosaic
+
+class KernelMosaic(FigureMixin):
+
+    def __init__(self, kernel, name='Conv2D kernel', mode='channels', pad=1,
+                 normalize=True):
+        """ Class for the kernel of a Conv2D layer, drawn as
+            one heatmap of all its filters.
+
+            Parameters
+            ----------
+            kernel: np.ndarray
+                Kernel of shape (height, width, input
+                channels, filters), e.g. from
+                keras_loader.iterConvKernels().
+            name: string
+                Title of plot.
+            mode, pad, normalize:
+                See kernel_mosaic().
+        """
+        self.name = name
+        self.shape = tuple(np.shape(kernel))
+        self.mode = mode
+        self.mosaic = kernel_mosaic(kernel, mode=mode, pad=pad,
+                                    normalize=normalize)
+
+    def to_figure(self):
+        """ Get the figure of the mosaic, with one heatmap
+            trace. """
+        height, width, n_channels, n_filters = self.shape
+        if self.mode == 'channels':
+            subtitle = 'rows: ' + str(n_filters) + ' filters, columns: ' + \
+                str(n_channels) + ' input channels'
+        else:
+            subtitle = str(n_filters) + ' filters, mean over ' + \
+                str(n_channels) + ' input channels'
+
+        return dict(
+            data=[dict(type='heatmap', z=self.mosaic,
+                       colorscale=COLORSCALE, zmin=-1, zmax=1, zmid=0,
+                       hoverongaps=False)],
+            layout={'title': self.name + '<br>' + subtitle,
+                    'xaxis': {'showgrid': False, 'zeroline': False,
+                              'showticklabels': False},
+                    'yaxis': {'showgrid': False, 'zeroline': False,
+                              'showticklabels': False,
+                              'autorange': 'reversed',
+                              'scaleanchor': 'x'},
+                    'plot_bgcolor': 'white'})
+
+    def plot(self):
+        """ Plot the mosaic. """
+        from plotly.offline import plot
+        plot(self.to_figure())
@@ -0,0 +1,340 @@
+#!/usr/bin/env python
+""" Headless static images of the figures with matplotlib.
+
+The figures of the models (dicts of Plotly traces and layout)
+are drawn on an Agg canvas, without pyplot, a browser or
+JavaScript: all the line segments go into one LineCollection
+and all the filled polygons and rects into one
+PolyCollection, so the cost does not grow with the no. of
+Plotly traces or shapes.
+"""
+
+import base64
+import io
+import re
+
+import numpy as np
+
+from .instrument import stage
+
+# Output formats
+FORMATS = ('png', 'svg', 'pdf')
+
+# Plotly default font size, in pixels
+FONT_SIZE = 12
+
+# Plotly marker symbols and their matplotlib markers
+MARKERS = {'circle': 'o', 'square': 's', 'diamond': 'D',
+           'triangle-up': '^', 'triangle-down': 'v', 'cross': 'P',
+           'x': 'X'}
+
+# Plotly colorscales and the matplotlib colormaps with the
+# same colors (plotly.js draws RdBu from blue to red)
+COLORMAPS = {'RdBu': 'RdBu_r', 'Viridis': 'viridis', 'Greys': 'Greys',
+             'Blues': 'Blues', 'Reds': 'Reds', 'Cividis': 'cividis'}
+
+_RGB = re.compile(r'rgba?\(([^)]*)\)')
+
+def to_rgba(color, opacity=1.0):
+    """ Convert a Plotly color to an RGBA tuple.
+
+        Parameters
+        ----------
+        color: string
+            Named, hex, 'rgb(r, g, b)' or 'rgba(r, g, b, a)'.
+        opacity: float
+            Multiplies the alpha of the color.
+    """
+    from matplotlib.colors import to_rgba as mpl_to_rgba
+
+    match = _RGB.match(color.replace(' ', ''))
+    if match is None:
+        r, g, b, a = mpl_to_rgba(color)
+    else:
+        values = [float(v) for v in match.group(1).split(',')]
+        r, g, b = (v/255 for v in values[:3])
+        a = values[3] if len(values) > 3 else 1.0
+    return (r, g, b, a*opacity)
+
+def _array(values):
+    """ Coordinates as a float array, decoding typed
+        arrays (see encoding.py) and None. """
+    if isinstance(values, dict):
+        values = np.frombuffer(base64.b64decode(values['bdata']),
+                               dtype=values['dtype'])
+    elif not isinstance(values, np.ndarray):
+        values = [np.nan if v is None else v for v in values]
+    return np.asarray(values, dtype=float)
+
+def split_polylines(x, y):
+    """ Split NaN-separated coordinates into polylines.
+
+        Returns
+        -------
+        polylines: list of np.ndarray
+            (n, 2) vertices of each polyline with at least
+            two vertices.
+    """
+    points = np.column_stack([x, y])
+    gaps = np.flatnonzero(np.isnan(x) | np.isnan(y))
+    if not len(gaps):
+        return [points] if len(points) > 1 else []
+
+    # Edges are drawn as (start, end, gap) triples
+    if len(x) % 3 == 0 and np.array_equal(gaps, np.arange(2, len(x), 3)):
+        return list(points.reshape(-1, 3, 2)[:, :2])
+
+    polylines = list()
+    for part in np.split(points, gaps):
+        part = part[~np.isnan(part).any(axis=1)]
+        if len(part) > 1:
+            polylines.append(part)
+    return polylines
+
+class ImageBuilder:
+
+    def __init__(self, width=800, height=600, dpi=100):
+        """ Collects the lines, polygons, markers and texts
+            of a figure, then draws them with one artist
+            each (texts excepted).
+
+            Parameters
+            ----------
+            width, height: int
+                Size of the image in pixels.
+            dpi: int
+                Pixels per inch; Plotly sizes are in
+                pixels, matplotlib sizes in points.
+        """
+        self.width = width
+        self.height = height
+        self.dpi = dpi
+        self.px = 72/dpi
+
+        self.segments = list()
+        self.segment_colors = list()
+        self.segment_widths = list()
+        self.polygons = list()
+        self.face_colors = list()
+        self.edge_colors = list()
+        self.edge_widths = list()
+        self.markers = list()
+        self.texts = list()
+        self.images = list()
+
+    def add_lines(self, polylines, color, width, opacity=1.0):
+        rgba = to_rgba(color, opacity)
+        self.segments += polylines
+        self.segment_colors += [rgba]*len(polylines)
+        self.segment_widths += [width*self.px]*len(polylines)
+
+    def add_polygons(self, polygons, fillcolor, color, width, opacity=1.0):
+        self.polygons += polygons
+        self.face_colors += [to_rgba(fillcolor, opacity)]*len(polygons)
+        edge = to_rgba(color, opacity) if width else (0, 0, 0, 0)
+        self.edge_colors += [edge]*len(polygons)
+        self.edge_widths += [width*self.px]*len(polygons)
+
+    def add_heatmap(self, trace):
+        """ Add a heatmap trace, with its cells on the 
+            default integer grid. """
+        z = np.asarray(trace['z'], dtype=float)
+        colorscale = trace.get('colorscale', 'Viridis')
+        self.images.append(dict(
+            z=z, cmap=COLORMAPS.get(colorscale, 'viridis'),
+            vmin=trace.get('zmin'), vmax=trace.get('zmax'),
+            extent=(-0.5, z.shape[1] - 0.5, -0.5, z.shape[0] - 0.5)))
+
+    def add_trace(self, trace):
+        """ Add a scatter or heatmap trace of a figure. """
+        if trace.get('type') == 'heatmap':
+            self.add_heatmap(trace)
+            return
+        if 'x' not in trace or 'y' not in trace:
+            return
+        x, y = _array(trace['x']), _array(trace['y'])
+        mode = trace.get('mode', 'lines')
+        opacity = trace.get('opacity', 1.0)
+        line = trace.get('line') or dict()
+        color = line.get('color', 'blue')
+        width = line.get('width', 2)
+
+        if trace.get('fill') == 'toself':
+            self.add_polygons(split_polylines(x, y),
+                              trace.get('fillcolor', color), color, width,
+                              opacity)
+        elif 'lines' in mode and width:
+            self.add_lines(split_polylines(x, y), color, width, opacity)
+
+        if 'markers' in mode:
+            marker = trace.get('marker') or dict()
+            colors = marker.get('color', 'blue')
+            cmap = vmin = vmax = None
+            if isinstance(colors, str):
+                colors = [to_rgba(colors, opacity)]*len(x)
+            elif isinstance(colors, dict) or np.ndim(colors) == 1 and \
+                    not any(isinstance(c, str) for c in colors):
+                # Values on a colorscale, as in add_heatmap()
+                colors = _array(colors)
+                colorscale = marker.get('colorscale', 'Viridis')
+                cmap = COLORMAPS.get(colorscale, 'viridis')
+                vmin, vmax = marker.get('cmin'), marker.get('cmax')
+            else:
+                colors = [to_rgba(c, opacity) if isinstance(c, str) else c
+                          for c in colors]
+            self.markers.append(dict(
+                x=x, y=y, c=colors, cmap=cmap, vmin=vmin, vmax=vmax,
+                alpha=opacity if cmap is not None else None,
+                s=(marker.get('size', 6)*self.px)**2,
+                marker=MARKERS.get(marker.get('symbol', 'circle'), 'o')))
+
+        if 'text' in mode:
+            textfont = trace.get('textfont') or dict()
+            position = trace.get('textposition', 'middle center')
+            texts = trace.get('text') or []
+            if isinstance(texts, str):
+                texts = [texts]*len(x)
+            for xi, yi, text in zip(x, y, texts):
+                self.texts.append((xi, yi, str(text), position,
+                                   textfont.get('color', 'black'),
+                                   textfont.get('size', FONT_SIZE), None))
+
+    def add_shape(self, shape):
+        """ Add a rect or line layout shape. """
+        line = shape.get('line') or dict()
+        color = line.get('color', 'black')
+        width = line.get('width', 2)
+        x0, y0, x1, y1 = (float(shape[key]) for key in ('x0', 'y0',
+                                                         'x1', 'y1'))
+        if shape.get('type') == 'rect':
+            polygon = np.array([[x0, y0], [x1, y0], [x1, y1], [x0, y1]])
+            self.add_polygons([polygon], shape.get('fillcolor',
+                                                   'rgba(0, 0, 0, 0)'),
+                              color, width, shape.get('opacity', 1.0))
+        elif shape.get('type') == 'line':
+            self.add_lines([np.array([[x0, y0], [x1, y1]])], color, width,
+                           shape.get('opacity', 1.0))
+
+    def add_annotation(self, annotation):
+        font = annotation.get('font') or dict()
+        self.texts.append((annotation['x'], annotation['y'],
+                           str(annotation.get('text', '')),
+                           'top center' if annotation.get('yanchor') ==
+                           'bottom' else 'middle center',
+                           font.get('color', 'black'),
+                           font.get('size', FONT_SIZE),
+                           annotation.get('bgcolor')))
+
+    def draw(self, ax):
+        """ Draw everything on a matplotlib axes. """
+        from matplotlib.collections import LineCollection, PolyCollection
+
+        for image in self.images:
+            # NaN cells are left blank
+            ax.imshow(image['z'], cmap=image['cmap'], vmin=image['vmin'],
+                      vmax=image['vmax'], extent=image['extent'],
+                      origin='lower', interpolation='nearest', zorder=0)
+        if self.polygons:
+            ax.add_collection(PolyCollection(
+                self.polygons, facecolors=self.face_colors,
+                edgecolors=self.edge_colors, linewidths=self.edge_widths,
+                zorder=1))
+        if self.segments:
+            ax.add_collection(LineCollection(
+                self.segments, colors=self.segment_colors,
+                linewidths=self.segment_widths, zorder=2))
+        for marker in self.markers:
+            ax.scatter(marker['x'], marker['y'], c=marker['c'],
+                       cmap=marker['cmap'], vmin=marker['vmin'],
+                       vmax=marker['vmax'], alpha=marker['alpha'],
+                       s=marker['s'], marker=marker['marker'],
+                       linewidths=0, zorder=3)
+        for x, y, text, position, color, size, bgcolor in self.texts:
+            vertical, _, horizontal = position.partition(' ')
+            kwargs = dict()
+            if bgcolor is not None:
+                kwargs['bbox'] = dict(facecolor=to_rgba(bgcolor),
+                                      edgecolor='none', pad=1)
+            ax.text(x, y, text.replace('<br>', '\n'),
+                    color=to_rgba(color) if isinstance(color, str)
+                    else color,
+                    fontsize=size*self.px,
+                    # Plotly positions the text, matplotlib anchors it
+                    ha={'left': 'right', 'right': 'left'}.get(horizontal,
+                                                              'center'),
+                    va={'top': 'bottom', 'bottom': 'top'}.get(vertical,
+                                                              'center'),
+                    zorder=4, clip_on=True, **kwargs)
+
+def figure_to_image(figure, format='png', fp=None, width=800, height=600,
+                    dpi=100):
+    """ Draw a figure to a static image with matplotlib's
+        Agg (or SVG/PDF) canvas, without pyplot, a browser
+        or JavaScript.
+
+        Parameters
+        ----------
+        figure: dict
+            The figure, with data and layout.
+        format: string
+            'png', 'svg' or 'pdf'.
+        fp: string, file-like object or None
+            Where to write the image. By default the image
+            is returned as bytes.
+        width, height: int
+            Size of the image in pixels.
+        dpi: int
+            Resolution of the image.
+    """
+    from matplotlib.figure import Figure
+
+    if format not in FORMATS:
+        raise ValueError('Unknown format ' + repr(format) +
+                         ', expected one of ' + ', '.join(FORMATS))
+
+    builder = ImageBuilder(width=width, height=height, dpi=dpi)
+    layout = figure.get('layout') or dict()
+    with stage('mpl_backend.collect', traces=len(figure['data'])) as record:
+        for trace in figure['data']:
+            builder.add_trace(trace)
+        for shape in layout.get('shapes') or ():
+            builder.add_shape(shape)
+        for annotation in layout.get('annotations') or ():
+            builder.add_annotation(annotation)
+        record['segments'] = len(builder.segments)
+        record['polygons'] = len(builder.polygons)
+
+    fig = Figure(figsize=(width/dpi, height/dpi), dpi=dpi)
+    title = layout.get('title')
+    if isinstance(title, dict):
+        title = title.get('text')
+    if title:
+        fig.suptitle(title.replace('<br>', '\n'),
+                     fontsize=1.4*FONT_SIZE*builder.px)
+    ax = fig.add_axes([0.02, 0.02, 0.96, 0.88 if title else 0.96])
+    builder.draw(ax)
+
+    xaxis = layout.get('xaxis') or dict()
+    yaxis = layout.get('yaxis') or dict()
+    if xaxis.get('range') is not None:
+        ax.set_xlim(xaxis['range'])
+    else:
+        ax.autoscale_view()
+    if yaxis.get('range') is not None:
+        ax.set_ylim(yaxis['range'])
+    else:
+        ax.autoscale_view()
+    if yaxis.get('autorange') == 'reversed':
+        ax.invert_yaxis()
+    if yaxis.get('scaleanchor') == 'x':
+        ax.set_aspect('equal')
+    if not xaxis.get('showticklabels', True) and \
+            not yaxis.get('showticklabels', True):
+        ax.set_axis_off()
+
+    with stage('mpl_backend.render', format=format):
+        if fp is None:
+            buffer = io.BytesIO()
+            fig.savefig(buffer, format=format, dpi=dpi)
+            return buffer.getvalue()
+        fig.savefig(fp, format=format, dpi=dpi)
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+""" Loader for PyTorch modules.
+
+The output shape of each layer is found by tracing the module
+with forward hooks on tensors of the 'meta' device, which have
+a shape but no storage: the parameters and buffers are swapped
+for meta copies with torch.func.functional_call(), so the module
+itself is left untouched and no weights or activations are
+allocated. Modules that cannot run on the meta device are traced
+with an empty batch instead.
+
+The result is the same layer list as
+keras_loader.loadFromKerasModel(), built with
+keras_loader.layersToVnn().
+"""
+
+from .keras_loader import layersToVnn
+from .instrument import stage
+
+# Layers drawn as a block of a ConvNet2D
+CONV_LAYERS = ('Conv2d', 'MaxPool2d', 'AvgPool2d', 'AdaptiveMaxPool2d',
+               'AdaptiveAvgPool2d', 'LPPool2d')
+
+def _functionalCall(module, tensors, inputs):
+    """ Call a module with its parameters and buffers
+        replaced by tensors, without modifying it. """
+    try:
+        from torch.func import functional_call
+    except ImportError:
+        # torch < 2.0
+        from torch.nn.utils.stateless import functional_call
+    return functional_call(module, tensors, inputs)
+
+def _outputShape(output):
+    """ Shape of an output without the batch axis, or None
+        if it is not a tensor (or a sequence starting with
+        one). """
+    import torch
+
+    if isinstance(output, (tuple, list)) and output:
+        output = output[0]
+    if not isinstance(output, torch.Tensor):
+        return None
+    return tuple(output.shape[1:])
+
+def _run(module, inputShape, meta):
+    """ Run a module on an input of zeros, recording the
+        output shape of each leaf module in order. On the
+        meta device, the module runs on meta copies of its
+        parameters and buffers, with a batch of two (one
+        is refused by BatchNorm in training). Otherwise it
+        runs as is on an empty batch. """
+    import torch
+
+    tensors = dict()
+    if meta:
+        for name, tensor in list(module.named_parameters()) + \
+                list(module.named_buffers()):
+            tensors[name] = torch.empty_like(tensor, device='meta')
+        device, batchSize = 'meta', 2
+    else:
+        device = next((t.device for t in module.parameters()), 'cpu')
+        batchSize = 0
+    dtype = next((t.dtype for t in module.parameters()
+                  if t.is_floating_point()), torch.get_default_dtype())
+
+    shapes = list()
+    def hook(layer, inputs, output):
+        shapes.append((layer, _outputShape(output)))
+
+    handles = [layer.register_forward_hook(hook)
+               for layer in module.modules()
+               if not any(True for _ in layer.children())]
+    try:
+        inputs = (torch.zeros((batchSize,) + tuple(inputShape), dtype=dtype,
+                              device=device),)
+        with torch.no_grad():
+            if meta:
+                _functionalCall(module, tensors, inputs)
+            else:
+                module(*inputs)
+    finally:
+        for handle in handles:
+            handle.remove()
+    return shapes
+
+def traceShapes(module, inputShape):
+    """ Get the output shape of every leaf module of a
+        module, in the order in which they run.
+
+        Parameters
+        ----------
+        module: torch.nn.Module
+            The module, on any device.
+        inputShape: tuple
+            Shape of one input, without the batch axis,
+            e.g. (784,) or (3, 224, 224).
+
+        Returns
+        -------
+        shapes: list
+            (module, shape) pairs, shapes without the batch
+            axis, or None for outputs that are not tensors.
+    """
+    with stage('torch_loader.trace', modules=sum(1 for _ in
+                                                 module.modules())):
+        try:
+            return _run(module, inputShape, True)
+        except (NotImplementedError, RuntimeError):
+            # Ops without a meta kernel, or control flow
+            # reading the values of the tensors
+            return _run(module, inputShape, False)
+
+def _channelsLast(shape):
+    """ Convert a (C, H, W) shape to the (H, W, C) of the
+        ConvNet2D layers. """
+    c, h, w = shape
+    return (h, w, c)
+
+def loadFromTorchModule(module, inputShape):
+    """ Get the same layer list as
+        keras_loader.loadFromKerasModel() for a PyTorch
+        module, from the output shapes of its Linear,
+        Conv2d, pooling and Flatten layers.
+
+        Parameters
+        ----------
+        module: torch.nn.Module
+            The module.
+        inputShape: tuple
+            Shape of one input, without the batch axis.
+            (C, H, W) for images.
+    """
+    inputShape = tuple(inputShape)
+    layers = []
+    if len(inputShape) == 1:
+        allDense = 1
+        layers.append(['Dense', inputShape])
+    else:
+        allDense = 0
+        layers.append(['Conv2D', _channelsLast(inputShape)])
+
+    for layer, shape in traceShapes(module, inputShape):
+        layerClass = layer.__class__.__name__
+        if shape is None:
+            continue
+        if layerClass == 'Linear':
+            layers.append(['Dense', shape[-1:]])
+        elif layerClass == 'Flatten':
+            units = 1
+            for size in shape:
+                units *= size
+            layers.append(['Dense', (units,)])
+        elif layerClass in CONV_LAYERS and len(shape) == 3:
+            layers.append(['Conv2D', _channelsLast(shape)])
+        else:
+            continue
+
+        if layerClass != 'Linear':
+            allDense = 0
+    return layers, allDense
+
+def torchToVnn(module, inputShape, fold=False):
+    """ Build the visual model of a PyTorch module. See
+        loadFromTorchModule() for the parameters and
+        keras_loader.layersToVnn() for fold. """
+    return layersToVnn(*loadFromTorchModule(module, inputShape), fold=fold)
@@ -0,0 +1,383 @@
+#!/usr/bin/env python
+""" Viewport queries and a local tile server for huge MLPs.
+
+A ViewportIndex keeps, for each layer, its x-coordinate and the
+sorted y-coordinates of its neurons. The layers are the columns
+of a grid: a viewport only overlaps the layer pairs whose
+columns it crosses, and since the y of an edge at any x grows
+with the y of its end, the visible edges out of each neuron are
+one contiguous run of the next layer, found by binary search.
+A query costs O(visible neurons * log(width)) plus its output,
+whatever the size of the network.
+
+When more edges are visible than a budget, the neurons of each
+layer are binned along y and every pair of bins is drawn as one
+bundle whose width grows with its no. of edges, so the response
+is bounded at any zoom level.
+
+    index = model.get_viewport_index()
+    viewport.serve(index, port=8050)
+
+serves a page that loads only the visible primitives and asks
+for new ones on each zoom or pan.
+"""
+
+import json
+
+import numpy as np
+
+from .backend import get_plotlyjs, iter_json, set_backend
+from .fc import get_band_trace, get_edges, get_trace
+from .instrument import stage
+
+# Edge widths of the bundles, from the fewest edges to the most
+BUNDLE_WIDTHS = (0.5, 1, 2, 4)
+
+def _slice_trace(trace, rows, size):
+    """ Get a copy of a trace with only some of its points:
+        every attribute with one value per point, nested
+        ones such as marker.color included, is sliced. """
+    sliced = dict()
+    for key, value in trace.items():
+        if isinstance(value, dict):
+            value = _slice_trace(value, rows, size)
+        elif key == 'colorscale':
+            pass
+        elif isinstance(value, np.ndarray) and len(value) == size:
+            value = value[rows]
+        elif isinstance(value, (list, tuple)) and len(value) == size:
+            value = [value[k] for k in rows]
+        sliced[key] = value
+
+    return sliced
+
+class ViewportIndex:
+
+    def __init__(self, layers, layout, max_edges=20000,
+                 max_visible_neurons=5000, bins=32, color='blue',
+                 backend='webgl'):
+        """ Index of the neurons and edges of an MLP, for
+            queries by viewport.
+
+            Parameters
+            ----------
+            layers: list of fc.Dense
+                Layers of the MLP.
+            layout: dict
+                Layout of the full figure.
+            max_edges: int
+                Most edges returned one by one. Beyond that
+                the edges are bundled.
+            max_visible_neurons: int
+                Most neurons returned one by one. Beyond that
+                they are binned too.
+            bins: int
+                No. of bins per layer across the viewport,
+                at low zoom.
+            color: string (Plotly color)
+                Color of the edges.
+            backend: string
+                'svg' or 'webgl'.
+        """
+        self.layers = layers
+        self.layout = layout
+        self.max_edges = max_edges
+        self.max_visible_neurons = max_visible_neurons
+        self.bins = bins
+        self.color = color
+        self.backend = backend
+
+        self.x = np.array([layer.x_coord for layer in layers], dtype=float)
+        self.y = [np.asarray(layer.y_list, dtype=float) for layer in layers]
+        # Bands of aggregated layers are few, keep them ready
+        self.bands = [get_band_trace(layers[i], layers[i + 1], color=color)
+                      for i in range(len(layers) - 1)]
+
+    def full_range(self):
+        """ Get the (x0, x1, y0, y1) range of the figure. """
+        return tuple(self.layout['xaxis']['range']) + \
+            tuple(self.layout['yaxis']['range'])
+
+    def _visible_runs(self, i, x0, x1, y0, y1):
+        """ Get the visible edges between layers i and i + 1
+            as runs of the next layer.
+
+            Returns
+            -------
+            src: np.ndarray
+                Neurons of layer i with visible edges.
+            lo, hi: np.ndarray
+                The edges of src[k] are visible for the
+                neurons lo[k]:hi[k] of layer i + 1.
+        """
+        xa, xb = self.x[i], self.x[i + 1]
+        y_src, y_dst = self.y[i], self.y[i + 1]
+
+        # Part of the pair inside the viewport, as fractions
+        # of the way from layer i to layer i + 1
+        ta = (max(x0, xa) - xa)/(xb - xa)
+        tb = (min(x1, xb) - xa)/(xb - xa)
+
+        def bound(t, y_edge, inf):
+            # y of the end for which y = y_edge at t
+            if t == 0:
+                return np.where(y_src >= y_edge if inf < 0
+                                else y_src <= y_edge, inf, -inf)
+            return y_src + (y_edge - y_src)/t
+
+        # Above the bottom of the viewport at ta or tb, and
+        # below its top at ta or tb
+        lower = np.minimum(bound(ta, y0, -np.inf), bound(tb, y0, -np.inf))
+        upper = np.maximum(bound(ta, y1, np.inf), bound(tb, y1, np.inf))
+        lo = np.searchsorted(y_dst, lower, side='left')
+        hi = np.searchsorted(y_dst, upper, side='right')
+
+        src = np.flatnonzero(hi > lo)
+        return src, lo[src], hi[src]
+
+    def _edge_trace(self, i, src, lo, hi):
+        """ Trace of the edges given as runs. """
+        counts = hi - lo
+        src = np.repeat(src, counts)
+        # Concatenation of the ranges lo[k]:hi[k]
+        starts = np.repeat(lo - np.concatenate([[0], np.cumsum(counts)[:-1]]),
+                           counts)
+        dst = starts + np.arange(counts.sum())
+        x, y = get_edges(self.layers[i], self.layers[i + 1], src, dst)
+        return get_trace(x, y, color=self.color, width=1)
+
+    def _bin_edges(self, y0, y1):
+        return np.linspace(y0, y1, self.bins + 1)
+
+    def _bundle_traces(self, i, src, lo, hi, y0, y1):
+        """ Traces of the edges bundled by pairs of bins. """
+        edges = self._bin_edges(y0, y1)
+        y_src, y_dst = self.y[i], self.y[i + 1]
+
+        # Bin of each source, and first neuron of each bin
+        # of the next layer
+        src_bins = np.clip(np.searchsorted(edges, y_src[src], side='right')
+                           - 1, 0, self.bins - 1)
+        starts = np.searchsorted(y_dst, edges)
+        starts[0], starts[-1] = 0, len(y_dst)
+
+        # Edges from each source into each bin
+        overlap = np.minimum(hi[:, np.newaxis], starts[np.newaxis, 1:]) - \
+            np.maximum(lo[:, np.newaxis], starts[np.newaxis, :-1])
+        overlap = np.maximum(overlap, 0)
+        counts = np.zeros((self.bins, self.bins), dtype=np.int64)
+        np.add.at(counts, src_bins, overlap)
+
+        b_src, b_dst = np.nonzero(counts)
+        n = counts[b_src, b_dst]
+        if not len(n):
+            return list()
+        centers = (edges[:-1] + edges[1:])/2
+        levels = np.minimum((np.log(n)/np.log(n.max() + 1) *
+                             len(BUNDLE_WIDTHS)).astype(int),
+                            len(BUNDLE_WIDTHS) - 1)
+
+        data = list()
+        for level, width in enumerate(BUNDLE_WIDTHS):
+            mask = levels == level
+            if not mask.any():
+                continue
+            k = mask.sum()
+            x = np.empty((k, 3))
+            x[:, 0], x[:, 1], x[:, 2] = self.x[i], self.x[i + 1], np.nan
+            y = np.empty((k, 3))
+            y[:, 0] = centers[b_src[mask]]
+            y[:, 1] = centers[b_dst[mask]]
+            y[:, 2] = np.nan
+            trace = get_trace(x.ravel(), y.ravel(), color=self.color,
+                              width=width)[0]
+            trace['opacity'] = 0.6
+            trace['hoverinfo'] = 'text'
+            trace['text'] = np.repeat(
+                np.char.add(n[mask].astype(str), ' edges'), 3)
+            data.append(trace)
+        return data
+
+    def _neuron_traces(self, visible, y0, y1):
+        """ Traces of the visible neurons, binned if there
+            are too many. """
+        total = sum(len(rows) for _, rows in visible)
+        data = list()
+        if total <= self.max_visible_neurons:
+            for i, rows in visible:
+                layer = self.layers[i]
+                data += [_slice_trace(trace, rows, len(self.y[i]))
+                         for trace in layer.data[:2]]
+                # Group glyph of an aggregated layer
+                if layer.group_y is not None and y0 <= layer.group_y <= y1:
+                    data += layer.data[2:]
+            return data
+
+        edges = self._bin_edges(y0, y1)
+        centers = (edges[:-1] + edges[1:])/2
+        x, y, text = list(), list(), list()
+        for i, rows in visible:
+            counts = np.histogram(self.y[i][rows], bins=edges)[0]
+            nonzero = np.flatnonzero(counts)
+            x += [self.x[i]]*len(nonzero)
+            y += list(centers[nonzero])
+            text += [str(count) + ' neurons' for count in counts[nonzero]]
+        data.append(dict(x=x, y=y, mode='markers',
+                         marker=dict(color=self.layers[0].n_color, size=12,
+                                     symbol='square'),
+                         hoverinfo='text', text=text))
+        return data
+
+    def query(self, x0, x1, y0, y1):
+        """ Get the primitives visible in a viewport.
+
+            Parameters
+            ----------
+            x0, x1, y0, y1: float
+                Range of the viewport.
+
+            Returns
+            -------
+            data: list of dicts
+                Traces of the visible edges, or of their
+                bundles, then of the neurons.
+            aggregated: bool
+                Whether the edges were bundled.
+        """
+        with stage('viewport.query') as record:
+            # Layers and pairs of layers under the viewport
+            columns = np.flatnonzero((self.x >= x0) & (self.x <= x1))
+            pairs = [i for i in range(len(self.layers) - 1)
+                     if self.x[i] < x1 and self.x[i + 1] > x0]
+
+            runs = [(i,) + self._visible_runs(i, x0, x1, y0, y1)
+                    for i in pairs]
+            n_edges = sum(int((hi - lo).sum()) for _, _, lo, hi in runs)
+            aggregated = n_edges > self.max_edges
+
+            data = list()
+            for i, src, lo, hi in runs:
+                if not len(src):
+                    continue
+                if aggregated:
+                    data += self._bundle_traces(i, src, lo, hi, y0, y1)
+                else:
+                    data += self._edge_trace(i, src, lo, hi)
+                data += self.bands[i]
+
+            visible = [(i, np.flatnonzero((self.y[i] >= y0) &
+                                          (self.y[i] <= y1)))
+                       for i in columns]
+            data += self._neuron_traces(visible, y0, y1)
+            data = set_backend(data, self.backend)
+
+            record['edges'] = n_edges
+            record['traces'] = len(data)
+        return data, aggregated
+
+    def query_json(self, x0, x1, y0, y1):
+        """ Get the answer of query() as a JSON figure,
+            with aggregated in the meta of its layout. """
+        data, aggregated = self.query(x0, x1, y0, y1)
+        return ''.join(iter_json(data, dict(meta=dict(aggregated=aggregated))))
+
+PAGE = '''<html>
+<head><meta charset="utf-8" /><script src="plotly.min.js"></script></head>
+<body>
+<div id="visualnn" style="height:100%; width:100%;"></div>
+<script type="text/javascript">
+var div = document.getElementById("visualnn");
+var latest = 0;
+function load() {
+    var x = div.layout.xaxis.range, y = div.layout.yaxis.range;
+    var request = ++latest;
+    fetch("view?x0=" + x[0] + "&x1=" + x[1] + "&y0=" + y[0] + "&y1=" + y[1])
+        .then(function(response) { return response.json(); })
+        .then(function(figure) {
+            // Drop the answers to older viewports
+            if (request === latest) {
+                Plotly.react(div, figure.data, div.layout);
+            }
+        });
+}
+Plotly.newPlot(div, [], LAYOUT, {"responsive": true}).then(function() {
+    load();
+    div.on("plotly_relayout", load);
+});
+</script>
+</body>
+</html>
+'''
+
+def make_server(index, host='127.0.0.1', port=8050):
+    """ Make an HTTP server for the viewport queries of an
+        index. It serves the page at /, plotly.js at
+        /plotly.min.js and the traces visible in a
+        viewport at /view?x0=&x1=&y0=&y1=. Call its
+        serve_forever() method, in a thread to keep a
+        notebook usable.
+
+        Parameters
+        ----------
+        index: ViewportIndex
+            The index.
+        host: string
+            Address to listen on, local only by default.
+        port: int
+            Port to listen on.
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import parse_qs, urlparse
+
+    from plotly.utils import PlotlyJSONEncoder
+
+    layout = dict(index.layout, uirevision='viewport')
+    page = PAGE.replace('LAYOUT', json.dumps(layout, cls=PlotlyJSONEncoder))
+    page = page.encode('utf-8')
+    bundle = list()
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def _send(self, body, content_type):
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == '/':
+                self._send(page, 'text/html; charset=utf-8')
+            elif url.path == '/plotly.min.js':
+                if not bundle:
+                    bundle.append(get_plotlyjs().encode('utf-8'))
+                self._send(bundle[0], 'application/javascript')
+            elif url.path == '/view':
+                query = parse_qs(url.query)
+                try:
+                    viewport = [float(query[key][0])
+                                for key in ('x0', 'x1', 'y0', 'y1')]
+                except (KeyError, ValueError):
+                    viewport = index.full_range()
+                self._send(index.query_json(*viewport).encode('utf-8'),
+                           'application/json')
+            else:
+                self.send_error(404)
+
+        def log_message(self, format, *args):
+            pass
+
+    return ThreadingHTTPServer((host, port), Handler)
+
+def serve(index, host='127.0.0.1', port=8050):
+    """ Serve the viewport queries of an index until
+        interrupted. See make_server(). """
+    server = make_server(index, host=host, port=port)
+    print('Serving on http://' + host + ':' + str(server.server_port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()